@@ -1,31 +1,430 @@
-from fastapi import APIRouter, Query
+import asyncio
+import datetime
+import hashlib
+import time
+from dataclasses import asdict, dataclass
+from typing import AsyncIterator, Literal
 
+import aiohttp
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import Response, StreamingResponse
+from pydantic import parse_obj_as
+
+from core.compression import negotiate
+from core.config import settings
+from core.metrics import registry
+from services.posts.batch import fetch_batch
+from services.posts.jobs import DONE, get_job_manager
+from services.posts.normalization import (
+    POST_FIELDS,
+    PostData,
+    SnapshotData,
+    as_json,
+    slim_posts,
+)
+from services.posts.post_cache import get_post_cache
 from services.posts.post_fetcher import PostFetcher
+from services.posts.post_index import PostFilters
+from services.posts.prewarm import record_request
+from services.posts.response_cache import CachedBody, ResponseCache
 import schemas
 
 router = APIRouter()
 
+RESPONSES = registry.counter(
+    "posts_responses_total",
+    "Responses of /posts by how they were made (not_modified, cached or built).",
+    ("result",),
+)
+
+# Serialized responses of /posts by their ETags.
+_responses = ResponseCache(settings.POSTS_RESPONSE_CACHE_MAX_BYTES)
+
+
+@dataclass
+class PostsQuery:
+    """Query parameters that define posts to fetch."""
 
-@router.get("", status_code=200, response_model=list[schemas.Post])
-async def get_posts(
     domain: str = Query(
         title="Адрес человека/сообщества",
         description="Адрес человека/cообщества, в форматах вида "
         '"https://vk.com/a_a_burlakov", "vk.com/a_a_burlakov", "a_a_burlakov"',
-    ),
+    )
     amount: int = Query(
         title="Количество постов",
         description="Количество постов для загрузки (если 0, будут загружены все)",
         ge=0,
         default=500,
-    ),
+    )
     sort_by_likes: bool = Query(
         title="Сортировать по лайкам",
         description="Сортировать по лайкам по убыванию "
         "(если False, будет стандартная сортировка по дате)",
         default=True,
-    ),
-) -> list[schemas.Post]:
-    post_fetcher = PostFetcher(domain, amount, sort_by_likes)
+    )
+    trending: Literal["velocity", "age"] | None = Query(
+        title="Набирающие популярность",
+        description='Сортировка вместо "sort_by_likes": "velocity" - по тому, '
+        'сколько лайков в час пост набирает сейчас, "age" - по лайкам в час '
+        "с момента публикации",
+        default=None,
+    )
+    partial: bool = Query(
+        title="Частичный результат",
+        description="Вернуть загруженные посты, даже если часть стены "
+        "загрузить не удалось (пропущенные диапазоны смещений - "
+        'в заголовке "X-Missing-Offsets")',
+        default=False,
+    )
+    since: datetime.datetime | None = Query(
+        title="С даты",
+        description="Только посты, опубликованные не раньше этого момента (без часового пояса - в UTC)",
+        default=None,
+    )
+    until: datetime.datetime | None = Query(
+        title="По дату",
+        description="Только посты, опубликованные не позже этого момента (без часового пояса - в UTC)",
+        default=None,
+    )
+    min_likes: int = Query(
+        title="Минимум лайков",
+        description="Только посты, у которых не меньше лайков",
+        ge=0,
+        default=0,
+    )
+    with_photos: bool = Query(
+        title="С фото",
+        description="Только посты с фотографиями",
+        default=False,
+    )
+    with_videos: bool = Query(
+        title="С видео",
+        description="Только посты с видео",
+        default=False,
+    )
+    per: Literal["day", "week", "month", "year"] | None = Query(
+        title="За период",
+        description='"amount" постов за каждый день/неделю/месяц/год (по UTC), '
+        "начиная с последнего периода",
+        default=None,
+    )
+
+    def filters(self) -> PostFilters | None:
+        """Filters of posts, None if there are none."""
+
+        filters = PostFilters(
+            self.since,
+            self.until,
+            self.min_likes,
+            self.with_photos,
+            self.with_videos,
+            self.per,
+        )
+        return filters if filters != PostFilters() else None
+
+    def post_fetcher(self) -> PostFetcher:
+        """Fetcher of the posts, the request is counted for pre-warming."""
+
+        post_fetcher = PostFetcher(
+            self.domain,
+            self.amount,
+            self.sort_by_likes,
+            allow_partial=self.partial,
+            filters=self.filters(),
+            trending=self.trending,
+        )
+        record_request(post_fetcher.vk_domain)
+        return post_fetcher
+
+
+@dataclass
+class PostsView:
+    """Query parameters that slim posts in the response."""
+
+    fields: str | None = Query(
+        title="Поля",
+        description="Поля постов через запятую, например "
+        '"likes,path,date" (по умолчанию - все)',
+        default=None,
+    )
+    text_length: int | None = Query(
+        title="Длина текста",
+        description="Тексты постов обрезаются до этого количества символов "
+        "(по умолчанию - целиком)",
+        ge=0,
+        default=None,
+    )
+
+    def post_fields(self) -> tuple[str, ...]:
+        """Fields of posts to give, in the order of "schemas.Post"."""
+
+        fields = {field.strip() for field in (self.fields or "").split(",")} - {""}
+        if not fields:
+            return POST_FIELDS
+        if unknown := fields - set(POST_FIELDS):
+            raise HTTPException(
+                status_code=400,
+                detail=f"Неизвестные поля постов: {', '.join(sorted(unknown))}.",
+            )
+        return tuple(field for field in POST_FIELDS if field in fields)
+
+
+@router.get("", status_code=200, response_model=list[schemas.SlimPost])
+async def get_posts(
+    request: Request, query: PostsQuery = Depends(), view: PostsView = Depends()
+) -> Response:
+    """
+    Posts of the domain with an ETag. Fresh posts in cache are identified
+    by their version, so they are answered with 304 (if the client has them)
+    or from memory without being read and serialized again.
+    Posts are given with all fields, unless "fields" are chosen.
+    """
+
+    fields = view.post_fields()
+    post_fetcher = query.post_fetcher()
+    etag, max_age = await _cached_etag(post_fetcher, request)
+    if etag is not None:
+        if _etag_matches(request, etag):
+            RESPONSES.inc(("not_modified",))
+            return Response(status_code=304, headers=_caching_headers(etag, max_age))
+        cached = _responses.get(etag)
+        if cached is not None:
+            RESPONSES.inc(("cached",))
+            return _cached_response(request, etag, max_age, cached)
+
     await post_fetcher.fetch_posts()
-    return post_fetcher.posts
+
+    # Posts are plain dicts: they are slimmed first, then only the given
+    # fields are validated once and rendered as they are, without converting
+    # them to schemas and back.
+    posts = slim_posts(post_fetcher.posts, fields, view.text_length)
+    schema = schemas.Post if posts is post_fetcher.posts else schemas.SlimPost
+    parse_obj_as(list[schema], posts)
+    body = as_json(posts)
+    RESPONSES.inc(("built",))
+
+    if post_fetcher.missing:
+        response = Response(
+            body, media_type="application/json", headers={"Cache-Control": "no-store"}
+        )
+        _set_missing_offsets(response, post_fetcher.missing)
+        return response
+
+    if etag is None:
+        # Cache is refreshed by now, if posts are given by it.
+        etag, max_age = await _cached_etag(post_fetcher, request)
+    if etag is not None:
+        return _cached_response(request, etag, max_age, _responses.put(etag, body))
+
+    # Posts fetched right from VK aren't kept, their ETag is a hash of them.
+    etag = _etag(body)
+    if _etag_matches(request, etag):
+        return Response(
+            status_code=304,
+            headers=_caching_headers(etag, settings.POSTS_CACHE_FRESH_FOR),
+        )
+    return _cached_response(
+        request, etag, settings.POSTS_CACHE_FRESH_FOR, CachedBody(body)
+    )
+
+
+async def _cached_etag(
+    post_fetcher: PostFetcher, request: Request
+) -> tuple[str | None, float]:
+    """
+    ETag of the response made of fresh posts in cache and seconds they stay
+    fresh (None if posts aren't given by cache or they are stale).
+    """
+
+    if not post_fetcher.uses_cache:
+        return None, 0
+    version = await asyncio.to_thread(
+        get_post_cache().get_version, post_fetcher.vk_domain
+    )
+    if version is None:
+        return None, 0
+
+    version, refreshed_at = version
+    fresh_for = refreshed_at + settings.POSTS_CACHE_FRESH_FOR - time.time()
+    if fresh_for <= 0:
+        return None, 0
+    if post_fetcher.trending == "age":
+        # Ranking by age changes with time, not only with posts.
+        version += f"-{refreshed_at}"
+    params = sorted(request.query_params.multi_items())
+    return _etag(repr((post_fetcher.vk_domain, version, params)).encode()), fresh_for
+
+
+def _etag(data: bytes) -> str:
+    return '"' + hashlib.blake2b(data, digest_size=12).hexdigest() + '"'
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match is None:
+        return False
+    return if_none_match.strip() == "*" or etag in (
+        tag.strip().removeprefix("W/") for tag in if_none_match.split(",")
+    )
+
+
+def _caching_headers(etag: str, max_age: float) -> dict[str, str]:
+    return {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={int(max_age)}, "
+        f"stale-while-revalidate={settings.POSTS_STALE_WHILE_REVALIDATE}",
+        "Vary": "Accept-Encoding",
+    }
+
+
+def _cached_response(
+    request: Request, etag: str, max_age: float, cached: CachedBody
+) -> Response:
+    """Response with the body, compressed (once) as the client accepts."""
+
+    headers = _caching_headers(etag, max_age)
+    body = cached.body
+    encoding = negotiate(request.headers.get("Accept-Encoding", ""))
+    if (
+        encoding is not None
+        and settings.COMPRESSION_MIN_BYTES
+        and len(body) >= settings.COMPRESSION_MIN_BYTES
+    ):
+        body = _responses.encoded(etag, cached, encoding)
+        headers["Content-Encoding"] = encoding
+    return Response(body, media_type="application/json", headers=headers)
+
+
+def _set_missing_offsets(response: Response, missing: list[tuple[int, int]]) -> None:
+    if missing:
+        # Ranges of offsets on the wall, e.g. "200-300,700-800".
+        response.headers["X-Missing-Offsets"] = ",".join(
+            f"{offset}-{offset + count}" for offset, count in sorted(missing)
+        )
+
+
+@router.post("/batch", status_code=200, response_model=schemas.PostsBatch)
+async def get_posts_batch(batch: schemas.PostsBatchRequest) -> Response:
+    """
+    Posts of many domains at once and the most liked posts among all of them.
+    Domains that failed are given with errors.
+    """
+
+    posts_batch = await fetch_batch(
+        batch.domains, batch.amount, batch.sort_by_likes, batch.top
+    )
+    for domain_posts in posts_batch["domains"]:
+        record_request(domain_posts["domain"])
+    parse_obj_as(schemas.PostsBatch, posts_batch)
+    return Response(as_json(posts_batch), media_type="application/json")
+
+
+@router.post("/jobs", status_code=202, response_model=schemas.Job)
+async def start_posts_job(query: PostsQuery = Depends()) -> dict:
+    """
+    Starts fetching posts in the background: progress of the job
+    is polled by its id, and posts are taken when it's done.
+    """
+
+    job = await get_job_manager().start(query.post_fetcher())
+    return asdict(job)
+
+
+@router.get("/jobs/{job_id}", status_code=200, response_model=schemas.Job)
+async def get_posts_job(job_id: str) -> dict:
+    job = await get_job_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена.")
+    return asdict(job)
+
+
+@router.get(
+    "/jobs/{job_id}/result", status_code=200, response_model=list[schemas.Post]
+)
+async def get_posts_job_result(job_id: str) -> Response:
+    job_manager = get_job_manager()
+    job = await job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена.")
+    if job.error is not None:
+        raise HTTPException(status_code=job.error_status, detail=job.error)
+    if job.status != DONE:
+        raise HTTPException(status_code=409, detail="Задача еще не завершена.")
+
+    # Posts were validated when the job was done.
+    response = Response(
+        await job_manager.get_result(job_id), media_type="application/json"
+    )
+    _set_missing_offsets(response, job.missing)
+    return response
+
+
+@router.get(
+    "/stream",
+    status_code=200,
+    response_class=StreamingResponse,
+    responses={
+        200: {
+            "description": "Посты по одному в строке (NDJSON) по мере загрузки. "
+            "При сортировке по лайкам - снимки самых популярных постов "
+            "среди загруженных (schemas.PostsSnapshot). Если загрузка "
+            'прервалась ошибкой, последняя строка - {"error": ..., '
+            '"error_status": ...}.',
+            "content": {"application/x-ndjson": {}},
+        }
+    },
+)
+async def stream_posts(query: PostsQuery = Depends()) -> StreamingResponse:
+    if query.filters() is not None or query.trending is not None:
+        raise HTTPException(
+            status_code=400,
+            detail="Фильтры и сортировка по скорости набора лайков "
+            "не поддерживаются в потоке.",
+        )
+
+    post_fetcher = query.post_fetcher()
+    if query.sort_by_likes:
+        lines = _snapshots_as_ndjson(post_fetcher.stream_top_posts())
+    else:
+        lines = _posts_as_ndjson(post_fetcher.stream_posts())
+
+    # The first line is awaited here, so errors (e.g. unknown domain)
+    # are answered with a proper status code before the stream starts.
+    first_line = await anext(lines, b"")
+    return StreamingResponse(
+        _prepend(first_line, lines), media_type="application/x-ndjson"
+    )
+
+
+async def _posts_as_ndjson(
+    portions: AsyncIterator[list[PostData]],
+) -> AsyncIterator[bytes]:
+    async for posts in portions:
+        if posts:
+            yield b"".join(as_json(post) + b"\n" for post in posts)
+
+
+async def _snapshots_as_ndjson(
+    snapshots: AsyncIterator[SnapshotData],
+) -> AsyncIterator[bytes]:
+    async for snapshot in snapshots:
+        yield as_json(snapshot) + b"\n"
+
+
+async def _prepend(first: bytes, rest: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """
+    The first line and the rest of the stream. The status is sent already,
+    so if fetching fails later, the stream ends with a line of the error
+    (a complete stream never ends so).
+    """
+
+    if first:
+        yield first
+    try:
+        async for chunk in rest:
+            yield chunk
+    except HTTPException as exc:
+        yield as_json({"error": exc.detail, "error_status": exc.status_code}) + b"\n"
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        error = "Не удалось загрузить часть постов, повторите запрос позже."
+        yield as_json({"error": error, "error_status": 503}) + b"\n"
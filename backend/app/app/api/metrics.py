@@ -0,0 +1,14 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from core.metrics import registry
+
+router = APIRouter()
+
+
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def metrics() -> PlainTextResponse:
+    """Metrics of the application for Prometheus."""
+    return PlainTextResponse(
+        registry.exposition(), media_type="text/plain; version=0.0.4"
+    )
@@ -0,0 +1,79 @@
+"""
+Load test: latency of small domains while a huge domain is being fetched.
+Compares the old behaviour (a task for every planned portion at once,
+emulated by a worker pool as big as a million) with the bounded worker
+pool and fair scheduling of VK API requests.
+
+Run from "backend/app":
+    $ python -m benchmarks.bench_concurrency
+"""
+
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+
+from benchmarks.vk_stub import VKStub, running_stub
+from core.config import settings
+from services.posts.post_fetcher import PostFetcher
+from services.vkontakte import concurrency
+
+# Only scheduling is measured, so the stub isn't rate limited and nothing is cached.
+settings.VKAPI_REQUESTS_PER_SECOND = 1_000_000
+settings.POSTS_CACHE_PATH = ""
+logging.disable(logging.INFO)
+
+
+async def _measure(huge_posts: int) -> tuple[float, list[float]]:
+    """Returns time of the huge crawl and latencies of small crawls during it."""
+
+    huge_started = time.perf_counter()
+    huge = asyncio.create_task(PostFetcher("huge").fetch_posts())
+
+    latencies = []
+    while not huge.done():
+        started = time.perf_counter()
+        await PostFetcher("small", amount_to_fetch=100).fetch_posts()
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(0.01)
+
+    await huge
+    return time.perf_counter() - huge_started, latencies
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--huge-posts", type=int, default=200_000)
+    parser.add_argument("--latency", type=float, default=0.02)
+    args = parser.parse_args()
+
+    stub = VKStub(latency=args.latency, walls={"huge": args.huge_posts, "small": 300})
+    modes = (
+        ("task per offset", 100, 1_000_000),
+        (
+            "fair worker pool",
+            settings.VKAPI_CONCURRENCY_LIMIT,
+            settings.POSTS_FETCH_CONCURRENCY,
+        ),
+    )
+    with running_stub(stub) as base_url:
+        PostFetcher._url_wall_get = base_url + "wall.get"
+        PostFetcher._url_execute = base_url + "execute"
+
+        for title, global_limit, crawl_limit in modes:
+            concurrency.scheduler.limit = global_limit
+            settings.POSTS_FETCH_CONCURRENCY = crawl_limit
+
+            huge_time, latencies = asyncio.run(_measure(args.huge_posts))
+            latencies.sort()
+            p50 = statistics.median(latencies) * 1000
+            p99 = latencies[int(len(latencies) * 0.99)] * 1000
+            print(
+                f"{title:>17}: huge crawl {huge_time:.2f} s, "
+                f"small crawls ({len(latencies)}) p50 {p50:.0f} ms, p99 {p99:.0f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
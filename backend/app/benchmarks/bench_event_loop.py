@@ -0,0 +1,78 @@
+"""
+Event loop lag while a huge wall is fetched: "/execute" responses decoded
+in event loop against decoding them in the pool of worker processes
+("POSTS_PARSE_WORKERS").
+
+Run from "backend/app":
+    $ python -m benchmarks.bench_event_loop
+"""
+
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+
+from benchmarks.vk_stub import VKStub, running_stub
+from core.config import settings
+from services.posts import parse_pool
+from services.posts.post_fetcher import PostFetcher
+
+# Only parsing is measured, so the stub isn't rate limited and nothing is cached.
+settings.VKAPI_REQUESTS_PER_SECOND = 1_000_000
+settings.POSTS_CACHE_PATH = ""
+logging.disable(logging.INFO)
+
+# How often the probe wants to wake up (seconds).
+_PROBE_INTERVAL = 0.005
+
+
+async def _measure() -> tuple[float, list[float]]:
+    """Returns time of the huge crawl and lags of the probe during it."""
+
+    # Workers are started before measuring.
+    pool = parse_pool.get_parse_pool()
+    if pool is not None:
+        await asyncio.get_running_loop().run_in_executor(pool, sum, [])
+
+    started = time.perf_counter()
+    crawl = asyncio.create_task(PostFetcher("huge").fetch_posts())
+
+    lags = []
+    while not crawl.done():
+        woken = time.perf_counter()
+        await asyncio.sleep(_PROBE_INTERVAL)
+        lags.append(time.perf_counter() - woken - _PROBE_INTERVAL)
+
+    await crawl
+    return time.perf_counter() - started, lags
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--posts", type=int, default=100_000)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    stub = VKStub(walls={"huge": args.posts}, text_length=300, attachments=2)
+    with running_stub(stub) as base_url:
+        PostFetcher._url_wall_get = base_url + "wall.get"
+        PostFetcher._url_execute = base_url + "execute"
+
+        modes = (("event loop", 0), (f"{args.workers} processes", args.workers))
+        for title, workers in modes:
+            settings.POSTS_PARSE_WORKERS = workers
+            crawl_time, lags = asyncio.run(_measure())
+            parse_pool.close_parse_pool()
+
+            lags.sort()
+            p50 = statistics.median(lags) * 1000
+            p99 = lags[int(len(lags) * 0.99)] * 1000
+            print(
+                f"{title:>11}: crawl {crawl_time:.2f} s, event loop lag "
+                f"p50 {p50:.1f} ms, p99 {p99:.1f} ms, max {lags[-1] * 1000:.0f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
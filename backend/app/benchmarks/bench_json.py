@@ -0,0 +1,82 @@
+"""
+Compares JSON libraries on recorded "/execute" payloads (decoding)
+and on the "/posts" response (encoding): the standard library
+against orjson and msgspec, if they are installed.
+
+Posts are taken from a recorded fixture (see "benchmarks.fixtures").
+
+Run from "backend/app":
+    $ python -m benchmarks.bench_json [--fixture wall.json]
+"""
+
+import argparse
+import importlib
+import json
+from typing import Any, Callable
+
+from benchmarks.fixtures import load_posts, measure
+from benchmarks.vk_stub import as_columns
+from services.posts.normalization import normalize_posts
+from services.vkontakte import json_codec
+
+
+def _libraries() -> dict[str, tuple[Callable[[bytes], Any], Callable[[Any], bytes]]]:
+    libraries = {
+        "json": (
+            json.loads,
+            lambda value: json.dumps(value, default=json_codec._default).encode(),
+        )
+    }
+    for name in ("orjson", "msgspec"):
+        try:
+            library = importlib.import_module(name)
+        except ImportError:
+            print(f"{name} is not installed")
+            continue
+        if name == "orjson":
+            libraries[name] = (library.loads, library.dumps)
+        else:
+            libraries[name] = (library.json.decode, library.json.encode)
+    return libraries
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--fixture", help="JSON file with recorded posts")
+    parser.add_argument("--posts", type=int, default=10_000)
+    parser.add_argument("--per-execute", type=int, default=2500)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    items = load_posts(args.fixture, args.posts)
+    batches = [
+        items[first : first + args.per_execute]
+        for first in range(0, len(items), args.per_execute)
+    ]
+    payloads = {
+        "whole posts": [
+            json.dumps({"response": {"count": len(items), "items": batch}}).encode()
+            for batch in batches
+        ],
+        "columns": [
+            json.dumps({"response": as_columns(len(items), batch)}).encode()
+            for batch in batches
+        ],
+    }
+    posts = normalize_posts(items)
+    print(f"{len(items)} posts, {json_codec.BACKEND} is used by the service")
+
+    for name, (loads, dumps) in _libraries().items():
+        for title, bodies in payloads.items():
+            size = sum(len(body) for body in bodies)
+            elapsed = measure(lambda: [loads(body) for body in bodies], args.repeat)
+            print(
+                f"{name:>8} decode {title:>11}: {elapsed * 1000:7.1f} ms, "
+                f"{size / elapsed / 1024**2:6.0f} MB/s"
+            )
+        elapsed = measure(lambda: dumps(posts), args.repeat)
+        print(f"{name:>8} encode {'posts':>11}: {elapsed * 1000:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Crawl time of a big wall with logging off, with every record about
+portions of posts logged and with them sampled ("LOG_PORTIONS_SAMPLE_RATE").
+Records are formatted as JSON and written to /dev/null.
+
+Run from "backend/app":
+    $ python -m benchmarks.bench_logging
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import time
+
+from benchmarks.vk_stub import VKStub, running_stub
+from core.config import settings
+from core.logs import JSONFormatter, RequestIdFilter
+from services.posts.post_fetcher import PostFetcher, portion_logger
+
+# Only the crawl is measured, so the stub isn't rate limited and nothing is cached.
+settings.VKAPI_REQUESTS_PER_SECOND = 1_000_000
+settings.POSTS_CACHE_PATH = ""
+# One call per execution, so there are a lot of portions and records about them.
+settings.VKAPI_EXECUTE_MAX_CALLS = 1
+
+
+async def _crawl(domain: str, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        await PostFetcher(domain).fetch_posts()
+    return (time.perf_counter() - started) / repeat
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--posts", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    handler = logging.StreamHandler(open(os.devnull, "w"))
+    handler.addFilter(RequestIdFilter())
+    handler.setFormatter(JSONFormatter())
+    logging.basicConfig(handlers=[handler], force=True)
+    sampling = portion_logger.filters[0]
+
+    stub = VKStub(walls={"wall": args.posts})
+    with running_stub(stub) as base_url:
+        PostFetcher._url_wall_get = base_url + "wall.get"
+        PostFetcher._url_execute = base_url + "execute"
+
+        modes = (
+            ("off", logging.WARNING, 1),
+            ("every record", logging.INFO, 1),
+            ("sampled", logging.INFO, settings.LOG_PORTIONS_SAMPLE_RATE),
+        )
+        for title, level, rate in modes:
+            logging.getLogger().setLevel(level)
+            sampling.rate = rate
+            crawl_time = asyncio.run(_crawl("wall", args.repeat))
+            print(f"{title:>12}: {crawl_time * 1000:.0f} ms per crawl")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Measures time per post of turning posts from VK API into the JSON response:
+Pydantic schemas built for every post (and validated again by "response_model")
+against plain dicts that are validated once and rendered as they are.
+
+Posts are taken from a recorded fixture (see "benchmarks.fixtures").
+
+Run from "backend/app":
+    $ python -m benchmarks.bench_normalization [--fixture wall.json]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from pydantic import parse_obj_as
+
+from benchmarks.fixtures import load_posts, measure
+from schemas.post import Post, PostPhoto, PostVideo
+from services.posts.normalization import as_json, normalize_posts
+
+
+def _posts_as_schemas(posts_from_vk: list[dict]) -> list[Post]:
+    """The former normalization: a schema for every post and attachment."""
+
+    posts = []
+    for post_from_vk in posts_from_vk:
+        post = Post(
+            date=post_from_vk["date"],
+            likes=post_from_vk["likes"]["count"],
+            text=post_from_vk["text"],
+            path=f"wall{post_from_vk['owner_id']}_" f"{post_from_vk['id']}",
+            photos=[],
+            videos=[],
+        )
+        for attachment in post_from_vk.get("attachments", []):
+            if attachment["type"] == "photo":
+                photo = PostPhoto(url="")
+                photo.url = attachment["photo"]["sizes"][-1]["url"]
+                post.photos.append(photo)
+            elif attachment["type"] == "video":
+                video = PostVideo(first_frame_url="")
+                video_from_vk = attachment["video"]
+                if "first_frame" in video_from_vk:
+                    video.first_frame_url = video_from_vk["first_frame"][-1]["url"]
+                else:
+                    video.first_frame_url = video_from_vk["image"][-1]["url"]
+                post.videos.append(video)
+        posts.append(post)
+    return posts
+
+
+_response_field = create_response_field(name="Response", type_=list[Post])
+
+
+def _respond_with_schemas(posts: list[Post]) -> bytes:
+    """What the endpoint did with posts: "response_model" validation and rendering."""
+
+    content = asyncio.run(
+        serialize_response(field=_response_field, response_content=posts)
+    )
+    return json.dumps(content).encode()
+
+
+def _respond(posts: list[dict]) -> bytes:
+    """What the endpoint does with posts now."""
+
+    parse_obj_as(list[Post], posts)
+    return as_json(posts)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--fixture", help="JSON file with recorded posts")
+    parser.add_argument("--posts", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    logging.disable(logging.ERROR)
+    posts_from_vk = load_posts(args.fixture, args.posts)
+    print(f"{len(posts_from_vk)} posts")
+
+    cases = {
+        "schemas: parse": lambda: _posts_as_schemas(posts_from_vk),
+        "schemas: parse + respond": lambda: _respond_with_schemas(
+            _posts_as_schemas(posts_from_vk)
+        ),
+        "dicts: parse": lambda: normalize_posts(posts_from_vk),
+        "dicts: parse + respond": lambda: _respond(normalize_posts(posts_from_vk)),
+    }
+    for title, func in cases.items():
+        elapsed = measure(func, args.repeat)
+        per_post = elapsed / len(posts_from_vk) * 1_000_000
+        print(f"{title:>25}: {elapsed * 1000:8.1f} ms, {per_post:6.1f} us/post")
+
+
+if __name__ == "__main__":
+    main()
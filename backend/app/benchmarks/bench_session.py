@@ -0,0 +1,53 @@
+"""
+Compares per-request sessions with the shared pooled session
+for VK API requests against the local VK stub.
+
+Run from "backend/app":
+    $ python -m benchmarks.bench_session
+"""
+
+import argparse
+import asyncio
+import time
+
+from benchmarks.vk_stub import VKStub, running_stub
+from core.config import settings
+from services.vkontakte import vk_api
+
+# Only connection overhead is measured, so the stub isn't rate limited.
+settings.VKAPI_REQUESTS_PER_SECOND = 1_000_000
+
+
+async def _measure(url: str, requests: int, shared: bool) -> tuple[float, float]:
+    """Returns mean wall time and CPU time (in ms) per request."""
+
+    params = {"count": 1, "domain": "stub"}
+    if shared:
+        await vk_api.open_session()
+
+    wall_started, cpu_started = time.perf_counter(), time.process_time()
+    for _ in range(requests):
+        await vk_api.vk_asynchronous_request(url, params)
+    wall = time.perf_counter() - wall_started
+    cpu = time.process_time() - cpu_started
+
+    await vk_api.close_session()
+    return wall / requests * 1000, cpu / requests * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    with running_stub(VKStub()) as base_url:
+        url = base_url + "wall.get"
+        for title, shared in (("session per request", False), ("shared session", True)):
+            latency, cpu = asyncio.run(_measure(url, args.requests, shared))
+            print(
+                f"{title:>20}: {latency:.3f} ms latency, {cpu:.3f} ms CPU per request"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Compares peak memory and wall time of getting the most liked posts
+by materializing the whole wall and sorting it (amount is applied after
+fetching) with the streaming heap that keeps only the top posts.
+
+Run from "backend/app":
+    $ python -m benchmarks.bench_top_posts
+"""
+
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import resource
+import time
+
+from benchmarks.vk_stub import VKStub, running_stub
+from core.config import settings
+
+# Both modes crawl the wall, so nothing is cached (spawned processes
+# run this module again, so they see it too).
+settings.POSTS_CACHE_PATH = ""
+
+
+def _run(base_url: str, amount: int, streaming: bool, results) -> None:
+    """Fetches posts in a fresh process, so its peak RSS belongs to one mode."""
+
+    from services.posts.post_fetcher import PostFetcher
+
+    settings.VKAPI_REQUESTS_PER_SECOND = 1_000_000
+    logging.disable(logging.INFO)
+    PostFetcher._url_wall_get = base_url + "wall.get"
+    PostFetcher._url_execute = base_url + "execute"
+
+    async def fetch() -> None:
+        if streaming:
+            post_fetcher = PostFetcher("stub", amount, sort_by_likes=True)
+            await post_fetcher.fetch_posts()
+        else:
+            post_fetcher = PostFetcher("stub", 0, sort_by_likes=True)
+            await post_fetcher.fetch_posts()
+            post_fetcher._posts = post_fetcher.posts[:amount]
+
+    started = time.perf_counter()
+    asyncio.run(fetch())
+    elapsed = time.perf_counter() - started
+    results.put((elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--posts", type=int, default=200_000)
+    parser.add_argument("--amount", type=int, default=500)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    stub = VKStub(total_posts=args.posts, text_length=300)
+    with running_stub(stub) as base_url:
+        for title, streaming in (
+            ("materialize + sort", False),
+            ("streaming heap", True),
+        ):
+            results = context.Queue()
+            process = context.Process(
+                target=_run, args=(base_url, args.amount, streaming, results)
+            )
+            process.start()
+            elapsed, max_rss = results.get()
+            process.join()
+            print(f"{title:>18}: {elapsed:.2f} s, peak RSS {max_rss / 1024:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Compares "/execute" responses with whole posts and with only the used fields
+(columns template of "vk_script"): bytes transferred and time to decode them
+and restore posts.
+
+Posts are taken from a recorded fixture (see "benchmarks.fixtures").
+
+Run from "backend/app":
+    $ python -m benchmarks.bench_trimming [--fixture wall.json]
+"""
+
+import argparse
+import json
+
+from benchmarks.fixtures import load_posts, measure
+from benchmarks.vk_stub import as_columns
+from services.vkontakte.vk_script import wall_items
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--fixture", help="JSON file with recorded posts")
+    parser.add_argument("--posts", type=int, default=10_000)
+    parser.add_argument("--per-execute", type=int, default=2500)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    items = load_posts(args.fixture, args.posts)
+    batches = [
+        items[first : first + args.per_execute]
+        for first in range(0, len(items), args.per_execute)
+    ]
+    print(f"{len(items)} posts in {len(batches)} responses")
+
+    for title, make_response in (
+        ("whole posts", lambda batch: {"count": len(items), "items": batch}),
+        ("columns", lambda batch: as_columns(len(items), batch)),
+    ):
+        bodies = [
+            json.dumps({"response": make_response(batch)}).encode()
+            for batch in batches
+        ]
+
+        def decode() -> None:
+            for body in bodies:
+                wall_items(json.loads(body)["response"])
+
+        size = sum(len(body) for body in bodies)
+        elapsed = measure(decode, args.repeat)
+        print(
+            f"{title:>12}: {size / 1024**2:7.2f} MB, {size / len(items):6.0f} B/post, "
+            f"decode {elapsed * 1000:7.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""
+Posts for benchmarks of parsing and serialization.
+
+A fixture is a recorded "wall.get"/"execute" response saved as JSON
+(e.g. with "?count=100" pages merged into one "items" list).
+Without it, posts looking like the ones from VK are generated.
+"""
+
+import json
+import time
+from typing import Callable
+
+from benchmarks.vk_stub import VKStub
+
+
+def load_posts(path: str | None, posts: int = 10_000) -> list[dict]:
+    """Posts of "wall.get" from the fixture at "path" or generated ones."""
+
+    if path is None:
+        stub = VKStub(total_posts=posts, text_length=300, attachments=2)
+        return stub.wall_get("stub", 0, posts)["items"]
+
+    with open(path, encoding="utf-8") as file:
+        data = json.load(file)
+    if isinstance(data, dict):
+        data = data.get("response", data)["items"]
+    return data
+
+
+def measure(func: Callable[[], object], repeat: int) -> float:
+    """The best time of "repeat" calls of "func" in seconds."""
+
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
@@ -0,0 +1,204 @@
+"""
+Benchmark suite: "PostFetcher" and "/posts" endpoint against the local
+VK API stub (realistic posts, latency, optional errors 6 and rate limits)
+on walls from 1k to 1M posts.
+
+Every scenario reports throughput (posts of the wall per second),
+median latency, p90 latency (only if the scenario is run at least
+20 times, otherwise it's just the slowest run) and peak memory
+of Python allocations, and compares them with the baselines saved
+by "--save" in "benchmarks/baselines.json". Exits with code 1
+if something regressed more than "--tolerance".
+
+Run from "backend/app":
+    $ python -m benchmarks.suite [--sizes 1000,10000] [--save]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Awaitable, Callable
+
+import httpx
+
+from benchmarks.vk_stub import VKStub, running_stub
+from core.config import settings
+from main import app
+from services.posts.post_fetcher import PostFetcher
+from services.vkontakte import token_pool, vk_api
+from services.vkontakte.token_pool import TokenPool
+
+# Crawls are measured, so nothing is cached.
+settings.POSTS_CACHE_PATH = ""
+logging.disable(logging.INFO)
+
+BASELINES_PATH = os.path.join(os.path.dirname(__file__), "baselines.json")
+
+# Metrics and whether their bigger values are better.
+_METRICS = {"posts_per_s": True, "p50_ms": False, "p90_ms": False, "peak_mb": False}
+# Runs needed to tell p90 latency.
+_TAIL_MIN_RUNS = 20
+
+
+async def _top_posts(client: httpx.AsyncClient, domain: str) -> None:
+    await PostFetcher(domain, 100, sort_by_likes=True).fetch_posts()
+
+
+async def _all_posts(client: httpx.AsyncClient, domain: str) -> None:
+    await PostFetcher(domain, 0, sort_by_likes=False).fetch_posts()
+
+
+async def _endpoint(client: httpx.AsyncClient, domain: str) -> None:
+    resp = await client.get(
+        f"{settings.API_V1_STR}/posts", params={"domain": domain, "amount": 100}
+    )
+    resp.raise_for_status()
+
+
+SCENARIOS: dict[str, Callable[[httpx.AsyncClient, str], Awaitable[None]]] = {
+    "top posts": _top_posts,
+    "all posts": _all_posts,
+    "/posts": _endpoint,
+}
+
+
+async def _run_scenario(
+    client: httpx.AsyncClient, scenario: str, size: int, repeat: int
+) -> dict[str, float]:
+    run = SCENARIOS[scenario]
+    domain = f"wall{size}"
+
+    # The first run measures memory (tracing slows it down, so it isn't timed).
+    tracemalloc.start()
+    await run(client, domain)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await run(client, domain)
+        latencies.append(time.perf_counter() - started)
+
+    p50 = statistics.median(latencies)
+    p90 = None
+    if len(latencies) >= _TAIL_MIN_RUNS:
+        p90 = round(statistics.quantiles(latencies, n=10)[-1] * 1000, 1)
+    return {
+        "posts_per_s": round(size / p50),
+        "p50_ms": round(p50 * 1000, 1),
+        "p90_ms": p90,
+        "peak_mb": round(peak / 1024**2, 1),
+    }
+
+
+async def _run_suite(sizes: list[int], scenarios: list[str]) -> dict[str, dict]:
+    results = {}
+    await vk_api.open_session()
+    try:
+        async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+            for size in sizes:
+                # Big walls are crawled fewer times, so the suite takes minutes.
+                repeat = min(max(200_000 // size, 1), 100)
+                for scenario in scenarios:
+                    key = f"{scenario} / {size}"
+                    results[key] = await _run_scenario(client, scenario, size, repeat)
+                    print(_format_row(key, results[key]), flush=True)
+    finally:
+        await vk_api.close_session()
+    return results
+
+
+def _format_row(key: str, metrics: dict[str, float], notes: str = "") -> str:
+    p90 = "-" if metrics["p90_ms"] is None else metrics["p90_ms"]
+    return (
+        f"{key:>22} {metrics['posts_per_s']:>10} {metrics['p50_ms']:>10} "
+        f"{p90:>10} {metrics['peak_mb']:>9} {notes}"
+    )
+
+
+def _regressions(
+    metrics: dict[str, float], baseline: dict[str, float], tolerance: float
+) -> list[str]:
+    """Metrics that are worse than the baseline by more than "tolerance"."""
+
+    regressions = []
+    for name, bigger_is_better in _METRICS.items():
+        if not baseline.get(name) or metrics[name] is None:
+            continue
+        change = metrics[name] / baseline[name] - 1
+        if (-change if bigger_is_better else change) > tolerance:
+            regressions.append(f"{name} {change:+.0%}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--sizes", default="1000,10000,100000,1000000")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--requests-per-second", type=float, default=0.0)
+    parser.add_argument("--tolerance", type=float, default=0.3)
+    parser.add_argument("--save", action="store_true", help="save results as baselines")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    scenarios = args.scenarios.split(",")
+    stub = VKStub(
+        latency=args.latency,
+        text_length=300,
+        attachments=2,
+        error_rate=args.error_rate,
+        requests_per_second=args.requests_per_second,
+        walls={f"wall{size}": size for size in sizes},
+    )
+    # The client keeps to the stub's rate limit, if there is one.
+    token_pool._pool = TokenPool(
+        settings.VKAPI_TOKENS, rate=args.requests_per_second or 1_000_000
+    )
+
+    print(
+        f"{'scenario / posts':>22} {'posts/s':>10} {'p50 ms':>10} "
+        f"{'p90 ms':>10} {'peak MB':>9}"
+    )
+    with running_stub(stub) as base_url:
+        PostFetcher._url_wall_get = base_url + "wall.get"
+        PostFetcher._url_execute = base_url + "execute"
+        results = asyncio.run(_run_suite(sizes, scenarios))
+
+    baselines = {}
+    if os.path.exists(BASELINES_PATH):
+        with open(BASELINES_PATH, encoding="utf-8") as file:
+            baselines = json.load(file)
+
+    if args.save:
+        with open(BASELINES_PATH, "w", encoding="utf-8") as file:
+            json.dump(baselines | results, file, indent=2)
+            file.write("\n")
+        print(f"Baselines are saved to {BASELINES_PATH}")
+        return
+
+    regressed = False
+    print("\nCompared with baselines:")
+    for key, metrics in results.items():
+        if key not in baselines:
+            print(_format_row(key, metrics, "no baseline"))
+            continue
+        regressions = _regressions(metrics, baselines[key], args.tolerance)
+        regressed = regressed or bool(regressions)
+        notes = "REGRESSION: " + ", ".join(regressions) if regressions else "ok"
+        print(_format_row(key, metrics, notes))
+    sys.exit(1 if regressed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""
+Local stub of VK API for benchmarks and tests.
+Serves "wall.get" and "execute" methods with generated posts,
+so client-side overheads can be measured without touching real VK.
+Like VK, it can limit requests of every token per second and fail
+some requests with error 6 ("Too many requests per second").
+"""
+
+import asyncio
+import json
+import multiprocessing
+import random
+import re
+import socket
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Iterator
+
+from aiohttp import web
+
+
+@dataclass
+class VKStub:
+    """
+    Generated VK walls with configurable size and response latency.
+    Every domain has "total_posts" posts unless it's set in "walls".
+    """
+
+    total_posts: int = 1000
+    latency: float = 0.0  # Seconds to wait before every response.
+    text_length: int = 0  # Extra characters in every post text.
+    attachments: int = 0  # Photos and videos (in turn) in every post.
+    # Posts "execute" can give at once, bigger responses fail with error 13.
+    execute_max_posts: int = 0  # 0 - no limit.
+    # "execute" fails with an internal error if it gets posts at these offsets.
+    broken_offsets: set[int] = field(default_factory=set)
+    unknown_domains: set[str] = field(default_factory=set)
+    # Share of requests that fail with error 6 anyway.
+    error_rate: float = 0.0
+    # Requests of one token per second, more fail with error 6 (0 - no limit).
+    requests_per_second: float = 0.0
+    seed: int = 0
+    walls: dict[str, int] = field(default_factory=dict)
+    # Requests by methods and errors 6 ("error 6").
+    calls: Counter = field(default_factory=Counter)
+
+    def __post_init__(self):
+        self._random = random.Random(self.seed)
+        # Times of requests during the last second by tokens.
+        self._requests: dict[str, deque[float]] = {}
+
+    def wall_size(self, domain: str) -> int:
+        return self.walls.get(domain, self.total_posts)
+
+    def post(self, domain: str, index: int) -> dict:
+        """Post number "index" from the top of the wall."""
+
+        post_id = self.wall_size(domain) - index
+        likes = (post_id * 7919) % 1000
+        return {
+            "id": post_id,
+            "from_id": -1,
+            "owner_id": -1,
+            "date": 1_600_000_000 + post_id * 60,
+            "marked_as_ads": 0,
+            "post_type": "post",
+            "text": f"Post {post_id}" + "x" * self.text_length,
+            "attachments": [
+                self._attachment(post_id, number) for number in range(self.attachments)
+            ],
+            "post_source": {"type": "vk"},
+            "comments": {"can_post": 1, "count": likes // 10},
+            "likes": {"can_like": 1, "count": likes, "user_likes": 0},
+            "reposts": {"count": likes // 20, "user_reposted": 0},
+            "views": {"count": likes * 30},
+            "is_favorite": False,
+            "hash": f"{post_id:x}",
+        }
+
+    @staticmethod
+    def _attachment(post_id: int, number: int) -> dict:
+        """Photo or video attachment looking like the ones from VK."""
+
+        url = f"https://sun9-1.userapi.com/impg/{post_id}_{number}"
+        if number % 2:
+            return {
+                "type": "video",
+                "video": {
+                    "id": post_id * 10 + number,
+                    "owner_id": -1,
+                    "title": f"Video {number}",
+                    "duration": 60,
+                    "date": 1_600_000_000,
+                    "image": [
+                        {"url": f"{url}/{width}.jpg", "width": width, "height": width}
+                        for width in (130, 320, 800, 1280)
+                    ],
+                    "first_frame": [
+                        {"url": f"{url}/ff{width}.jpg", "width": width, "height": width}
+                        for width in (130, 320, 800, 1280)
+                    ],
+                },
+            }
+        return {
+            "type": "photo",
+            "photo": {
+                "id": post_id * 10 + number,
+                "album_id": -7,
+                "owner_id": -1,
+                "date": 1_600_000_000,
+                "sizes": [
+                    {"type": size, "url": f"{url}/{size}.jpg", "width": w, "height": w}
+                    for size, w in (("s", 75), ("m", 130), ("x", 604), ("y", 807))
+                ],
+                "text": "",
+                "has_tags": False,
+            },
+        }
+
+    def wall_get(self, domain: str, offset: int, count: int) -> dict:
+        total = self.wall_size(domain)
+        items = [
+            self.post(domain, index)
+            for index in range(offset, min(offset + count, total))
+        ]
+        return {"count": total, "items": items}
+
+    def _too_many_requests(self, token: str) -> bool:
+        """Whether the request of the token exceeds the limits."""
+
+        if self.error_rate and self._random.random() < self.error_rate:
+            return True
+        if not self.requests_per_second:
+            return False
+
+        now = time.monotonic()
+        requests = self._requests.setdefault(token, deque())
+        while requests and requests[0] <= now - 1:
+            requests.popleft()
+        if len(requests) >= self.requests_per_second:
+            return True
+        requests.append(now)
+        return False
+
+    async def handle(self, method: str, request: web.Request) -> web.Response:
+        """Answers a request of VK API method after the latency, if limits allow."""
+
+        self.calls[method] += 1
+        await asyncio.sleep(self.latency)
+        if self._too_many_requests(request.query.get("access_token", "")):
+            self.calls["error 6"] += 1
+            error = {"error_code": 6, "error_msg": "Too many requests per second"}
+            return web.json_response({"error": error})
+
+        if method == "wall.get":
+            return await self.handle_wall_get(request)
+        return await self.handle_execute(request)
+
+    async def handle_wall_get(self, request: web.Request) -> web.Response:
+        domain = request.query.get("domain", "")
+        if domain in self.unknown_domains:
+            error = {
+                "error_code": 100,
+                "error_msg": "One of the parameters specified was missing or invalid: "
+                "owner_id is undefined",
+            }
+            return web.json_response({"error": error})
+        offset = int(request.query.get("offset", 0))
+        count = int(request.query.get("count", 20))
+        return web.json_response({"response": self.wall_get(domain, offset, count)})
+
+    async def handle_execute(self, request: web.Request) -> web.Response:
+        code = request.query["code"]
+        if domains := re.search(r"var domains = (\[.*?\]);", code):
+            counts = [
+                None if domain in self.unknown_domains else self.wall_size(domain)
+                for domain in json.loads(domains.group(1))
+            ]
+            return web.json_response({"response": counts})
+
+        domain = re.search(r'"domain": "([^"]*)"', code).group(1)
+        offset = int(re.search(r"offset_global = (\d+);", code).group(1))
+        times = int(re.search(r"while \(i != (\d+)\)", code).group(1))
+        count = int(re.search(r'"count": (\d+),', code).group(1))
+
+        if self.execute_max_posts and times * count > self.execute_max_posts:
+            error = {
+                "error_code": 13,
+                "error_msg": "Runtime error occurred during code invocation: "
+                "response size is too big",
+            }
+            return web.json_response({"error": error})
+        if any(
+            offset <= broken < offset + times * count for broken in self.broken_offsets
+        ):
+            error = {"error_code": 10, "error_msg": "Internal server error"}
+            return web.json_response({"error": error})
+        return web.json_response(
+            {"response": self.execute(domain, offset, times, count, "@." in code)}
+        )
+
+    def execute(
+        self, domain: str, offset: int, times: int, count: int, columns: bool
+    ) -> dict:
+        """
+        Result of the wall posts code from "vk_script": "wall.get" items
+        or their fields as columns.
+        """
+
+        items = []
+        for i in range(times):
+            items += self.wall_get(domain, offset + i * count, count)["items"]
+        if not columns:
+            return {"count": self.wall_size(domain), "items": items}
+        return as_columns(self.wall_size(domain), items)
+
+    def application(self) -> web.Application:
+        app = web.Application()
+        for method in ("wall.get", "execute"):
+            app.router.add_get(f"/method/{method}", partial(self.handle, method))
+        return app
+
+
+def as_columns(count: int, items: list[dict]) -> dict:
+    """What the columns template of "vk_script" gives for "wall.get" items."""
+
+    pinned = [item["id"] for item in items[:1] if item.get("is_pinned")]
+    return {
+        "count": count,
+        "pinned": pinned[0] if pinned else 0,
+        "ids": [item["id"] for item in items],
+        "owner_ids": [item["owner_id"] for item in items],
+        "dates": [item["date"] for item in items],
+        "likes": [item["likes"]["count"] for item in items],
+        "texts": [item["text"] for item in items],
+        "attachments": [item.get("attachments") for item in items],
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _serve(stub: VKStub, port: int) -> None:
+    web.run_app(
+        stub.application(), host="127.0.0.1", port=port, print=None, access_log=None
+    )
+
+
+@contextmanager
+def running_stub(stub: VKStub) -> Iterator[str]:
+    """
+    Runs stub in a separate process (so its CPU time isn't mixed
+    with the measured client) and gives its base URL.
+    """
+
+    port = _free_port()
+    process = multiprocessing.Process(target=_serve, args=(stub, port), daemon=True)
+    process.start()
+
+    # Waiting for server to accept connections.
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            break
+        except OSError:
+            if time.monotonic() > deadline:
+                process.terminate()
+                raise
+            time.sleep(0.05)
+
+    try:
+        yield f"http://127.0.0.1:{port}/method/"
+    finally:
+        process.terminate()
+        process.join()
@@ -0,0 +1,115 @@
+"""
+Compression of responses negotiated by "Accept-Encoding": zstd or brotli
+if their libraries are installed, gzip otherwise. Responses smaller than
+"COMPRESSION_MIN_BYTES" aren't worth compressing and are sent as they are.
+"""
+import gzip
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Available encodings, the preferred first.
+ENCODINGS = tuple(
+    encoding
+    for encoding, available in (
+        ("zstd", zstandard is not None),
+        ("br", brotli is not None),
+        ("gzip", True),
+    )
+    if available
+)
+
+
+def negotiate(accept_encoding: str) -> str | None:
+    """
+    The encoding the client prefers among available ones
+    (None if it accepts none of them).
+    """
+
+    accepted = {}
+    for coding in accept_encoding.split(","):
+        name, _, params = coding.partition(";")
+        params = params.strip()
+        try:
+            quality = float(params[2:]) if params.startswith("q=") else 1.0
+        except ValueError:
+            quality = 0.0
+        accepted[name.strip().lower()] = quality
+
+    best, best_quality = None, 0.0
+    for encoding in ENCODINGS:
+        quality = accepted.get(encoding, accepted.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    if encoding == "br":
+        return brotli.compress(data, quality=5)
+    return gzip.compress(data, compresslevel=6)
+
+
+class CompressionMiddleware:
+    """
+    Compresses responses of at least "min_bytes" (0 - none) that are
+    neither streamed nor encoded already (e.g. posts that are cached
+    compressed).
+    """
+
+    def __init__(self, app: ASGIApp, min_bytes: int):
+        self.app = app
+        self.min_bytes = min_bytes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        encoding = None
+        if scope["type"] == "http" and self.min_bytes:
+            encoding = negotiate(Headers(scope=scope).get("Accept-Encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Message | None = None
+        passing = False
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start, passing
+            if passing:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                start = message
+                return
+
+            body = message.get("body", b"")
+            headers = MutableHeaders(raw=start["headers"])
+            if (
+                message.get("more_body")
+                or "Content-Encoding" in headers
+                or len(body) < self.min_bytes
+            ):
+                passing = True
+                await send(start)
+                await send(message)
+                return
+
+            body = compress(body, encoding)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            headers.add_vary_header("Accept-Encoding")
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
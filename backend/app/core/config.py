@@ -1,5 +1,4 @@
 import secrets
-import logging
 
 from dotenv import load_dotenv
 from pydantic import AnyHttpUrl, BaseSettings, validator
@@ -31,13 +30,106 @@ class Settings(BaseSettings):
 
     VKAPI_URL = "https://api.vk.com/method/"
     VKAPI_VERSION = "5.131"
-    VKAPI_TOKEN: str
+    VKAPI_TOKEN: str = ""
+    # VKAPI_TOKENS is a JSON-formatted list of tokens, requests are spread among them
+    # e.g: '["token1", "token2"]'. VKAPI_TOKEN (if set) is added to the list.
+    VKAPI_TOKENS: list[str] = []
 
-    LOGGING_STANDARD_PARAMS = {
-        "level": logging.INFO,
-        "format": "[\033[92m%(levelname)s %(asctime)s\033[0m]: %(message)s",
-        "datefmt": "%m/%d/%Y %I:%M:%S %p",
-    }
+    @validator("VKAPI_TOKENS", pre=True, always=True)
+    def assemble_vkapi_tokens(cls, v: str | list[str], values: dict) -> list[str]:
+        if isinstance(v, str):
+            v = [i.strip() for i in v.split(",") if i.strip()]
+        tokens = list(v)
+        if values.get("VKAPI_TOKEN") and values["VKAPI_TOKEN"] not in tokens:
+            tokens.insert(0, values["VKAPI_TOKEN"])
+        if not tokens:
+            raise ValueError("VKAPI_TOKEN or VKAPI_TOKENS must be set")
+        return tokens
+
+    # Pooled HTTP connections to VK API, shared by the whole application.
+    VKAPI_CONNECTIONS_LIMIT: int = 100
+    VKAPI_CONNECTIONS_PER_HOST: int = 100
+    VKAPI_KEEPALIVE_TIMEOUT: float = 30
+    VKAPI_DNS_CACHE_TTL: int = 300
+
+    # Simultaneous requests to VK API for the whole application
+    # and for one crawl of a domain.
+    VKAPI_CONCURRENCY_LIMIT: int = 50
+    POSTS_FETCH_CONCURRENCY: int = 10
+
+    # Client-side rate limiting (VK allows 3 requests per second for a token).
+    VKAPI_REQUESTS_PER_SECOND: float = 3
+    VKAPI_MAX_RETRIES: int = 10
+    VKAPI_BACKOFF_BASE: float = 0.25  # Seconds.
+    VKAPI_BACKOFF_MAX: float = 8  # Seconds.
+    # Attempts to fetch a portion of posts again after VK or network errors.
+    POSTS_PORTION_RETRIES: int = 3
+    # How long a token rests after an error: 5 - authorization failed,
+    # 29 - daily limit for the method is reached (6 uses the backoff above).
+    VKAPI_TOKEN_QUARANTINE: dict[int, float] = {5: 600, 29: 3600}  # Seconds.
+
+    # Limits of "/execute" method: API calls in one code and response size
+    # (bigger responses fail with error 13, so batches are kept below it).
+    VKAPI_EXECUTE_MAX_CALLS: int = 25
+    VKAPI_EXECUTE_MAX_BYTES: int = 5 * 1024**2
+
+    # Workers that decode big "/execute" responses and cut posts down, so huge
+    # walls don't block event loop (processes, or threads on Python without GIL).
+    # 0 - responses are decoded in event loop.
+    POSTS_PARSE_WORKERS: int = 0
+    POSTS_PARSE_MIN_BYTES: int = 256 * 1024
+
+    # Domains of a batch crawled at once.
+    POSTS_BATCH_CONCURRENCY: int = 10
+
+    # Size of snapshots of the most liked posts in streams without amount.
+    POSTS_STREAM_TOP_SIZE: int = 500
+
+    # Persistent cache of posts (empty path disables it).
+    POSTS_CACHE_PATH: str = "cache/posts.sqlite3"
+    POSTS_CACHE_MAX_BYTES: int = 1024**3
+    POSTS_CACHE_TTL: float = 7 * 24 * 60 * 60  # Seconds.
+    # Cached domain isn't refreshed at all for this time (seconds).
+    POSTS_CACHE_FRESH_FOR: float = 60
+    # Recent posts that are fetched again on refresh as their likes still change.
+    POSTS_CACHE_REFRESH_WINDOW: int = 1000
+    # Responses of /posts may be reused by clients while posts are fresh
+    # in cache and then for this many seconds while they are revalidated.
+    POSTS_STALE_WHILE_REVALIDATE: int = 300
+    # Serialized responses of /posts kept in memory (bytes).
+    POSTS_RESPONSE_CACHE_MAX_BYTES: int = 64 * 1024**2
+    # Snapshots of likes of cached posts are kept for "POSTS_SNAPSHOTS_TTL"
+    # seconds, ones older than "POSTS_SNAPSHOTS_COMPACT_AFTER" are thinned
+    # to one per hour. Velocity of likes is smoothed over this many seconds.
+    POSTS_SNAPSHOTS_TTL: float = 30 * 24 * 60 * 60
+    POSTS_SNAPSHOTS_COMPACT_AFTER: float = 24 * 60 * 60
+    POSTS_VELOCITY_SMOOTHING: float = 6 * 60 * 60
+    # Domains whose posts are indexed in memory for filters
+    # (indexes are used for "POSTS_CACHE_FRESH_FOR" seconds).
+    POSTS_INDEX_MAX_DOMAINS: int = 20
+
+    # Pre-warming: the most requested domains (up to this number) are
+    # refreshed in cache every "PREWARM_INTERVAL" seconds, if VK API requests
+    # of users leave this share of the quota (0 - no pre-warming).
+    PREWARM_DOMAINS: int = 10
+    PREWARM_INTERVAL: float = 30
+    PREWARM_QUOTA_SHARE: float = 0.2
+
+    # Responses of at least this size (bytes) are compressed
+    # as clients accept (zstd, brotli or gzip), 0 - never.
+    COMPRESSION_MIN_BYTES: int = 1024
+
+    # Background crawls: running at once, how long results are kept
+    # (seconds) and where jobs are stored (empty path - in memory).
+    JOBS_CONCURRENCY: int = 4
+    JOBS_RESULT_TTL: float = 60 * 60
+    JOBS_STORE_PATH: str = ""
+
+    # Logging: "json" lines or coloured "text" for development.
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "json"
+    # Records about every portion of posts are logged once per this number.
+    LOG_PORTIONS_SAMPLE_RATE: int = 50
 
     class Config:
         case_sensitive = True
@@ -0,0 +1,117 @@
+"""
+Logging of the application: configured once on startup (see "main.py"),
+records are JSON lines (or coloured text for development) marked by ID
+of the request they are made for.
+"""
+import datetime
+import json
+import logging
+import sys
+import uuid
+from contextvars import ContextVar
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from core.config import settings
+
+# ID of the current request ("-" outside of requests). Tasks started
+# by a request (crawls, for example) inherit it.
+request_id: ContextVar[str] = ContextVar("request_id", default="-")
+
+_TEXT_FORMAT = (
+    "[\033[92m%(levelname)s %(asctime)s\033[0m] %(request_id)s: %(message)s"
+)
+_TEXT_DATE_FORMAT = "%m/%d/%Y %I:%M:%S %p"
+
+
+class RequestIdFilter(logging.Filter):
+    """Marks records by ID of the current request."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id.get()
+        return True
+
+
+class RequestIdMiddleware:
+    """
+    Logs made for a request are marked by its ID (given by a client
+    in "X-Request-ID" header or new), the response tells the ID.
+    Bodies are passed as they are, so streamed ones stay streamed
+    (and outer middlewares, e.g. compression, see them whole).
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        current_id = Headers(scope=scope).get("X-Request-ID") or uuid.uuid4().hex
+
+        async def send_with_id(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message)["X-Request-ID"] = current_id
+            await send(message)
+
+        token = request_id.set(current_id)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_id.reset(token)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Passes one of every "rate" records made with the same message,
+    so logs of hot paths don't flood the output. Warnings and errors
+    always pass.
+    """
+
+    def __init__(self, rate: int):
+        super().__init__()
+        self.rate = rate
+        self._seen: dict[str, int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate <= 1 or record.levelno >= logging.WARNING:
+            return True
+        seen = self._seen.get(record.msg, 0)
+        self._seen[record.msg] = seen + 1
+        record.sample_rate = self.rate
+        return seen % self.rate == 0
+
+
+class JSONFormatter(logging.Formatter):
+    """Formats records as JSON lines."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.datetime.fromtimestamp(
+                record.created, datetime.timezone.utc
+            ).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage(),
+        }
+        if hasattr(record, "sample_rate"):
+            entry["sample_rate"] = record.sample_rate
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def setup_logging() -> None:
+    """Sends records of the application to stderr as "LOG_FORMAT" says."""
+
+    handler = logging.StreamHandler(sys.stderr)
+    handler.addFilter(RequestIdFilter())
+    if settings.LOG_FORMAT == "json":
+        handler.setFormatter(JSONFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(_TEXT_FORMAT, _TEXT_DATE_FORMAT))
+
+    logging.basicConfig(level=settings.LOG_LEVEL, handlers=[handler], force=True)
@@ -1,14 +1,47 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from starlette.middleware.cors import CORSMiddleware
 
 from app.api.api_v1.api import api_router
+from app.api.metrics import router as metrics_router
+from core.compression import CompressionMiddleware
 from core.config import settings
+from core.logs import RequestIdMiddleware, setup_logging
+from services.posts.jobs import close_job_manager
+from services.posts.parse_pool import close_parse_pool
+from services.posts.post_cache import close_post_cache
+from services.posts.prewarm import start_prewarmer, stop_prewarmer
+from services.vkontakte import vk_api
+
+setup_logging()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One pooled session to VK API for the whole application lifetime.
+    await vk_api.open_session()
+    start_prewarmer()
+    yield
+    await stop_prewarmer()
+    await close_job_manager()
+    await vk_api.close_session()
+    close_post_cache()
+    close_parse_pool()
+
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
     openapi_url=f"{settings.API_V1_STR}/openapi.json",
+    lifespan=lifespan,
 )
 
+
+# Mark logs of requests by their IDs. It's a plain ASGI middleware:
+# "@app.middleware" would stream every body (and compression skips those).
+app.add_middleware(RequestIdMiddleware)
+
+
 # Set all CORS enabled origins
 if settings.BACKEND_CORS_ORIGINS:
     app.add_middleware(
@@ -19,7 +52,11 @@ if settings.BACKEND_CORS_ORIGINS:
         allow_headers=["*"],
     )
 
+# Compress responses as clients accept
+app.add_middleware(CompressionMiddleware, min_bytes=settings.COMPRESSION_MIN_BYTES)
+
 app.include_router(
     api_router,
     prefix=settings.API_V1_STR,
 )
+app.include_router(metrics_router)
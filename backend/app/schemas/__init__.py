@@ -1,2 +1,12 @@
-from .post import Post, PostPhoto, PostVideo
+from .job import Job
+from .post import (
+    DomainPosts,
+    Post,
+    PostPhoto,
+    PostVideo,
+    PostsBatch,
+    PostsBatchRequest,
+    PostsSnapshot,
+    SlimPost,
+)
 from .msg import Msg
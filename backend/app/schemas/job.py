@@ -0,0 +1,22 @@
+import datetime
+from typing import Literal
+
+import pydantic as pydantic
+from pydantic import Field
+
+
+class Job(pydantic.BaseModel):
+    """Crawl of a domain in the background."""
+
+    id: str = Field(description="Идентификатор задачи")
+    domain: str = Field(description="Адрес человека/сообщества")
+    status: Literal["pending", "running", "done", "failed"] = Field(
+        description="Состояние задачи: ожидает, выполняется, завершена, ошибка"
+    )
+    fetched: int = Field(description="Количество загруженных постов")
+    total: int = Field(description="Количество постов на стене (0 - еще неизвестно)")
+    created_at: datetime.datetime = Field(description="Время создания задачи")
+    finished_at: datetime.datetime | None = Field(
+        description="Время завершения задачи"
+    )
+    error: str | None = Field(description="Описание ошибки")
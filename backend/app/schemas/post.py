@@ -24,3 +24,60 @@ class Post(pydantic.BaseModel):
     path: str = Field(description="Путь URL к посту")
     photos: list[PostPhoto] = Field(description="Фотографии в посте")
     videos: list[PostVideo] = Field(description="Видео в посте")
+
+
+class SlimPost(pydantic.BaseModel):
+    """VK post data with only the chosen fields (texts may be cut)."""
+
+    date: datetime.datetime | None = Field(description="Дата поста")
+    likes: int | None = Field(description="Количество лайков")
+    text: str | None = Field(description="Текст поста")
+    path: str | None = Field(description="Путь URL к посту")
+    photos: list[PostPhoto] | None = Field(description="Фотографии в посте")
+    videos: list[PostVideo] | None = Field(description="Видео в посте")
+
+
+class DomainPosts(pydantic.BaseModel):
+    """Posts of one domain in a batch."""
+
+    domain: str = Field(description="Адрес человека/сообщества")
+    total: int = Field(description="Количество постов на стене")
+    posts: list[Post] = Field(description="Посты")
+    error: str | None = Field(description="Ошибка загрузки постов")
+
+
+class PostsBatch(pydantic.BaseModel):
+    """Posts of many domains and the most liked ones among them."""
+
+    domains: list[DomainPosts] = Field(description="Посты по адресам")
+    top: list[Post] = Field(description="Самые популярные посты всех адресов")
+
+
+class PostsBatchRequest(pydantic.BaseModel):
+    """Domains to fetch posts from at once."""
+
+    domains: list[str] = Field(
+        description="Адреса людей/сообществ", min_items=1, max_items=200
+    )
+    amount: int = Field(
+        description="Количество постов для загрузки с каждого адреса "
+        "(если 0, будут загружены все)",
+        ge=0,
+        default=10,
+    )
+    sort_by_likes: bool = Field(
+        description="Сортировать посты каждого адреса по лайкам", default=True
+    )
+    top: int = Field(
+        description="Количество самых популярных постов всех адресов",
+        ge=0,
+        default=100,
+    )
+
+
+class PostsSnapshot(pydantic.BaseModel):
+    """The most liked posts among fetched ones so far."""
+
+    fetched: int = Field(description="Количество загруженных постов")
+    total: int = Field(description="Количество постов для загрузки")
+    posts: list[Post] = Field(description="Самые популярные посты из загруженных")
@@ -0,0 +1,121 @@
+"""
+Posts of many VK domains at once: amounts of posts in all domains are got
+by a few "/execute" requests, and then domains are crawled concurrently.
+Requests of all crawls share the fair scheduler of VK API requests,
+so every domain gets its turn.
+"""
+import asyncio
+import heapq
+import json
+import logging
+from typing import TypedDict
+
+from fastapi import HTTPException
+
+from core.config import settings
+from services.posts.normalization import PostData
+from services.posts.post_fetcher import PostFetcher
+from services.vkontakte.concurrency import bounded_map
+from services.vkontakte.vk_api import vk_asynchronous_request
+from services.vkontakte.vk_script import get_wall_counts_template
+
+logger = logging.getLogger(__name__)
+
+# "wall.get" calls VK allows in one "/execute" request.
+_DOMAINS_PER_EXECUTE = 25
+
+
+class DomainPostsData(TypedDict):
+    """Posts of one domain in the shape of "schemas.DomainPosts"."""
+
+    domain: str
+    total: int
+    posts: list[PostData]
+    error: str | None
+
+
+class PostsBatchData(TypedDict):
+    """Posts of many domains in the shape of "schemas.PostsBatch"."""
+
+    domains: list[DomainPostsData]
+    top: list[PostData]
+
+
+async def wall_counts(domains: list[str]) -> dict[str, int | None]:
+    """Amounts of posts in VK domains (None if domain is not found)."""
+
+    chunks = [
+        domains[start : start + _DOMAINS_PER_EXECUTE]
+        for start in range(0, len(domains), _DOMAINS_PER_EXECUTE)
+    ]
+
+    async def count_chunk(chunk: list[str]) -> list[int | None]:
+        params = {
+            "v": settings.VKAPI_VERSION,
+            "code": get_wall_counts_template.substitute(
+                {"domains": json.dumps(chunk, ensure_ascii=False)}
+            ),
+        }
+        response = await vk_asynchronous_request(PostFetcher._url_execute, params)
+        return response["response"]
+
+    counts = await asyncio.gather(*(count_chunk(chunk) for chunk in chunks))
+    return dict(zip(domains, (count for chunk in counts for count in chunk)))
+
+
+async def fetch_batch(
+    domains: list[str], amount: int, sort_by_likes: bool, top: int
+) -> PostsBatchData:
+    """
+    Posts of every domain ("amount" of them, as "PostFetcher" gives them)
+    and "top" most liked posts among all domains.
+    Domains that fail are given with errors instead of posts.
+    """
+
+    post_fetchers = {}
+    for domain in domains:
+        post_fetcher = PostFetcher(domain, amount, sort_by_likes)
+        post_fetchers.setdefault(post_fetcher.vk_domain, post_fetcher)
+
+    counts = await wall_counts(list(post_fetchers))
+    logger.info("Start fetching posts from %i domains...", len(post_fetchers))
+
+    async def fetch_domain(post_fetcher: PostFetcher) -> DomainPostsData:
+        total = counts[post_fetcher.vk_domain]
+        result: DomainPostsData = {
+            "domain": post_fetcher.vk_domain,
+            "total": total or 0,
+            "posts": [],
+            "error": None,
+        }
+        if total is None:
+            result["error"] = (
+                f"Человек/сообщество с адресом {post_fetcher.vk_domain} не найдены."
+            )
+            return result
+
+        post_fetcher.known_total = total
+        try:
+            await post_fetcher.fetch_posts()
+        except HTTPException as exc:
+            # Posts of a domain that failed partly aren't given (nor ranked).
+            result["error"] = exc.detail
+        else:
+            result["posts"] = post_fetcher.posts
+        return result
+
+    # Results are put back into the order of domains.
+    results = {}
+    crawls = bounded_map(
+        fetch_domain, post_fetchers.values(), settings.POSTS_BATCH_CONCURRENCY
+    )
+    async for result in crawls:
+        results[result["domain"]] = result
+    logger.info("End fetching posts from %i domains...", len(post_fetchers))
+
+    domains_posts = [results[domain] for domain in post_fetchers]
+    all_posts = (post for result in domains_posts for post in result["posts"])
+    return {
+        "domains": domains_posts,
+        "top": heapq.nlargest(top, all_posts, key=lambda p: p["likes"]),
+    }
@@ -0,0 +1,265 @@
+"""
+Background crawls: a request starts a job and polls its progress,
+so crawls of huge domains don't hang HTTP requests behind proxy timeouts.
+Jobs and their results are kept in memory or in a local SQLite database
+and are deleted when "ttl" seconds pass since they are finished.
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+
+from fastapi import HTTPException
+from pydantic import parse_obj_as
+
+from core.config import settings
+from services.posts.normalization import as_json
+from services.posts.post_fetcher import PostFetcher
+import schemas
+
+logger = logging.getLogger(__name__)
+
+PENDING, RUNNING, DONE, FAILED = "pending", "running", "done", "failed"
+
+_INTERRUPTED = "Загрузка прервана, повторите запрос."
+
+
+@dataclass
+class Job:
+    """Crawl of a domain in the background, in the shape of "schemas.Job"."""
+
+    id: str
+    domain: str
+    amount: int
+    sort_by_likes: bool
+    status: str = PENDING
+    fetched: int = 0  # Posts fetched so far.
+    total: int = 0  # Posts in the domain (0 - not known yet).
+    created_at: float = field(default_factory=time.time)
+    finished_at: float | None = None
+    # Status code and detail of the error the job failed with.
+    error_status: int | None = None
+    error: str | None = None
+    # (offset, count) portions of the wall that failed to be fetched.
+    missing: list[tuple[int, int]] = field(default_factory=list)
+
+
+class MemoryJobStore:
+    """Jobs and their results (JSON of posts) in memory."""
+
+    def __init__(self):
+        self._jobs: dict[str, Job] = {}
+        self._results: dict[str, bytes] = {}
+
+    def save(self, job: Job, result: bytes | None = None) -> None:
+        self._jobs[job.id] = job
+        if result is not None:
+            self._results[job.id] = result
+
+    def get(self, job_id: str) -> Job | None:
+        return self._jobs.get(job_id)
+
+    def get_result(self, job_id: str) -> bytes | None:
+        return self._results.get(job_id)
+
+    def delete_finished_before(self, moment: float) -> None:
+        for job in list(self._jobs.values()):
+            if job.finished_at is not None and job.finished_at < moment:
+                del self._jobs[job.id]
+                self._results.pop(job.id, None)
+
+    def close(self) -> None:
+        pass
+
+
+class SQLiteJobStore:
+    """
+    Jobs and their results (JSON of posts) in SQLite database,
+    so they survive restarts of the application.
+    Methods are blocking, so they should be run in a thread.
+    """
+
+    def __init__(self, path: str):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, "
+                "data TEXT NOT NULL, result BLOB, finished_at REAL)"
+            )
+            # Jobs that were running when the application stopped won't finish.
+            for (data,) in self._connection.execute(
+                "SELECT data FROM jobs WHERE finished_at IS NULL"
+            ).fetchall():
+                job = Job(**json.loads(data))
+                job.status, job.finished_at = FAILED, time.time()
+                job.error_status, job.error = 503, _INTERRUPTED
+                self._update(job)
+
+    def save(self, job: Job, result: bytes | None = None) -> None:
+        with self._lock, self._connection:
+            self._update(job)
+            if result is not None:
+                self._connection.execute(
+                    "UPDATE jobs SET result = ? WHERE id = ?", (result, job.id)
+                )
+
+    def _update(self, job: Job) -> None:
+        self._connection.execute(
+            "INSERT INTO jobs (id, data, finished_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (id) DO UPDATE SET data = excluded.data, "
+            "finished_at = excluded.finished_at",
+            (job.id, json.dumps(asdict(job)), job.finished_at),
+        )
+
+    def get(self, job_id: str) -> Job | None:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT data FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        job = Job(**json.loads(row[0]))
+        job.missing = [tuple(portion) for portion in job.missing]
+        return job
+
+    def get_result(self, job_id: str) -> bytes | None:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT result FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return row[0] if row is not None else None
+
+    def delete_finished_before(self, moment: float) -> None:
+        with self._lock, self._connection:
+            self._connection.execute(
+                "DELETE FROM jobs WHERE finished_at < ?", (moment,)
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+class JobManager:
+    """
+    Runs crawls in the background, at most "concurrency" at once
+    (the rest are pending), and keeps their results for "ttl" seconds.
+    """
+
+    def __init__(
+        self, store: MemoryJobStore | SQLiteJobStore, concurrency: int, ttl: float
+    ):
+        self.store = store
+        self.ttl = ttl
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._tasks: set[asyncio.Task] = set()
+        # Crawls in progress by job ids, progress is read from them.
+        self._fetchers: dict[str, PostFetcher] = {}
+
+    async def start(self, post_fetcher: PostFetcher) -> Job:
+        """Starts a job that fetches posts by "post_fetcher"."""
+
+        await asyncio.to_thread(
+            self.store.delete_finished_before, time.time() - self.ttl
+        )
+
+        job = Job(
+            uuid.uuid4().hex,
+            post_fetcher.vk_domain,
+            post_fetcher.amount_to_fetch,
+            post_fetcher.sort_by_likes,
+        )
+        await asyncio.to_thread(self.store.save, job)
+        self._fetchers[job.id] = post_fetcher
+
+        task = asyncio.create_task(self._run(job, post_fetcher))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    async def _run(self, job: Job, post_fetcher: PostFetcher) -> None:
+        result = None
+        try:
+            async with self._semaphore:
+                job.status = RUNNING
+                await asyncio.to_thread(self.store.save, job)
+                logger.info("Job %s: fetching posts from vk.com/%s", job.id, job.domain)
+
+                await post_fetcher.fetch_posts()
+                parse_obj_as(list[schemas.Post], post_fetcher.posts)
+                result = as_json(post_fetcher.posts)
+                job.status = DONE
+        except HTTPException as exc:
+            job.status, job.error_status, job.error = (
+                FAILED,
+                exc.status_code,
+                exc.detail,
+            )
+        except asyncio.CancelledError:
+            job.status, job.error_status, job.error = FAILED, 503, _INTERRUPTED
+            raise
+        except Exception as exc:
+            logger.exception("Job %s failed", job.id)
+            job.status, job.error_status, job.error = FAILED, 500, str(exc)
+        finally:
+            self._fetchers.pop(job.id, None)
+            job.fetched, job.total = post_fetcher.progress
+            job.missing = post_fetcher.missing
+            job.finished_at = time.time()
+            await asyncio.to_thread(self.store.save, job, result)
+
+    async def get(self, job_id: str) -> Job | None:
+        """Job by id with its current progress (None if it's unknown or expired)."""
+
+        job = await asyncio.to_thread(self.store.get, job_id)
+        if job is None or (
+            job.finished_at is not None and job.finished_at < time.time() - self.ttl
+        ):
+            return None
+        if job_id in self._fetchers:
+            job.fetched, job.total = self._fetchers[job_id].progress
+        return job
+
+    async def get_result(self, job_id: str) -> bytes | None:
+        """JSON of posts fetched by the job (None if it isn't done)."""
+        return await asyncio.to_thread(self.store.get_result, job_id)
+
+    async def close(self) -> None:
+        """Cancels jobs in progress and closes the store."""
+
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self.store.close()
+
+
+_job_manager: JobManager | None = None
+
+
+def get_job_manager() -> JobManager:
+    """Jobs of the application, stored as "JOBS_STORE_PATH" says."""
+
+    global _job_manager
+    if _job_manager is None:
+        store = MemoryJobStore()
+        if settings.JOBS_STORE_PATH:
+            store = SQLiteJobStore(settings.JOBS_STORE_PATH)
+        _job_manager = JobManager(
+            store, concurrency=settings.JOBS_CONCURRENCY, ttl=settings.JOBS_RESULT_TTL
+        )
+    return _job_manager
+
+
+async def close_job_manager() -> None:
+    global _job_manager
+    if _job_manager is not None:
+        await _job_manager.close()
+    _job_manager = None
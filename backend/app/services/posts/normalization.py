@@ -0,0 +1,175 @@
+"""
+Normalization of posts from VK API into plain dicts shaped as "schemas.Post".
+Posts are validated by Pydantic only once, when the API responds with them.
+"""
+import datetime
+import logging
+import time
+from typing import TypedDict
+
+from core.metrics import registry
+from services.vkontakte import json_codec
+
+logger = logging.getLogger(__name__)
+
+NORMALIZE_SECONDS = registry.histogram(
+    "posts_normalize_seconds",
+    "Time of normalizing a portion of posts from VK API.",
+)
+
+
+class PhotoData(TypedDict):
+    url: str
+
+
+class VideoData(TypedDict):
+    first_frame_url: str
+
+
+class PostData(TypedDict):
+    """Post in the shape of "schemas.Post"."""
+
+    date: datetime.datetime
+    likes: int
+    text: str
+    path: str
+    photos: list[PhotoData]
+    videos: list[VideoData]
+
+
+class SnapshotData(TypedDict):
+    """Snapshot in the shape of "schemas.PostsSnapshot"."""
+
+    fetched: int
+    total: int
+    posts: list[PostData]
+
+
+def post_date(timestamp: int) -> datetime.datetime:
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc)
+
+
+def normalize_posts(posts_from_vk: list[dict]) -> list[PostData]:
+    """
+    Creates posts as plain dicts based on posts data given from VK API.
+    Posts without required keys are skipped.
+    """
+
+    started = time.perf_counter()
+    posts = []
+    for post_from_vk in posts_from_vk:
+        try:
+            post: PostData = {
+                "date": post_date(post_from_vk["date"]),
+                "likes": post_from_vk["likes"]["count"],
+                "text": post_from_vk["text"],
+                "path": f"wall{post_from_vk['owner_id']}_{post_from_vk['id']}",
+                "photos": [],
+                "videos": [],
+            }
+        except KeyError as exc:
+            logger.error("No key %s for post: %s", exc, post_from_vk)
+            continue
+
+        # Collect attachments (photos, videos etc.).
+        for attachment in post_from_vk.get("attachments", ()):
+            if attachment["type"] == "photo":
+                try:
+                    url = attachment["photo"]["sizes"][-1]["url"]
+                except KeyError as exc:
+                    logger.error("No key %s for photo: %s", exc, post_from_vk)
+                    continue
+                post["photos"].append({"url": url})
+
+            elif attachment["type"] == "video":
+                video_from_vk = attachment["video"]
+                if "first_frame" in video_from_vk:
+                    url = video_from_vk["first_frame"][-1]["url"]
+                elif "image" in video_from_vk:
+                    url = video_from_vk["image"][-1]["url"]
+                else:
+                    logger.error("No video image found: %s", post)
+                    continue
+                post["videos"].append({"first_frame_url": url})
+
+        posts.append(post)
+
+    NORMALIZE_SECONDS.observe(time.perf_counter() - started)
+    return posts
+
+
+_COMPACT_FIELDS = ("id", "owner_id", "date", "text", "is_pinned")
+
+
+def compact_items(posts_from_vk: list[dict]) -> list[dict]:
+    """
+    Posts from VK API with only the fields "normalize_posts" reads
+    (and the pinned mark): attachments keep just the image that is used.
+    Malformed data is kept as it is, so "normalize_posts" reports it.
+    """
+
+    items = []
+    for post_from_vk in posts_from_vk:
+        item = {
+            key: post_from_vk[key] for key in _COMPACT_FIELDS if key in post_from_vk
+        }
+        if "likes" in post_from_vk:
+            item["likes"] = {
+                key: value
+                for key, value in post_from_vk["likes"].items()
+                if key == "count"
+            }
+
+        attachments = []
+        for attachment in post_from_vk.get("attachments", ()):
+            if attachment["type"] == "photo":
+                sizes = attachment["photo"].get("sizes")
+                if sizes and "url" in sizes[-1]:
+                    photo = {"sizes": [{"url": sizes[-1]["url"]}]}
+                    attachment = {"type": "photo", "photo": photo}
+            elif attachment["type"] == "video":
+                video = {
+                    key: value[-1:]
+                    for key, value in attachment["video"].items()
+                    if key in ("first_frame", "image")
+                }
+                attachment = {"type": "video", "video": video}
+            else:
+                continue
+            attachments.append(attachment)
+        item["attachments"] = attachments
+
+        items.append(item)
+
+    return items
+
+
+# Fields of "PostData" in the order of "schemas.Post".
+POST_FIELDS = tuple(PostData.__annotations__)
+
+
+def slim_posts(
+    posts: list[PostData], fields: tuple[str, ...], text_length: int | None
+) -> list[dict]:
+    """
+    Posts with only "fields" and texts cut to "text_length" characters
+    (None - whole texts). Only the fields are copied, nested photos and
+    videos are shared with the posts.
+    """
+
+    cut_text = text_length is not None and "text" in fields
+    if fields == POST_FIELDS and not cut_text:
+        return posts
+
+    slim = []
+    for post in posts:
+        item = {field: post[field] for field in fields}
+        if cut_text:
+            item["text"] = item["text"][:text_length]
+        slim.append(item)
+    return slim
+
+
+def as_json(data: PostData | SnapshotData | list[PostData]) -> bytes:
+    """JSON of posts or a snapshot, as Pydantic would give it."""
+    return json_codec.dumps(data)
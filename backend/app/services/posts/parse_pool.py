@@ -0,0 +1,73 @@
+"""
+Pool of workers that decode big "/execute" responses and cut posts down
+to the used fields, so parsing of huge walls doesn't block event loop.
+"""
+import asyncio
+import logging
+import multiprocessing
+import sys
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+from core.config import settings
+from services.posts.normalization import compact_items
+from services.vkontakte import json_codec
+from services.vkontakte.vk_script import wall_items
+
+logger = logging.getLogger(__name__)
+
+_pool: Executor | None = None
+
+
+def decode_portion(body: bytes) -> dict:
+    """Decoded "/execute" response with posts given by "compact_items"."""
+
+    data = json_codec.loads(body)
+    response = data.get("response")
+    if isinstance(response, dict):
+        items = wall_items(response)
+        if items is not None:
+            data["response"] = {
+                "count": response["count"],
+                "items": compact_items(items),
+            }
+    return data
+
+
+def _gil_enabled() -> bool:
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", None)
+    return is_gil_enabled is None or is_gil_enabled()
+
+
+def get_parse_pool() -> Executor | None:
+    """Pool shared by the application (None if parsing is done in event loop)."""
+
+    global _pool
+    if _pool is None and settings.POSTS_PARSE_WORKERS:
+        # Threads run in parallel only without GIL, otherwise processes are used.
+        if _gil_enabled():
+            _pool = ProcessPoolExecutor(
+                settings.POSTS_PARSE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        else:
+            _pool = ThreadPoolExecutor(
+                settings.POSTS_PARSE_WORKERS, thread_name_prefix="parse"
+            )
+        logger.info("Started %s for parsing posts", type(_pool).__name__)
+    return _pool
+
+
+def close_parse_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+    _pool = None
+
+
+async def parse_portion(body: bytes) -> dict:
+    """Decodes "/execute" response, in the pool if it's big enough."""
+
+    pool = get_parse_pool()
+    if pool is None or len(body) < settings.POSTS_PARSE_MIN_BYTES:
+        return json_codec.loads(body)
+    return await asyncio.get_running_loop().run_in_executor(pool, decode_portion, body)
@@ -0,0 +1,591 @@
+"""
+Persistent cache of posts from VK domains.
+Posts are kept in a local SQLite database, so repeated requests
+fetch only new posts and recent ones whose likes still change.
+Full crawls are checkpointed there too, so an interrupted one is resumed.
+Changes of likes are kept as snapshots, so posts can be ranked by how fast
+they gain likes.
+"""
+
+import json
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+
+from services.posts.normalization import PostData, post_date
+from core.config import settings
+from core.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+CACHE_REQUESTS = registry.counter(
+    "posts_cache_requests_total",
+    "Requests of domains from posts cache by results (hit or miss).",
+    ("result",),
+)
+
+# Approximate storage overhead of one post besides its data.
+_POST_OVERHEAD_BYTES = 64
+# Approximate storage of one snapshot of likes.
+_SNAPSHOT_BYTES = 32
+# Old snapshots are compacted to one per post in such periods (seconds).
+_SNAPSHOTS_PERIOD = 60 * 60
+
+# Rankings of posts besides likes and date: likes per hour the post is
+# gaining now or has gained on average since it was published.
+TRENDING = ("velocity", "age")
+_TRENDING_ORDERS = {
+    "velocity": "velocity DESC, id DESC",
+    "age": "likes * 3600.0 / MAX(:now - date, 3600) DESC, id DESC",
+}
+
+# Flags of the "attachments" column of posts.
+PHOTOS, VIDEOS = 1, 2
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS domains (
+    domain TEXT PRIMARY KEY,
+    total INTEGER NOT NULL,
+    newest_id INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    refreshed_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS posts (
+    domain TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    date INTEGER NOT NULL,
+    likes INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    velocity REAL NOT NULL,
+    seen_at REAL NOT NULL,
+    attachments INTEGER NOT NULL,
+    PRIMARY KEY (domain, id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS posts_by_likes ON posts (domain, likes DESC, id DESC);
+CREATE INDEX IF NOT EXISTS posts_by_date ON posts (domain, date DESC, id DESC);
+CREATE INDEX IF NOT EXISTS posts_by_velocity
+    ON posts (domain, velocity DESC, id DESC);
+CREATE TABLE IF NOT EXISTS crawls (
+    domain TEXT PRIMARY KEY,
+    newest_id INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    domain TEXT NOT NULL,
+    from_end INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (domain, from_end)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS snapshots (
+    domain TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    taken_at REAL NOT NULL,
+    likes INTEGER NOT NULL,
+    PRIMARY KEY (domain, id, taken_at)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS snapshots_by_time ON snapshots (domain, taken_at);
+CREATE TABLE IF NOT EXISTS compactions (
+    domain TEXT PRIMARY KEY,
+    compacted_until REAL NOT NULL
+);
+"""
+
+
+@dataclass
+class CachedDomain:
+    """What is known about the cached wall of a domain."""
+
+    total: int  # Posts on the wall at the last refresh.
+    newest_id: int  # The newest (not pinned) post id.
+    refreshed_at: float
+
+
+@dataclass
+class Checkpoint:
+    """Progress of an unfinished full crawl of a domain."""
+
+    newest_id: int  # The newest (not pinned) post id fetched so far.
+    done: list[tuple[int, int]]  # Fetched (offset, count) portions.
+
+
+def post_id(post: PostData) -> int:
+    """Post id from its path, e.g. 12 from "wall-1_12"."""
+    return int(post["path"].rsplit("_", 1)[-1])
+
+
+def _velocity(
+    post: PostData, now: float, seen: tuple[int, float, float] | None
+) -> float:
+    """
+    Likes per hour the post is gaining. At first it's the average since
+    the post was published, then it's smoothed over observations of likes
+    ("seen" is the previous one: likes, when, velocity), the longer ago
+    the previous observation is, the more the new one weighs.
+    """
+
+    if seen is None:
+        age = now - post["date"].timestamp()
+        return post["likes"] * 3600 / max(age, 3600)
+
+    likes, seen_at, velocity = seen
+    elapsed = now - seen_at
+    if elapsed <= 0:
+        return velocity
+    rate = (post["likes"] - likes) * 3600 / elapsed
+    weight = 1 - math.exp(-elapsed / settings.POSTS_VELOCITY_SMOOTHING)
+    return velocity + weight * (rate - velocity)
+
+
+class PostCache:
+    """
+    SQLite storage of posts by domains with eviction of domains
+    that weren't requested for "ttl" seconds or don't fit into "max_bytes"
+    (least recently requested ones go first).
+    Methods are blocking, so they should be run in a thread.
+    """
+
+    def __init__(self, path: str, max_bytes: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            self._connection.execute("PRAGMA journal_mode = WAL")
+            self._connection.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    def get_domain(self, domain: str) -> CachedDomain | None:
+        """Cached wall of the domain (and counts it as hit or miss)."""
+
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT total, newest_id, refreshed_at FROM domains WHERE domain = ?",
+                (domain,),
+            ).fetchone()
+
+        if row is None or row[2] < time.time() - self.ttl:
+            self.misses += 1
+            CACHE_REQUESTS.inc(("miss",))
+            return None
+        self.hits += 1
+        CACHE_REQUESTS.inc(("hit",))
+        return CachedDomain(*row)
+
+    def get_version(self, domain: str) -> tuple[str, float] | None:
+        """
+        Version of cached posts of the domain, that changes when posts
+        are added or deleted or their likes change, and when the domain
+        was refreshed (None if it's not cached). Requests aren't counted.
+        """
+
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT total, newest_id, refreshed_at, "
+                "(SELECT MAX(taken_at) FROM snapshots WHERE domain = :domain) "
+                "FROM domains WHERE domain = :domain",
+                {"domain": domain},
+            ).fetchone()
+        if row is None:
+            return None
+        total, newest_id, refreshed_at, likes_changed_at = row
+        return f"{total}-{newest_id}-{likes_changed_at or 0}", refreshed_at
+
+    def store_posts(self, domain: str, posts: list[PostData]) -> None:
+        """Adds posts of the domain or updates them (e.g. likes)."""
+
+        with self._lock, self._connection:
+            self._insert_posts(domain, posts)
+
+    def _insert_posts(self, domain: str, posts: list[PostData]) -> None:
+        """
+        Adds or updates posts with velocity of their likes. Only posts
+        whose likes changed get a new snapshot, so the cost of an update
+        doesn't depend on the history.
+        """
+
+        now = time.time()
+        ids = [post_id(post) for post in posts]
+        seen = {
+            id_: (likes, seen_at, velocity)
+            for id_, likes, seen_at, velocity in self._connection.execute(
+                "SELECT id, likes, seen_at, velocity FROM posts "
+                "WHERE domain = ? AND id IN (SELECT value FROM json_each(?))",
+                (domain, json.dumps(ids)),
+            )
+        }
+        # Posts fetched anew (e.g. by a full crawl) go on from their snapshots.
+        unseen = [id_ for id_ in ids if id_ not in seen]
+        if unseen:
+            dates = {id_: post["date"].timestamp() for id_, post in zip(ids, posts)}
+            for id_, likes, taken_at in self._connection.execute(
+                "SELECT id, likes, MAX(taken_at) FROM snapshots "
+                "WHERE domain = ? AND id IN (SELECT value FROM json_each(?)) "
+                "GROUP BY id",
+                (domain, json.dumps(unseen)),
+            ):
+                # Velocity is the average since publication till the snapshot.
+                age = taken_at - dates[id_]
+                seen[id_] = (likes, taken_at, likes * 3600 / max(age, 3600))
+
+        rows, snapshots = [], []
+        for id_, post in zip(ids, posts):
+            previous = seen.get(id_)
+            if previous is None or previous[0] != post["likes"]:
+                snapshots.append((domain, id_, now, post["likes"]))
+
+            rows.append(
+                (
+                    domain,
+                    id_,
+                    int(post["date"].timestamp()),
+                    post["likes"],
+                    # Date is kept in its own column only.
+                    json.dumps({key: post[key] for key in post if key != "date"}),
+                    _velocity(post, now, previous),
+                    now,
+                    (PHOTOS if post["photos"] else 0)
+                    | (VIDEOS if post["videos"] else 0),
+                )
+            )
+        self._connection.executemany(
+            "INSERT OR REPLACE INTO posts "
+            "(domain, id, date, likes, data, velocity, seen_at, attachments) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        self._connection.executemany(
+            "INSERT OR REPLACE INTO snapshots (domain, id, taken_at, likes) "
+            "VALUES (?, ?, ?, ?)",
+            snapshots,
+        )
+
+    def start_crawl(self, domain: str, total: int) -> Checkpoint:
+        """
+        Checkpoint of the full crawl of the domain with "total" posts on the wall.
+        An unfinished crawl is resumed, otherwise a new one is started
+        and old posts of the domain are deleted.
+        """
+
+        now = time.time()
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT newest_id FROM crawls WHERE domain = ? AND updated_at >= ?",
+                (domain, now - self.ttl),
+            ).fetchone()
+            if row is not None:
+                # Portions are kept by their distance from the end of the wall,
+                # so new posts on the top don't shift them.
+                done = self._connection.execute(
+                    "SELECT from_end, count FROM checkpoints WHERE domain = ? "
+                    "ORDER BY from_end DESC",
+                    (domain,),
+                ).fetchall()
+                done = [(total - from_end, count) for from_end, count in done]
+                if all(offset >= 0 for offset, _ in done):
+                    self._connection.execute(
+                        "UPDATE crawls SET updated_at = ? WHERE domain = ?",
+                        (now, domain),
+                    )
+                    return Checkpoint(row[0], done)
+
+            for table in ("posts", "domains", "crawls", "checkpoints"):
+                self._connection.execute(
+                    f"DELETE FROM {table} WHERE domain = ?", (domain,)
+                )
+            self._connection.execute(
+                "INSERT INTO crawls (domain, newest_id, updated_at) VALUES (?, 0, ?)",
+                (domain, now),
+            )
+        return Checkpoint(0, [])
+
+    def store_portion(
+        self,
+        domain: str,
+        posts: list[PostData],
+        portion: tuple[int, int],
+        total: int,
+        newest_id: int,
+    ) -> None:
+        """
+        Adds posts of the (offset, count) portion fetched by the full crawl
+        of the domain and marks the portion as done.
+        """
+
+        offset, count = portion
+        with self._lock, self._connection:
+            self._insert_posts(domain, posts)
+            self._connection.execute(
+                "INSERT OR REPLACE INTO checkpoints (domain, from_end, count) "
+                "VALUES (?, ?, ?)",
+                (domain, total - offset, count),
+            )
+            self._connection.execute(
+                "UPDATE crawls SET newest_id = MAX(newest_id, ?), updated_at = ? "
+                "WHERE domain = ?",
+                (newest_id, time.time(), domain),
+            )
+
+    def delete_missing_posts(self, domain: str, since_id: int, ids: set[int]) -> None:
+        """Deletes posts with id >= "since_id" that are not in "ids" anymore."""
+
+        with self._lock, self._connection:
+            cached_ids = self._connection.execute(
+                "SELECT id FROM posts WHERE domain = ? AND id >= ?",
+                (domain, since_id),
+            ).fetchall()
+            self._connection.executemany(
+                "DELETE FROM posts WHERE domain = ? AND id = ?",
+                [(domain, id_) for (id_,) in cached_ids if id_ not in ids],
+            )
+
+    def stop_tracking(self, domain: str, before_id: int) -> None:
+        """
+        Zeroes velocity of posts older than "before_id": they are out of
+        the refresh window, so their likes aren't observed anymore.
+        """
+
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE posts SET velocity = 0 "
+                "WHERE domain = ? AND id < ? AND velocity != 0",
+                (domain, before_id),
+            )
+
+    def finish_refresh(self, domain: str, total: int, newest_id: int) -> None:
+        """Remembers the state of the refreshed wall and evicts old domains."""
+
+        now = time.time()
+        with self._lock, self._connection:
+            for table in ("crawls", "checkpoints"):
+                self._connection.execute(
+                    f"DELETE FROM {table} WHERE domain = ?", (domain,)
+                )
+            self._compact_snapshots(domain, now)
+            size = self._connection.execute(
+                "SELECT COALESCE(SUM(LENGTH(data)), 0) + COUNT(*) * ? "
+                "FROM posts WHERE domain = ?",
+                (_POST_OVERHEAD_BYTES, domain),
+            ).fetchone()[0]
+            size += (
+                self._connection.execute(
+                    "SELECT COUNT(*) FROM snapshots WHERE domain = ?", (domain,)
+                ).fetchone()[0]
+                * _SNAPSHOT_BYTES
+            )
+            self._connection.execute(
+                "INSERT OR REPLACE INTO domains "
+                "(domain, total, newest_id, size, refreshed_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (domain, total, newest_id, size, now, now),
+            )
+        self.evict()
+
+    def _compact_snapshots(self, domain: str, now: float) -> None:
+        """
+        Deletes expired snapshots of the domain and keeps only the latest one
+        per post in every period among snapshots older than
+        "POSTS_SNAPSHOTS_COMPACT_AFTER". Only snapshots that got old since
+        the previous compaction are looked through.
+        """
+
+        compact_until = now - settings.POSTS_SNAPSHOTS_COMPACT_AFTER
+        row = self._connection.execute(
+            "SELECT compacted_until FROM compactions WHERE domain = ?", (domain,)
+        ).fetchone()
+        # The period the previous compaction ended in could get new snapshots.
+        compact_since = row[0] - _SNAPSHOTS_PERIOD if row is not None else 0
+
+        self._connection.execute(
+            "DELETE FROM snapshots WHERE domain = ? AND taken_at < ?",
+            (domain, now - settings.POSTS_SNAPSHOTS_TTL),
+        )
+        self._connection.execute(
+            "DELETE FROM snapshots WHERE domain = :domain "
+            "AND taken_at >= :since AND taken_at < :until AND EXISTS ("
+            "SELECT 1 FROM snapshots AS later WHERE later.domain = :domain "
+            "AND later.id = snapshots.id AND later.taken_at > snapshots.taken_at "
+            "AND later.taken_at < "
+            "(CAST(snapshots.taken_at / :period AS INTEGER) + 1) * :period)",
+            {
+                "domain": domain,
+                "since": compact_since,
+                "until": compact_until,
+                "period": _SNAPSHOTS_PERIOD,
+            },
+        )
+        self._connection.execute(
+            "INSERT OR REPLACE INTO compactions (domain, compacted_until) "
+            "VALUES (?, ?)",
+            (domain, compact_until),
+        )
+
+    def get_posts(
+        self,
+        domain: str,
+        amount: int,
+        sort_by_likes: bool,
+        trending: str | None = None,
+    ) -> list[PostData]:
+        """
+        Cached posts of the domain, the most liked or the newest first
+        or as "trending" ranks them (see "TRENDING").
+        """
+
+        order = "likes DESC, id DESC" if sort_by_likes else "date DESC, id DESC"
+        if trending is not None:
+            order = _TRENDING_ORDERS[trending]
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE domains SET accessed_at = ? WHERE domain = ?",
+                (now, domain),
+            )
+            rows = self._connection.execute(
+                f"SELECT date, data FROM posts WHERE domain = :domain "
+                f"ORDER BY {order} LIMIT :amount",
+                {"domain": domain, "amount": amount or -1, "now": now},
+            ).fetchall()
+        return [{"date": post_date(date), **json.loads(data)} for date, data in rows]
+
+    def get_posts_by_ids(self, domain: str, ids: list[int]) -> list[PostData]:
+        """Cached posts of the domain with the ids (in the same order)."""
+
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE domains SET accessed_at = ? WHERE domain = ?",
+                (time.time(), domain),
+            )
+            rows = self._connection.execute(
+                "SELECT id, date, data FROM posts "
+                "WHERE domain = ? AND id IN (SELECT value FROM json_each(?))",
+                (domain, json.dumps(ids)),
+            ).fetchall()
+        posts = {
+            id_: {"date": post_date(date), **json.loads(data)}
+            for id_, date, data in rows
+        }
+        return [posts[id_] for id_ in ids if id_ in posts]
+
+    def get_columns(self, domain: str) -> list[tuple[int, int, int, int]]:
+        """
+        (date, id, likes, attachments) of cached posts of the domain,
+        so they can be indexed without reading the posts themselves.
+        """
+
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE domains SET accessed_at = ? WHERE domain = ?",
+                (time.time(), domain),
+            )
+            return self._connection.execute(
+                "SELECT date, id, likes, attachments FROM posts "
+                "WHERE domain = ? ORDER BY id",
+                (domain,),
+            ).fetchall()
+
+    def snapshots(self, domain: str, id_: int) -> list[tuple[float, int]]:
+        """Snapshots of likes of the post: (when, likes), the oldest first."""
+
+        with self._lock:
+            return self._connection.execute(
+                "SELECT taken_at, likes FROM snapshots "
+                "WHERE domain = ? AND id = ? ORDER BY taken_at",
+                (domain, id_),
+            ).fetchall()
+
+    def evict(self) -> None:
+        """
+        Deletes expired domains and the least recently used ones over the size,
+        and posts of unfinished crawls that weren't resumed for "ttl" seconds.
+        """
+
+        with self._lock, self._connection:
+            rows = self._connection.execute(
+                "SELECT domain, size, accessed_at FROM domains "
+                "ORDER BY accessed_at DESC"
+            ).fetchall()
+
+            expired_at = time.time() - self.ttl
+            evicted, total_size = [], 0
+            for domain, size, accessed_at in rows:
+                total_size += size
+                if accessed_at < expired_at or total_size > self.max_bytes:
+                    evicted.append((domain,))
+            evicted += self._connection.execute(
+                "SELECT domain FROM crawls WHERE updated_at < ?", (expired_at,)
+            ).fetchall()
+
+            for table in (
+                "posts",
+                "domains",
+                "crawls",
+                "checkpoints",
+                "snapshots",
+                "compactions",
+            ):
+                self._connection.executemany(
+                    f"DELETE FROM {table} WHERE domain = ?", evicted
+                )
+
+        if evicted:
+            logger.info("Evicted domains from posts cache: %s", evicted)
+            with self._lock:
+                self._connection.execute("PRAGMA incremental_vacuum")
+
+    def stats(self) -> dict:
+        """Cache hit/miss counters."""
+
+        requests = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / requests if requests else 0.0,
+        }
+
+
+_post_cache: PostCache | None = None
+
+
+def get_post_cache() -> PostCache | None:
+    """Posts cache shared by the application (None if it's disabled)."""
+
+    global _post_cache
+    if _post_cache is None and settings.POSTS_CACHE_PATH:
+        _post_cache = PostCache(
+            settings.POSTS_CACHE_PATH,
+            max_bytes=settings.POSTS_CACHE_MAX_BYTES,
+            ttl=settings.POSTS_CACHE_TTL,
+        )
+    return _post_cache
+
+
+def _hit_ratio() -> float:
+    return _post_cache.stats()["hit_ratio"] if _post_cache is not None else 0.0
+
+
+registry.gauge(
+    "posts_cache_hit_ratio",
+    "Share of requests of domains answered by posts cache.",
+    _hit_ratio,
+)
+
+
+def close_post_cache() -> None:
+    global _post_cache
+    if _post_cache is not None:
+        _post_cache.close()
+    _post_cache = None
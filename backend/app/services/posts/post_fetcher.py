@@ -1,17 +1,57 @@
 """
 Services for post fetching from VK domains.
 """
-import logging
+
 import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import aclosing
 from dataclasses import dataclass, field
-
-from schemas.post import Post, PostPhoto, PostVideo
-from services.vkontakte.vk_api import vk_asynchronous_request
-from services.vkontakte.vk_script import get_wall_post_template
+from itertools import chain
+from typing import AsyncIterator, Callable, Iterable, Iterator
+
+import aiohttp
+from fastapi import HTTPException
+
+from services.posts.normalization import PostData, SnapshotData, normalize_posts
+from services.posts.parse_pool import parse_portion
+from services.posts.post_cache import CachedDomain, PostCache, get_post_cache
+from services.posts.post_index import PostFilters, PostIndex, PostIndexes
+from services.posts.single_flight import CrawlPlan, CrawlResult, SingleFlight
+from services.posts.top_posts import TopPosts
+from services.vkontakte.concurrency import bounded_map
+from services.vkontakte.vk_api import (
+    VKExecuteError,
+    VKResponse,
+    vk_asynchronous_request,
+    vk_request,
+)
+from services.vkontakte.vk_script import (
+    ExecutePlanner,
+    get_wall_post_columns_template,
+    get_wall_post_template,
+    wall_items,
+)
 from core.config import settings
+from core.logs import SamplingFilter
+from core.metrics import registry
 
-logging.basicConfig(**settings.LOGGING_STANDARD_PARAMS)
 logger = logging.getLogger(__name__)
+# Big crawls have thousands of portions, so records about them are sampled.
+portion_logger = logging.getLogger(f"{__name__}.portions")
+portion_logger.addFilter(SamplingFilter(settings.LOG_PORTIONS_SAMPLE_RATE))
+
+POSTS_FETCHED = registry.counter(
+    "posts_fetched_total", "Posts fetched from VK API (rate gives posts per second)."
+)
+
+# In-flight crawls shared by concurrent requests.
+_single_flight = SingleFlight()
+# Indexes of whole walls for requests with filters.
+_post_indexes = PostIndexes(
+    settings.POSTS_INDEX_MAX_DOMAINS, settings.POSTS_CACHE_FRESH_FOR
+)
 
 
 @dataclass
@@ -23,172 +63,643 @@ class PostFetcher:
     vk_domain: str  # Group or person address in VK, e.g. "a_a_burlakov".
     amount_to_fetch: int = 0  # If 0, will gather all posts.
     sort_by_likes: bool = False
+    # Whether posts are given even if some portions of the wall failed.
+    allow_partial: bool = False
+    # Posts in the domain if they're counted already (e.g. for a batch).
+    known_total: int | None = None
+    # Posts are taken from the index of the whole wall if there are filters.
+    filters: PostFilters | None = None
+    # Ranking instead of likes or date, one of "post_cache.TRENDING".
+    # Likes are tracked by cache, so posts are always taken from it.
+    trending: str | None = None
+    # VK API requests the fetcher may make (None - no limit). Refreshing
+    # of cache stops when they're spent, the rest is fetched by later ones.
+    request_budget: float | None = None
 
     _url_wall_get = settings.VKAPI_URL + "wall.get"
     _url_execute = settings.VKAPI_URL + "execute"
 
     _total_posts_in_domain: int = 0
-    _posts: list[Post] = field(default_factory=list)
-
-    # Number of times to execute query via "/execute" method.
-    _execution_times: int = 5
-    # Amount of post to fetch via one "/execute" method execution.
-    _posts_per_portion: int = 100
+    _fetched_posts: int = 0  # Posts of the domain fetched from VK so far.
+    _requests: int = 0  # VK API requests made so far.
+    _budget_spent: bool = False
+    _posts: list[PostData] = field(default_factory=list)
+    # (offset, count) portions that failed to be fetched.
+    _missing: list[tuple[int, int]] = field(default_factory=list)
+    # Progress of the crawl that gives posts (a shared one or the crawl
+    # of the whole wall for filters), if it isn't made by this fetcher.
+    _progress_of: Callable[[], tuple[int, int]] | None = None
+
+    # Chooses amount of posts to fetch via one "/execute" method execution.
+    _planner: ExecutePlanner = field(default_factory=ExecutePlanner)
+    # Whether "/execute" gives only the fields of posts that are used.
+    _trim_fields: bool = True
 
     def __post_init__(self):
         # Compressing domain.
+        self.vk_domain = self.vk_domain.strip().rstrip("/").lower()
         if "/" in self.vk_domain:
             self.vk_domain = self.vk_domain.split("/")[-1]
 
     @property
-    def posts(self) -> list[Post]:
+    def posts(self) -> list[PostData]:
         return self._posts
 
+    @property
+    def missing(self) -> list[tuple[int, int]]:
+        return self._missing
+
+    @property
+    def requests(self) -> int:
+        """VK API requests made by the fetcher so far."""
+        return self._requests
+
+    @property
+    def uses_cache(self) -> bool:
+        """
+        Whether posts are given by cache. Date-ordered requests of a few posts
+        are cheap and always fresh, so only requests that need the whole wall
+        go through it.
+        """
+
+        return (
+            self.filters is None
+            and get_post_cache() is not None
+            and bool(self.sort_by_likes or not self.amount_to_fetch or self.trending)
+        )
+
+    @property
+    def progress(self) -> tuple[int, int]:
+        """Posts fetched so far and posts in the domain (0 if not known yet)."""
+
+        if self._progress_of is not None:
+            return self._progress_of()
+        return self._own_progress()
+
+    def _own_progress(self) -> tuple[int, int]:
+        return self._fetched_posts, self._total_posts_in_domain
+
     async def _set_total_posts_in_domain(self) -> None:
         """Sets "_total_posts" as amount of posts in the VK domain."""
 
+        if self.known_total is not None:
+            self._total_posts_in_domain = self.known_total
+            return
+
         logger.info('Getting total posts in "vk.com/%s"...', self.vk_domain)
 
         params = {
             "v": settings.VKAPI_VERSION,
-            "access_token": settings.VKAPI_TOKEN,
             "count": 1,  # Enough just to get total post in domain.
             "domain": self.vk_domain,
         }
 
         # Data fetching.
+        self._requests += 1
         response = await vk_asynchronous_request(
             self._url_wall_get,
             params,
+            lane=id(self),
             domain=self.vk_domain,
         )
 
         self._total_posts_in_domain = response["response"]["count"]
         logger.info("Total posts in VK domain: %s", self._total_posts_in_domain)
 
+    async def _fetch_portion(self, portion: tuple[int, int]) -> tuple[int, list[dict]]:
+        """
+        Fetches a portion of "count" posts starting from "offset" via "/execute"
+        method (by several executions if VK fails to give them at once).
+        """
+
+        offset, count = portion
+        portion_logger.info(
+            "(offset %i) Start fetching posts from vk.com/%s...",
+            offset,
+            self.vk_domain,
+        )
+
+        posts_per_call = self._planner.posts_per_call
+        items = []
+        fetched, failures = 0, 0
+        while fetched < count:
+            calls = self._planner.calls_for(count - fetched)
+            try:
+                response = await self._execute(offset + fetched, calls)
+            except VKExecuteError as exc:
+                if calls == 1:
+                    raise HTTPException(status_code=500, detail=str(exc))
+                self._planner.back_off()
+                continue
+
+            posts_from_vk = wall_items(response.data["response"])
+            if posts_from_vk is None:
+                logger.warning("Can't restore posts from columns, fetching them whole")
+                self._trim_fields = False
+                continue
+
+            if "execute_errors" not in response.data:
+                self._planner.observe(len(posts_from_vk), response.size)
+                items += posts_from_vk
+                fetched += calls * posts_per_call
+                continue
+
+            # Some calls failed: posts of the successful ones are kept
+            # and the rest are fetched again by smaller executions.
+            logger.warning(
+                "(offset %i) Partial response: %s",
+                offset + fetched,
+                response.data["execute_errors"],
+            )
+            self._planner.back_off()
+            succeeded = len(posts_from_vk) // posts_per_call * posts_per_call
+            items += posts_from_vk[:succeeded]
+            fetched += succeeded
+            failures = 0 if succeeded else failures + 1
+            if failures > settings.VKAPI_MAX_RETRIES:
+                raise HTTPException(
+                    status_code=503,
+                    detail="VK API перегружен запросами, попробуйте позже.",
+                )
+
+        POSTS_FETCHED.inc(amount=len(items))
+        self._fetched_posts += len(items)
+        portion_logger.info(
+            "(offset %i) End fetching posts from vk.com/%s...",
+            offset,
+            self.vk_domain,
+        )
+
+        return offset, items
+
+    async def _fetch_portion_with_retries(
+        self, portion: tuple[int, int], skip_failed: bool
+    ) -> tuple[int, list[dict]]:
+        """
+        Fetches a portion of posts, retrying it if VK or network fails.
+        If all attempts fail, the portion is recorded as missing and given
+        without posts ("skip_failed") or the last error is raised.
+        """
+
+        for attempt in range(settings.POSTS_PORTION_RETRIES + 1):
+            try:
+                return await self._fetch_portion(portion)
+            except (HTTPException, aiohttp.ClientError, asyncio.TimeoutError) as exc:
+                if isinstance(exc, HTTPException) and exc.status_code < 500:
+                    raise
+                if attempt == settings.POSTS_PORTION_RETRIES:
+                    if not skip_failed:
+                        raise
+                    logger.error("(offset %i) Portion failed: %r", portion[0], exc)
+                    self._missing.append(portion)
+                    return portion[0], []
+                logger.warning("(offset %i) Retrying portion: %r", portion[0], exc)
+                await asyncio.sleep(
+                    min(
+                        settings.VKAPI_BACKOFF_BASE * 2**attempt,
+                        settings.VKAPI_BACKOFF_MAX,
+                    )
+                )
+
+    async def _execute(self, offset: int, calls: int) -> VKResponse:
+        """Fetches posts starting from "offset" by "calls" calls in one execution."""
+
+        # VK Script code for /execute method.
+        template = get_wall_post_template
+        if self._trim_fields:
+            template = get_wall_post_columns_template
+        vks_code = template.substitute(
+            {
+                "domain": self.vk_domain,
+                "offset": offset,
+                "posts_per_portion": self._planner.posts_per_call,
+                "execution_times": calls,
+            }
+        )
+        params = {
+            "v": settings.VKAPI_VERSION,
+            "code": vks_code,
+        }
+
+        self._requests += 1
+        return await vk_request(
+            self._url_execute,
+            params,
+            lane=id(self),
+            parse=parse_portion,
+            domain=self.vk_domain,
+            offset=offset,
+        )
+
+    def _fetch_portions(
+        self, portions: Iterable[tuple[int, int]], skip_failed: bool = False
+    ) -> AsyncIterator[tuple[int, list[dict]]]:
+        """
+        Fetches (offset, count) portions of posts, giving (offset, posts)
+        as they're done. Portions that failed are given without posts
+        if "skip_failed" (see "missing"), otherwise they stop fetching.
+        """
+
+        return bounded_map(
+            lambda portion: self._fetch_portion_with_retries(portion, skip_failed),
+            portions,
+            settings.POSTS_FETCH_CONCURRENCY,
+        )
+
+    def _plan_portions(
+        self, start: int, stop: int, done: list[tuple[int, int]] = ()
+    ) -> Iterable[tuple[int, int]]:
+        """Portions of posts from "start" up to "stop" except "done" ones."""
+
+        gaps, offset = [], start
+        for done_offset, count in sorted(done):
+            if done_offset > offset:
+                gaps.append((offset, min(done_offset, stop)))
+            offset = max(offset, done_offset + count)
+        gaps.append((offset, stop))
+
+        return chain.from_iterable(
+            self._planner.portions(*gap) for gap in gaps if gap[0] < gap[1]
+        )
+
+    def _within_budget(
+        self, portions: Iterable[tuple[int, int]]
+    ) -> Iterator[tuple[int, int]]:
+        """
+        Portions until "request_budget" is spent (portions in progress are
+        still finished), the rest are left and "_budget_spent" is set.
+        """
+
+        for portion in portions:
+            if (
+                self.request_budget is not None
+                and self._requests >= self.request_budget
+            ):
+                self._budget_spent = True
+                return
+            yield portion
+
     async def fetch_posts(self) -> None:
         """
         Fetches posts from VK domain asynchronously and
         put it into "posts" attribute.
+        Concurrent requests for the same domain share one crawl.
+        If some portions of the wall failed, posts are given only
+        if "allow_partial" (see "missing").
         """
 
-        async def fetch_posts_for_offset(offset) -> list:
-            logger.info(
-                "(offset %i) Start fetching posts from vk.com/%s...",
-                offset,
-                self.vk_domain,
+        if self.filters is not None and self.trending is not None:
+            raise HTTPException(
+                status_code=400,
+                detail="Фильтры не сочетаются с сортировкой по скорости "
+                "набора лайков.",
             )
+        if self.filters is not None:
+            await self._fetch_filtered_posts()
+            return
 
-            # VK Script code for /execute method.
-            vks_code = get_wall_post_template.substitute(
-                {
-                    "domain": self.vk_domain,
-                    "offset": offset,
-                    "posts_per_portion": self._posts_per_portion,
-                    "execution_times": self._execution_times,
-                }
+        if self.request_budget is not None:
+            # Crawl stopped by the budget may give too few posts to share it.
+            result = await self._crawl()
+        else:
+            plan = CrawlPlan(self.amount_to_fetch, self.sort_by_likes, self.trending)
+            flight = _single_flight.join(
+                self.vk_domain, plan, self._crawl, self._own_progress
             )
-            params = {
-                "v": settings.VKAPI_VERSION,
-                "access_token": settings.VKAPI_TOKEN,
-                "code": vks_code,
-            }
-            url = self._url_execute
-
-            # Posts fetching.
-            resp_json = await vk_asynchronous_request(
-                url,
-                params,
-                domain=self.vk_domain,
-                offset=offset,
+            self._progress_of = flight.progress
+            result = await flight.wait(plan)
+        self._posts, self._missing = result.posts, result.missing
+
+        if self._missing and not self.allow_partial:
+            raise HTTPException(
+                status_code=503,
+                detail="Не удалось загрузить часть постов, повторите запрос позже.",
             )
 
-            logger.info(
-                "(offset %i) End fetching posts from vk.com/%s...",
-                offset,
-                self.vk_domain,
+    async def _fetch_filtered_posts(self) -> None:
+        """
+        Puts posts matching "filters" into "posts" attribute. They are found
+        in the index of the whole wall, which is reused while it's fresh
+        (and while cached posts of the domain are the same).
+        """
+
+        post_cache = get_post_cache()
+        version = None
+        if post_cache is not None:
+            version = await asyncio.to_thread(post_cache.get_version, self.vk_domain)
+        index = _post_indexes.get(self.vk_domain)
+        if index is None or index.version != version:
+            index = await self._index_wall(post_cache)
+
+        rows = index.query(self.filters, self.amount_to_fetch, self.sort_by_likes)
+        if index.posts is not None:
+            self._posts = index.posts_of(rows)
+        else:
+            self._posts = await asyncio.to_thread(
+                post_cache.get_posts_by_ids, self.vk_domain, index.ids_of(rows)
             )
 
-            # Gathered posts handling.
-            posts_from_vk = resp_json["response"]["items"]
-            posts = posts_as_schemas(posts_from_vk)
-            del posts_from_vk
-            return posts
+    async def _index_wall(self, post_cache: PostCache | None) -> PostIndex:
+        """
+        Index of the whole wall. With cache the wall is refreshed in it
+        (just one post is read back) and only columns of posts are indexed,
+        the matching posts are read from cache by ids.
+        """
+
+        wall = PostFetcher(
+            self.vk_domain,
+            amount_to_fetch=0 if post_cache is None else 1,
+            sort_by_likes=post_cache is not None,
+            allow_partial=self.allow_partial,
+            known_total=self.known_total,
+        )
+        self._progress_of = lambda: wall.progress
+        await wall.fetch_posts()
+        self._missing = wall.missing
+
+        if post_cache is None:
+            index = await asyncio.to_thread(PostIndex.from_posts, wall.posts)
+        else:
+            version = await asyncio.to_thread(post_cache.get_version, self.vk_domain)
+            rows = await asyncio.to_thread(post_cache.get_columns, self.vk_domain)
+            index = await asyncio.to_thread(PostIndex, rows, version=version)
+        if not wall.missing:
+            _post_indexes.put(self.vk_domain, index)
+        return index
+
+    async def _crawl(self) -> CrawlResult:
+        """Fetches posts from VK domain (or cache) and gives them."""
+
+        await self._fetch_posts()
+        return CrawlResult(self._posts, self._missing)
+
+    async def _fetch_posts(self) -> None:
+        # With cache the whole wall is stored anyway, and the most liked posts
+        # are read by "posts_by_likes" index (just "amount" rows of them),
+        # so "TopPosts" selects them only for requests without cache.
+        if self.uses_cache:
+            await self._fetch_posts_with_cache(get_post_cache())
+            return
+        if self.trending is not None:
+            raise HTTPException(
+                status_code=400,
+                detail="Без кэша постов сортировка по скорости набора лайков "
+                "недоступна.",
+            )
 
         # Checks and preparations.
         await self._set_total_posts_in_domain()
         if not self._total_posts_in_domain:
             return
 
-        # Creating tasks for fetching.
-        tasks = []
-        posts_per_task = self._posts_per_portion * self._execution_times
-        offsets = list(range(0, self._total_posts_in_domain, posts_per_task))
-        for offset in offsets:
-            tasks.append(asyncio.create_task(fetch_posts_for_offset(offset)))
+        # Posts on the wall are ordered by date, so without sorting by likes
+        # only the first "amount" posts are needed.
+        posts_needed = self._total_posts_in_domain
+        if not self.sort_by_likes and self.amount_to_fetch:
+            posts_needed = min(posts_needed, self.amount_to_fetch)
+
+        # Portions are planned and handed to a bounded pool of workers lazily.
+        portions_plan = self._planner.portions(0, posts_needed)
 
         # Running tasks.
         logger.info("Start fetching posts from vk.com/%s...", self.vk_domain)
-        results = await asyncio.gather(*tasks)
+        portions = self._fetch_portions(portions_plan, skip_failed=True)
+        async with aclosing(portions) as portions:
+            if self.sort_by_likes and self.amount_to_fetch:
+                # Only the most liked posts are kept while portions are coming,
+                # and just they are normalized.
+                top_posts = TopPosts(self.amount_to_fetch)
+                async for offset, posts_from_vk in portions:
+                    top_posts.extend(offset, posts_from_vk)
+                self._posts = normalize_posts(top_posts.best())
+                logger.info("End fetching posts from vk.com/%s...", self.vk_domain)
+                return
+
+            results = {}
+            async for offset, posts_from_vk in portions:
+                results[offset] = normalize_posts(posts_from_vk)
+                # Outstanding tasks are cancelled when leaving "portions".
+                if _first_posts_count(results, self._missing) >= posts_needed:
+                    break
         logger.info("End fetching posts from vk.com/%s...", self.vk_domain)
 
-        # Flatting results from many tasks into one list.
-        self._posts = [post for result in results for post in result]
+        # Flatting results from many tasks into one list (in order of offsets).
+        self._posts = [post for offset in sorted(results) for post in results[offset]]
 
         # Final actions.
         if self.sort_by_likes:
-            self._posts = list(sorted(self.posts, key=lambda p: p.likes, reverse=True))
+            self._posts.sort(key=lambda p: p["likes"], reverse=True)
         if self.amount_to_fetch:
             self._posts = self._posts[: self.amount_to_fetch]
 
+    async def stream_posts(self) -> AsyncIterator[list[PostData]]:
+        """
+        Fetches posts from VK domain giving them in order of the wall
+        as soon as portions are fetched (without cache and sharing crawls).
+        The window of portions slides: a portion is given as soon as it
+        and the previous ones are done, and then the next one is started.
+        So at most "POSTS_FETCH_CONCURRENCY" portions are kept in memory.
+        A portion that failed stops the stream with its error.
+        """
 
-def posts_as_schemas(posts_from_vk: list[dict]) -> list[Post]:
-    """
-    Creates posts as Pydantic schemas based on posts data given
-    from VK API.
-    :param posts_from_vk: list of posts as dicts from VK API
-    :return: list of posts as Pydantic objects
-    """
-    posts = []
+        await self._set_total_posts_in_domain()
+        posts_needed = self._total_posts_in_domain
+        if self.amount_to_fetch:
+            posts_needed = min(posts_needed, self.amount_to_fetch)
+
+        portions_plan = self._planner.portions(0, posts_needed)
+        posts_left = posts_needed
+        # Portions being fetched (or waiting to be given) in order of the wall.
+        window: deque[asyncio.Task] = deque()
 
-    for post_from_vk in posts_from_vk:
         try:
-            post = Post(
-                date=post_from_vk["date"],
-                likes=post_from_vk["likes"]["count"],
-                text=post_from_vk["text"],
-                path=f"wall{post_from_vk['owner_id']}_" f"{post_from_vk['id']}",
-                photos=[],
-                videos=[],
+            while True:
+                while len(window) < settings.POSTS_FETCH_CONCURRENCY and (
+                    portion := next(portions_plan, None)
+                ):
+                    window.append(
+                        asyncio.create_task(
+                            self._fetch_portion_with_retries(portion, skip_failed=False)
+                        )
+                    )
+                if not window:
+                    return
+
+                _, posts_from_vk = await window[0]
+                window.popleft()
+                posts = normalize_posts(posts_from_vk)[:posts_left]
+                posts_left -= len(posts)
+                yield posts
+                if posts_left <= 0:
+                    return
+        finally:
+            for task in window:
+                task.cancel()
+            await asyncio.gather(*window, return_exceptions=True)
+
+    async def stream_top_posts(self) -> AsyncIterator[SnapshotData]:
+        """
+        Fetches posts from VK domain giving snapshots of the most liked posts
+        among fetched ones every time they change.
+        """
+
+        await self._set_total_posts_in_domain()
+        total = self._total_posts_in_domain
+
+        top_posts = TopPosts(self.amount_to_fetch or settings.POSTS_STREAM_TOP_SIZE)
+        portions_plan = self._planner.portions(0, total)
+        fetched, sent_fetched, sent_version = 0, -1, -1
+
+        async with aclosing(self._fetch_portions(portions_plan)) as portions:
+            async for offset, posts_from_vk in portions:
+                top_posts.extend(offset, posts_from_vk)
+                fetched += len(posts_from_vk)
+                if top_posts.version != sent_version:
+                    sent_fetched, sent_version = fetched, top_posts.version
+                    yield {
+                        "fetched": fetched,
+                        "total": total,
+                        "posts": normalize_posts(top_posts.best()),
+                    }
+
+        # The last snapshot always tells that fetching is over.
+        if sent_fetched != fetched:
+            yield {
+                "fetched": fetched,
+                "total": total,
+                "posts": normalize_posts(top_posts.best()),
+            }
+
+    async def _fetch_posts_with_cache(self, post_cache: PostCache) -> None:
+        """Puts posts from cache into "posts" attribute, refreshing them if needed."""
+
+        cached = await asyncio.to_thread(post_cache.get_domain, self.vk_domain)
+        if (
+            cached is None
+            or cached.refreshed_at < time.time() - settings.POSTS_CACHE_FRESH_FOR
+        ):
+            await self._refresh_cache(post_cache, cached)
+
+        self._posts = await asyncio.to_thread(
+            post_cache.get_posts,
+            self.vk_domain,
+            self.amount_to_fetch,
+            self.sort_by_likes,
+            self.trending,
+        )
+
+    async def _refresh_cache(
+        self, post_cache: PostCache, cached: CachedDomain | None
+    ) -> None:
+        """
+        Stores posts of the domain in cache. If the domain is cached already,
+        only new posts and the recent ones (their likes still change) are fetched.
+        Otherwise the whole wall is fetched and every portion is checkpointed,
+        so if some portions fail, a repeated request fetches only them.
+        """
+
+        await self._set_total_posts_in_domain()
+        total = self._total_posts_in_domain
+
+        posts_needed = total
+        checkpoint = None
+        if cached is not None:
+            new_posts = max(total - cached.total, 0)
+            posts_needed = min(total, new_posts + settings.POSTS_CACHE_REFRESH_WINDOW)
+            newest_id = cached.newest_id
+        else:
+            checkpoint = await asyncio.to_thread(
+                post_cache.start_crawl, self.vk_domain, total
             )
-        except KeyError as exc:
-            logger.error("No key %s for post: %s", exc, post_from_vk)
-            continue
-
-        # Collect attachments (photos, videos etc.).
-        if "attachments" in post_from_vk:
-            attachments = post_from_vk["attachments"]
-            for attachment in attachments:
-                if attachment["type"] == "photo":
-                    try:
-                        photo = PostPhoto(url="")
-                        photo.url = attachment["photo"]["sizes"][-1]["url"]
-                        post.photos.append(photo)
-                    except KeyError as exc:
-                        logger.error("No key %s for photo: %s", exc, post_from_vk)
-
-                elif attachment["type"] == "video":
-                    video = PostVideo(first_frame_url="")
-                    video_from_vk = attachment["video"]
-                    if "first_frame" in video_from_vk:
-                        video.first_frame_url = video_from_vk["first_frame"][-1]["url"]
-                    elif "image" in video_from_vk:
-                        video.first_frame_url = video_from_vk["image"][-1]["url"]
-                    else:
-                        logger.error("No video image found: %s", post)
-                        continue
-                    post.videos.append(video)
-
-        posts.append(post)
-
-    return posts
+            newest_id = checkpoint.newest_id
+
+        oldest_id = None
+        fetched_ids = set()
+        reached_cached = cached is None
+        posts_per_call = self._planner.posts_per_call
+        next_offset = 0
+
+        logger.info("Start refreshing cached posts from vk.com/%s...", self.vk_domain)
+        while next_offset < posts_needed:
+            portions_plan = self._plan_portions(
+                next_offset, posts_needed, checkpoint.done if checkpoint else []
+            )
+            portions_plan = self._within_budget(portions_plan)
+            portions = self._fetch_portions(portions_plan, skip_failed=True)
+            async with aclosing(portions) as portions:
+                async for offset, posts_from_vk in portions:
+                    fetched_ids.update(int(p["id"]) for p in posts_from_vk)
+                    ids = [
+                        int(p["id"]) for p in posts_from_vk if not p.get("is_pinned")
+                    ]
+                    if ids:
+                        newest_id = max(newest_id, *ids)
+                        oldest_id = min(ids if oldest_id is None else [oldest_id, *ids])
+                        reached_cached = reached_cached or oldest_id <= cached.newest_id
+
+                    posts = normalize_posts(posts_from_vk)
+                    if checkpoint is None:
+                        await asyncio.to_thread(
+                            post_cache.store_posts, self.vk_domain, posts
+                        )
+                    elif posts_from_vk:
+                        await asyncio.to_thread(
+                            post_cache.store_portion,
+                            self.vk_domain,
+                            posts,
+                            (offset, len(posts_from_vk)),
+                            total,
+                            newest_id,
+                        )
+
+            if self._budget_spent:
+                break
+            # If some posts were deleted, there are more new posts than
+            # the difference of totals, so fetching goes on until cached ones.
+            next_offset = posts_needed + (-posts_needed) % posts_per_call
+            if not reached_cached:
+                posts_needed = min(
+                    total, posts_needed + settings.POSTS_CACHE_REFRESH_WINDOW
+                )
+        logger.info("End refreshing cached posts from vk.com/%s...", self.vk_domain)
+
+        # The crawl is finished by a repeated request, posts fetched so far
+        # are given from cache meanwhile.
+        if self._budget_spent:
+            logger.info("Request budget of vk.com/%s is spent", self.vk_domain)
+            return
+        if self._missing:
+            logger.warning(
+                "Portions of vk.com/%s failed: %s", self.vk_domain, self._missing
+            )
+            return
+
+        # Posts of the domain are fetched anew by full crawls.
+        if cached is not None and oldest_id is not None:
+            await asyncio.to_thread(
+                post_cache.delete_missing_posts, self.vk_domain, oldest_id, fetched_ids
+            )
+            await asyncio.to_thread(post_cache.stop_tracking, self.vk_domain, oldest_id)
+        await asyncio.to_thread(
+            post_cache.finish_refresh, self.vk_domain, total, newest_id
+        )
+
+
+def _first_posts_count(
+    results: dict[int, list], missing: list[tuple[int, int]] = ()
+) -> int:
+    """
+    Amount of posts fetched without gaps from the top of the wall
+    (portions that failed count as fetched).
+    """
+
+    # Every portion starts right after the posts of the previous ones.
+    missing = dict(missing)
+    count = 0
+    while True:
+        if results.get(count):
+            count += len(results[count])
+        elif count in missing:
+            count += missing[count]
+        else:
+            return count
@@ -0,0 +1,281 @@
+"""
+Columnar in-memory index of fetched posts of a domain, so posts can be
+filtered (dates, likes, photos/videos) and ranked (also within every
+day/week/month/year) without fetching the wall again.
+"""
+import datetime
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from dataclasses import dataclass
+from itertools import islice
+from typing import Iterable, Iterator
+
+from services.posts.normalization import PostData
+from services.posts.post_cache import PHOTOS, VIDEOS, post_id
+
+BUCKETS = ("day", "week", "month", "year")
+
+# Rows of a date range smaller than this share of the index are ranked
+# by scanning them, bigger ones by walking rows in order of likes.
+_SCAN_SHARE = 1 / 16
+
+
+@dataclass(frozen=True)
+class PostFilters:
+    """Which posts are wanted; "per" ranks posts within every time bucket."""
+
+    since: datetime.datetime | None = None
+    until: datetime.datetime | None = None
+    min_likes: int = 0
+    with_photos: bool = False
+    with_videos: bool = False
+    per: str | None = None  # One of "BUCKETS".
+
+
+class PostIndex:
+    """
+    Posts as columns of dates, likes and ids ordered by date, masks of rows
+    with photos and videos (a byte per row) and rows ordered by likes.
+    Date ranges are found by binary search, the rest of filters go over
+    the columns and masks, and the most liked posts are taken from the top
+    of rows ordered by likes. Posts themselves are kept only if they are
+    given, otherwise just the matching ones are taken from cache by ids.
+    """
+
+    def __init__(
+        self,
+        rows: list[tuple[int, int, int, int]],
+        posts: list[PostData] | None = None,
+        version: tuple[str, float] | None = None,
+    ):
+        """
+        Index of (date, id, likes, attachments) rows in any order (and posts
+        of the rows), "version" is of cached posts the rows are taken from.
+        """
+
+        self.version = version
+        order = sorted(range(len(rows)), key=lambda row: rows[row])
+        self.dates = array("q")
+        self.ids = array("q")
+        self.likes = array("q")
+        photos, videos = bytearray(), bytearray()
+        for row in order:
+            date, id_, likes, attachments = rows[row]
+            self.dates.append(date)
+            self.ids.append(id_)
+            self.likes.append(likes)
+            photos.append(bool(attachments & PHOTOS))
+            videos.append(bool(attachments & VIDEOS))
+        self.photos, self.videos = bytes(photos), bytes(videos)
+        self.posts = None if posts is None else [posts[row] for row in order]
+
+        # Rows by likes, the most liked first (ties by ids, like in cache),
+        # and negated likes of them, so rows with enough likes are their top.
+        self._by_likes = array(
+            "i",
+            sorted(
+                range(len(rows)),
+                key=lambda row: (self.likes[row], self.ids[row]),
+                reverse=True,
+            ),
+        )
+        self._by_likes_likes = array("q", [-self.likes[row] for row in self._by_likes])
+        # Places of rows in "_by_likes".
+        self._places = array("i", bytes(4 * len(rows)))
+        for place, row in enumerate(self._by_likes):
+            self._places[row] = place
+
+    @classmethod
+    def from_posts(cls, posts: list[PostData]) -> "PostIndex":
+        """Index that keeps the posts."""
+
+        rows = [
+            (
+                int(post["date"].timestamp()),
+                post_id(post),
+                post["likes"],
+                (PHOTOS if post["photos"] else 0) | (VIDEOS if post["videos"] else 0),
+            )
+            for post in posts
+        ]
+        return cls(rows, posts)
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def query(
+        self, filters: PostFilters, amount: int, sort_by_likes: bool
+    ) -> list[int]:
+        """
+        Rows of posts matching "filters", the most liked or the newest first,
+        "amount" of them (0 - all) or "amount" in every bucket of "filters.per"
+        (the newest buckets first).
+        """
+
+        start, stop = 0, len(self)
+        if filters.since is not None:
+            start = bisect_left(self.dates, _timestamp(filters.since))
+        if filters.until is not None:
+            stop = bisect_right(self.dates, _timestamp(filters.until))
+
+        mask = self._attachments_mask(filters)
+        if filters.per is not None:
+            rows = []
+            for bucket_start, bucket_stop in self._bucket_ranges(
+                start, stop, filters.per
+            ):
+                rows += self._rank(
+                    bucket_start, bucket_stop, filters, mask, amount, sort_by_likes
+                )
+            return rows
+        return self._rank(start, stop, filters, mask, amount, sort_by_likes)
+
+    def posts_of(self, rows: list[int]) -> list[PostData]:
+        """Posts of the rows (only if posts are kept)."""
+        return [self.posts[row] for row in rows]
+
+    def ids_of(self, rows: list[int]) -> list[int]:
+        return [self.ids[row] for row in rows]
+
+    def _attachments_mask(self, filters: PostFilters) -> bytes | None:
+        """A byte per row, non-zero if the row has wanted attachments."""
+
+        if filters.with_photos and filters.with_videos:
+            return bytes(
+                photos and videos for photos, videos in zip(self.photos, self.videos)
+            )
+        if filters.with_photos:
+            return self.photos
+        if filters.with_videos:
+            return self.videos
+        return None
+
+    def _rank(
+        self,
+        start: int,
+        stop: int,
+        filters: PostFilters,
+        mask: bytes | None,
+        amount: int,
+        sort_by_likes: bool,
+    ) -> list[int]:
+        """
+        Rows from "start" to "stop" matching "mask" and likes filter,
+        the most liked or the newest first.
+        """
+
+        if start >= stop:
+            return []
+        if not sort_by_likes:
+            rows = self._matching(range(stop - 1, start - 1, -1), filters, mask)
+            return list(islice(rows, amount) if amount else rows)
+
+        if stop - start < len(self) * _SCAN_SHARE:
+            # Places of the matching rows in order of likes are sorted instead.
+            places = sorted(
+                self._places[row]
+                for row in self._matching(range(start, stop), filters, mask)
+            )
+            return [self._by_likes[place] for place in places[: amount or None]]
+
+        # Rows with enough likes are the top of rows ordered by likes.
+        with_likes = bisect_right(self._by_likes_likes, -filters.min_likes)
+        rows = (
+            row
+            for row in islice(self._by_likes, with_likes)
+            if start <= row < stop and (mask is None or mask[row])
+        )
+        return list(islice(rows, amount) if amount else rows)
+
+    def _matching(
+        self, rows: Iterable[int], filters: PostFilters, mask: bytes | None
+    ) -> Iterator[int]:
+        """Rows (lazily, in the same order) matching "mask" and likes filter."""
+
+        return (
+            row
+            for row in rows
+            if (mask is None or mask[row]) and self.likes[row] >= filters.min_likes
+        )
+
+    def _bucket_ranges(
+        self, start: int, stop: int, per: str
+    ) -> Iterator[tuple[int, int]]:
+        """Ranges of rows from "start" to "stop" by buckets, the newest first."""
+
+        if start >= stop:
+            return
+        moment = _bucket_start(_as_datetime(self.dates[stop - 1]), per)
+        while stop > start:
+            bucket_start = bisect_left(self.dates, int(moment.timestamp()), start, stop)
+            if bucket_start < stop:
+                yield bucket_start, stop
+            stop = bucket_start
+            moment = _previous_bucket_start(moment, per)
+
+
+def _timestamp(moment: datetime.datetime) -> int:
+    """Timestamp of the moment, naive ones are in UTC (like dates of posts)."""
+
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=datetime.timezone.utc)
+    return int(moment.timestamp())
+
+
+def _as_datetime(timestamp: int) -> datetime.datetime:
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc)
+
+
+def _bucket_start(moment: datetime.datetime, per: str) -> datetime.datetime:
+    """The start of the bucket (in UTC) that "moment" is in."""
+
+    day = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    if per == "week":
+        return day - datetime.timedelta(days=day.weekday())
+    if per == "month":
+        return day.replace(day=1)
+    if per == "year":
+        return day.replace(month=1, day=1)
+    return day
+
+
+def _previous_bucket_start(moment: datetime.datetime, per: str) -> datetime.datetime:
+    """The start of the bucket before the one starting at "moment"."""
+
+    if per == "week":
+        return moment - datetime.timedelta(days=7)
+    if per == "month":
+        return _bucket_start(moment - datetime.timedelta(days=1), "month")
+    if per == "year":
+        return moment.replace(year=moment.year - 1)
+    return moment - datetime.timedelta(days=1)
+
+
+@dataclass
+class PostIndexes:
+    """
+    Indexes of the recently requested domains (the least recently used
+    ones are dropped over "max_domains"). An index is used for "fresh_for"
+    seconds, then the domain is fetched again.
+    """
+
+    max_domains: int
+    fresh_for: float
+
+    def __post_init__(self):
+        self._indexes: OrderedDict[str, tuple[float, PostIndex]] = OrderedDict()
+
+    def get(self, domain: str) -> PostIndex | None:
+        built_at, index = self._indexes.get(domain, (0.0, None))
+        if index is None or built_at < time.time() - self.fresh_for:
+            return None
+        self._indexes.move_to_end(domain)
+        return index
+
+    def put(self, domain: str, index: PostIndex) -> None:
+        self._indexes[domain] = (time.time(), index)
+        self._indexes.move_to_end(domain)
+        while len(self._indexes) > self.max_domains:
+            self._indexes.popitem(last=False)
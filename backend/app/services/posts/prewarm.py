@@ -0,0 +1,193 @@
+"""
+Pre-warming of popular domains: requests are counted by domains,
+and cache of the most requested ones is refreshed in the background
+while VK API isn't busy, so their requests don't wait for crawls.
+"""
+import asyncio
+import logging
+import time
+
+from fastapi import HTTPException
+
+from core.config import settings
+from core.metrics import registry
+from services.posts.post_cache import get_post_cache
+from services.posts.post_fetcher import PostFetcher
+from services.vkontakte.token_pool import get_token_pool
+
+logger = logging.getLogger(__name__)
+
+PREWARMS = registry.counter(
+    "posts_prewarms_total",
+    "Refreshes of popular domains in cache by results (ok or failed).",
+    ("result",),
+)
+
+
+class CountMinSketch:
+    """
+    Approximate counts of keys in fixed memory: "depth" rows of "width"
+    counters, a key is counted in one counter of every row, and its count
+    is the smallest of them (collisions only make counts bigger).
+    """
+
+    def __init__(self, width: int, depth: int):
+        self.width = width
+        self._rows = [[0] * width for _ in range(depth)]
+
+    def _cells(self, key: str) -> list[int]:
+        return [hash((row, key)) % self.width for row in range(len(self._rows))]
+
+    def add(self, key: str) -> int:
+        """Counts the key once more and gives its count."""
+
+        count = None
+        for row, cell in zip(self._rows, self._cells(key)):
+            row[cell] += 1
+            count = row[cell] if count is None else min(count, row[cell])
+        return count
+
+    def count(self, key: str) -> int:
+        return min(row[cell] for row, cell in zip(self._rows, self._cells(key)))
+
+    def halve(self) -> None:
+        for row in self._rows:
+            row[:] = [counter // 2 for counter in row]
+
+
+class PopularDomains:
+    """
+    The most requested domains (up to "size"). Counts are halved every
+    "decay_every" requests, so domains that aren't requested anymore
+    give way to new ones.
+    """
+
+    def __init__(
+        self, size: int, width: int = 4096, depth: int = 4, decay_every: int = 40_000
+    ):
+        self.size = size
+        self.decay_every = decay_every
+        self._sketch = CountMinSketch(width, depth)
+        self._top: dict[str, int] = {}
+        self._requests = 0
+
+    def record(self, domain: str) -> None:
+        """Counts a request of the domain."""
+
+        self._requests += 1
+        if self._requests % self.decay_every == 0:
+            self._sketch.halve()
+            self._top = {domain: count // 2 for domain, count in self._top.items()}
+
+        count = self._sketch.add(domain)
+        if domain in self._top or len(self._top) < self.size:
+            self._top[domain] = count
+            return
+        if not self._top:
+            return
+        least = min(self._top, key=self._top.__getitem__)
+        if count > self._top[least]:
+            del self._top[least]
+            self._top[domain] = count
+
+    def hottest(self) -> list[str]:
+        """Popular domains, the most requested first."""
+        return sorted(self._top, key=self._top.__getitem__, reverse=True)
+
+
+class Prewarmer:
+    """
+    Every "interval" seconds refreshes cache of popular domains that got
+    stale, if requests of users during the interval left "quota_share"
+    of VK API quota, and spends at most that share itself. Its own requests
+    aren't counted as requests of users (nor as requests of domains).
+    """
+
+    def __init__(self, popular: PopularDomains, interval: float, quota_share: float):
+        self.popular = popular
+        self.interval = interval
+        self.quota_share = quota_share
+        self._task: asyncio.Task | None = None
+        self._requests = 0  # VK API requests made by pre-warming.
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _run(self) -> None:
+        token_pool = get_token_pool()
+        requests_seen, checked_at = token_pool.requests, time.monotonic()
+        while True:
+            await asyncio.sleep(self.interval)
+
+            now = time.monotonic()
+            users_requests = token_pool.requests - requests_seen - self._requests
+            users_rate = users_requests / (now - checked_at)
+            requests_seen, checked_at, self._requests = token_pool.requests, now, 0
+
+            share = token_pool.capacity * self.quota_share
+            if users_rate <= token_pool.capacity - share:
+                await self.warm_up(budget=share * self.interval)
+            else:
+                logger.debug("VK API is busy, popular domains aren't pre-warmed")
+
+    async def warm_up(self, budget: float) -> None:
+        """
+        Refreshes cache of popular domains (the most requested first)
+        until "budget" of VK API requests is spent. Refreshing of a domain
+        stops when the budget is spent too, the next ones go on with it.
+        """
+
+        for domain in self.popular.hottest():
+            if budget <= 0:
+                break
+            # Stale cache of the domain is refreshed by any request
+            # that is answered by cache.
+            post_fetcher = PostFetcher(
+                domain, 1, sort_by_likes=True, request_budget=budget
+            )
+            try:
+                await post_fetcher.fetch_posts()
+            except HTTPException as exc:
+                logger.warning("Domain %s isn't pre-warmed: %s", domain, exc.detail)
+                PREWARMS.inc(("failed",))
+            except Exception:
+                logger.exception("Domain %s isn't pre-warmed", domain)
+                PREWARMS.inc(("failed",))
+            else:
+                PREWARMS.inc(("ok",))
+            budget -= post_fetcher.requests
+            self._requests += post_fetcher.requests
+
+
+_popular_domains = PopularDomains(settings.PREWARM_DOMAINS)
+_prewarmer: Prewarmer | None = None
+
+
+def record_request(domain: str) -> None:
+    """Counts a request of the domain (already compressed by "PostFetcher")."""
+    _popular_domains.record(domain)
+
+
+def start_prewarmer() -> None:
+    """Starts pre-warming if it's enabled and there is cache to warm up."""
+
+    global _prewarmer
+    if not settings.PREWARM_DOMAINS or get_post_cache() is None:
+        return
+    _prewarmer = Prewarmer(
+        _popular_domains, settings.PREWARM_INTERVAL, settings.PREWARM_QUOTA_SHARE
+    )
+    _prewarmer.start()
+
+
+async def stop_prewarmer() -> None:
+    global _prewarmer
+    if _prewarmer is not None:
+        await _prewarmer.stop()
+    _prewarmer = None
@@ -0,0 +1,66 @@
+"""
+In-process LRU of serialized responses with posts by their ETags,
+so repeated requests of popular domains skip reading and serializing
+posts (and compressing them) altogether.
+"""
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+from core.compression import compress
+
+
+@dataclass
+class CachedBody:
+    """Serialized response and its compressed copies by encodings."""
+
+    body: bytes
+    encoded: dict[str, bytes] = field(default_factory=dict)
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + sum(len(body) for body in self.encoded.values())
+
+
+class ResponseCache:
+    """
+    Bodies of responses by ETags, the least recently used ones
+    are dropped over "max_bytes".
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._bodies: OrderedDict[str, CachedBody] = OrderedDict()
+        self._size = 0
+
+    def get(self, etag: str) -> CachedBody | None:
+        cached = self._bodies.get(etag)
+        if cached is not None:
+            self._bodies.move_to_end(etag)
+        return cached
+
+    def put(self, etag: str, body: bytes) -> CachedBody:
+        self._drop(etag)
+        cached = self._bodies[etag] = CachedBody(body)
+        self._size += cached.size
+        self._evict()
+        return cached
+
+    def encoded(self, etag: str, cached: CachedBody, encoding: str) -> bytes:
+        """Body of the response compressed by "encoding", compressed once."""
+
+        if encoding not in cached.encoded:
+            cached.encoded[encoding] = compress(cached.body, encoding)
+            if self._bodies.get(etag) is cached:
+                self._size += len(cached.encoded[encoding])
+                self._evict()
+        return cached.encoded[encoding]
+
+    def _drop(self, etag: str) -> None:
+        cached = self._bodies.pop(etag, None)
+        if cached is not None:
+            self._size -= cached.size
+
+    def _evict(self) -> None:
+        while self._size > self.max_bytes and self._bodies:
+            etag = next(iter(self._bodies))
+            self._drop(etag)
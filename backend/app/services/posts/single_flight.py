@@ -0,0 +1,150 @@
+"""
+Coalescing of identical crawls: concurrent requests for the same domain
+share one in-flight crawl instead of repeating it.
+"""
+
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable
+
+from services.posts.normalization import PostData
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class CrawlPlan:
+    """
+    Which posts a crawl gives: "amount" (0 - all) newest or most liked ones
+    or the top of "trending" ranking (see "post_cache.TRENDING").
+    """
+
+    amount: int
+    sort_by_likes: bool
+    trending: str | None = None
+
+    def covers(self, other: "CrawlPlan") -> bool:
+        """Whether posts of this plan are enough to answer "other" plan."""
+
+        if self.trending != other.trending:
+            return False
+        if self.trending is not None:
+            return self.amount == 0 or 0 < other.amount <= self.amount
+        if self.amount == 0:
+            # All posts by date can be sorted by likes as well, but not vice versa.
+            return not self.sort_by_likes or other.sort_by_likes
+        return (
+            self.sort_by_likes == other.sort_by_likes
+            and 0 < other.amount <= self.amount
+        )
+
+    def view(self, posts: list[PostData], source: "CrawlPlan") -> list[PostData]:
+        """Posts of this plan made from posts crawled by "source" plan."""
+
+        if self.trending is None and self.sort_by_likes and not source.sort_by_likes:
+            posts = sorted(posts, key=lambda p: p["likes"], reverse=True)
+        if self.amount:
+            return posts[: self.amount]
+        return list(posts)
+
+
+@dataclass
+class CrawlResult:
+    """Posts given by a crawl."""
+
+    posts: list[PostData]
+    # (offset, count) portions of the wall that failed to be fetched.
+    missing: list[tuple[int, int]] = field(default_factory=list)
+
+
+def _no_progress() -> tuple[int, int]:
+    return 0, 0
+
+
+@dataclass(eq=False)
+class _Flight:
+    """
+    Crawl in progress and requests waiting for it. "progress" gives posts
+    fetched so far and posts in the domain, so every waiter can tell them.
+    """
+
+    plan: CrawlPlan
+    task: asyncio.Task
+    progress: Callable[[], tuple[int, int]] = _no_progress
+    waiters: int = 0
+
+    async def wait(self, plan: CrawlPlan) -> CrawlResult:
+        """Posts of "plan" when the crawl is done."""
+
+        self.waiters += 1
+        try:
+            result = await asyncio.shield(self.task)
+        finally:
+            self.waiters -= 1
+            if not self.waiters and not self.task.done():
+                self.task.cancel()
+
+        return CrawlResult(plan.view(result.posts, self.plan), list(result.missing))
+
+
+@dataclass
+class SingleFlight:
+    """
+    Runs one crawl of a domain at a time for every plan: request joins
+    an in-flight crawl if its posts cover the request.
+    The crawl is cancelled only when all its waiters are gone.
+    """
+
+    _flights: dict[str, list[_Flight]] = field(default_factory=dict)
+
+    def in_flight(self, domain: str) -> int:
+        """Number of crawls of the domain in progress."""
+        return len(self._flights.get(domain, []))
+
+    def join(
+        self,
+        domain: str,
+        plan: CrawlPlan,
+        crawl: Callable[[], Awaitable[CrawlResult]],
+        progress: Callable[[], tuple[int, int]] = _no_progress,
+    ) -> _Flight:
+        """
+        In-flight crawl that covers "plan" or a new one made by "crawl" call
+        (its "progress" tells how far it is).
+        """
+
+        flight = self._find(domain, plan)
+        if flight is None:
+            flight = _Flight(plan, asyncio.ensure_future(crawl()), progress)
+            self._flights.setdefault(domain, []).append(flight)
+            flight.task.add_done_callback(lambda _: self._forget(domain, flight))
+        else:
+            logger.info("Joining in-flight crawl of vk.com/%s...", domain)
+        return flight
+
+    async def run(
+        self,
+        domain: str,
+        plan: CrawlPlan,
+        crawl: Callable[[], Awaitable[CrawlResult]],
+    ) -> CrawlResult:
+        """Posts of "plan" from a shared crawl or from a new "crawl" call."""
+        return await self.join(domain, plan, crawl).wait(plan)
+
+    def _find(self, domain: str, plan: CrawlPlan) -> _Flight | None:
+        for flight in self._flights.get(domain, []):
+            if flight.plan.covers(plan) and not flight.task.done():
+                return flight
+        return None
+
+    def _forget(self, domain: str, flight: _Flight) -> None:
+        # Retrieving exception, so nobody complains that it was never retrieved.
+        if not flight.task.cancelled():
+            flight.task.exception()
+
+        flights = self._flights.get(domain, [])
+        if flight in flights:
+            flights.remove(flight)
+        if not flights:
+            self._flights.pop(domain, None)
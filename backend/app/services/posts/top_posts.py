@@ -0,0 +1,54 @@
+"""
+Streaming selection of the most liked posts.
+"""
+import heapq
+import logging
+from dataclasses import dataclass, field
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class TopPosts:
+    """
+    Keeps only "size" most liked posts from VK while portions of posts
+    are coming, so memory doesn't depend on the size of the wall.
+    Posts with equal likes keep their order on the wall.
+    """
+
+    size: int
+    # Increases every time kept posts change.
+    version: int = 0
+
+    # Min-heap of (likes, -position on the wall, post from VK).
+    _heap: list[tuple[int, int, dict]] = field(default_factory=list)
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def push(self, position: int, post_from_vk: dict) -> None:
+        try:
+            candidate = (post_from_vk["likes"]["count"], -position, post_from_vk)
+        except KeyError as exc:
+            logger.error("No key %s for post: %s", exc, post_from_vk)
+            return
+
+        if len(self._heap) < self.size:
+            heapq.heappush(self._heap, candidate)
+        elif candidate[:2] > self._heap[0][:2]:
+            heapq.heapreplace(self._heap, candidate)
+        else:
+            return
+        self.version += 1
+
+    def extend(self, offset: int, posts_from_vk: list[dict]) -> None:
+        """Pushes portion of posts that starts at "offset" on the wall."""
+
+        for index, post_from_vk in enumerate(posts_from_vk):
+            self.push(offset + index, post_from_vk)
+
+    def best(self) -> list[dict]:
+        """Kept posts, the most liked first."""
+
+        ordered = sorted(self._heap, key=lambda c: c[:2], reverse=True)
+        return [post_from_vk for _, _, post_from_vk in ordered]
@@ -0,0 +1,149 @@
+"""
+Concurrency control for requests to VK API.
+Global limit of simultaneous requests is shared fairly between crawls,
+and every crawl creates its tasks lazily through a bounded worker pool.
+"""
+import asyncio
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Hashable,
+    Iterable,
+    TypeVar,
+)
+
+from core.config import settings
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class FairScheduler:
+    """
+    Limits simultaneous requests for the whole application.
+    When the limit is reached, free slots are handed to waiting lanes
+    (e.g. crawls of different domains) in turn, so a huge crawl
+    can't starve small ones.
+    Doesn't hold any event loop primitives between calls,
+    so it can be created at import time.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._active = 0
+        self._lanes: OrderedDict[Hashable, deque[asyncio.Future]] = OrderedDict()
+
+    @property
+    def active(self) -> int:
+        """Number of occupied slots."""
+        return self._active
+
+    @property
+    def waiting(self) -> int:
+        """Number of requests waiting for a slot."""
+        return sum(len(waiters) for waiters in self._lanes.values())
+
+    async def acquire(self, lane: Hashable = None) -> None:
+        """Waits for a free slot in turn with other lanes."""
+
+        if self._active < self.limit and not self._lanes:
+            self._active += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._lanes.setdefault(lane, deque()).append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Slot was already handed over, giving it to somebody else.
+                self.release()
+            else:
+                self._forget(lane, future)
+            raise
+
+    def release(self) -> None:
+        """Hands the slot to the next lane or frees it."""
+
+        while self._lanes:
+            lane, waiters = next(iter(self._lanes.items()))
+            future = waiters.popleft()
+            if waiters:
+                self._lanes.move_to_end(lane)
+            else:
+                del self._lanes[lane]
+            if not future.done():
+                future.set_result(None)
+                return
+
+        self._active -= 1
+
+    def _forget(self, lane: Hashable, future: asyncio.Future) -> None:
+        waiters = self._lanes.get(lane)
+        if waiters is None or future not in waiters:
+            return
+        waiters.remove(future)
+        if not waiters:
+            del self._lanes[lane]
+
+    @asynccontextmanager
+    async def slot(self, lane: Hashable = None) -> AsyncIterator[None]:
+        await self.acquire(lane)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+async def bounded_map(
+    func: Callable[[T], Awaitable[R]],
+    items: Iterable[T],
+    limit: int,
+) -> AsyncIterator[R]:
+    """
+    Applies "func" to "items" with at most "limit" calls at once
+    and yields results as they are completed.
+    Items are taken lazily, so only "limit" coroutines exist at a time.
+    Workers are added as items are taken, so a big "limit" for a few items
+    (even of a generator) doesn't make more workers than items (and one).
+    When iteration stops early, calls in progress are cancelled.
+    """
+
+    items = iter(items)
+    queue: asyncio.Queue = asyncio.Queue()
+    worker_done = object()
+    workers: list[asyncio.Task] = []
+
+    async def worker() -> None:
+        try:
+            for item in items:
+                if len(workers) < limit:
+                    workers.append(asyncio.create_task(worker()))
+                queue.put_nowait((await func(item), None))
+        except Exception as exc:
+            queue.put_nowait((None, exc))
+        finally:
+            queue.put_nowait(worker_done)
+
+    workers.append(asyncio.create_task(worker()))
+    try:
+        finished = 0
+        while finished < len(workers):
+            message = await queue.get()
+            if message is worker_done:
+                finished += 1
+                continue
+            result, exc = message
+            if exc is not None:
+                raise exc
+            yield result
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+
+scheduler = FairScheduler(settings.VKAPI_CONCURRENCY_LIMIT)
@@ -0,0 +1,71 @@
+"""
+Client-side rate limiting for VK API requests: token bucket sized
+to VK quota and exponential backoff with jitter for "too many requests" errors.
+"""
+
+import asyncio
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable
+
+from core.config import settings
+
+
+@dataclass
+class RateLimiter:
+    """Token bucket for requests made with one access token."""
+
+    rate: float  # Requests per second.
+    capacity: float  # Maximum burst of requests.
+    clock: Callable[[], float] = time.monotonic
+    sleep: Callable[[float], Awaitable] = asyncio.sleep
+    rng: random.Random = field(default_factory=random.Random)
+
+    _tokens: float = field(init=False)
+    _updated_at: float = field(init=False)
+
+    def __post_init__(self):
+        self._tokens = self.capacity
+        self._updated_at = self.clock()
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated_at) * self.rate
+        )
+        self._updated_at = now
+
+    @property
+    def tokens(self) -> float:
+        """Requests that can be made right now without waiting."""
+        self._refill()
+        return self._tokens
+
+    async def acquire(self) -> None:
+        """
+        Waits until request can be made.
+        Token is reserved before waiting, so waiters are served in order.
+        """
+
+        self._refill()
+        self._tokens -= 1
+        if self._tokens < 0:
+            await self.sleep(-self._tokens / self.rate)
+
+    def backoff_delay(self, attempt: int) -> float:
+        """Exponential backoff with full jitter for retry number "attempt"."""
+
+        ceiling = min(
+            settings.VKAPI_BACKOFF_MAX, settings.VKAPI_BACKOFF_BASE * 2**attempt
+        )
+        return self.rng.uniform(0, ceiling)
+
+    def drain(self) -> None:
+        """
+        Takes away the burst after "too many requests" error,
+        so other requests with the same token slow down too.
+        """
+
+        self._refill()
+        self._tokens = min(self._tokens, 0)
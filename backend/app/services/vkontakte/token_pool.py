@@ -0,0 +1,153 @@
+"""
+Pool of VK API access tokens.
+Each request goes to the token with the most remaining budget,
+tokens that hit VK limits are temporarily quarantined.
+"""
+
+import asyncio
+import logging
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable
+
+from core.config import settings
+from services.vkontakte.rate_limiter import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PooledToken:
+    """Access token with its rate limiter and usage counters."""
+
+    value: str
+    limiter: RateLimiter
+    quarantined_until: float = 0
+
+    # Usage counters.
+    requests: int = 0
+    errors: dict[int, int] = field(default_factory=dict)
+    quarantines: int = 0
+
+    @property
+    def name(self) -> str:
+        """Token representation that is safe to show."""
+        return self.value[:4] + "..." + self.value[-4:]
+
+
+class TokenPool:
+    """Spreads VK API requests among several access tokens."""
+
+    def __init__(
+        self,
+        tokens: list[str],
+        rate: float | None = None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Awaitable] = asyncio.sleep,
+        rng: random.Random | None = None,
+    ):
+        rate = rate or settings.VKAPI_REQUESTS_PER_SECOND
+        self.rate = rate
+        self.clock = clock
+        self.sleep = sleep
+        self._tokens = {
+            token: PooledToken(
+                value=token,
+                limiter=RateLimiter(
+                    rate=rate,
+                    capacity=rate,
+                    clock=clock,
+                    sleep=sleep,
+                    rng=rng or random.Random(),
+                ),
+            )
+            for token in tokens
+        }
+
+    def _available(self) -> list[PooledToken]:
+        now = self.clock()
+        return [t for t in self._tokens.values() if t.quarantined_until <= now]
+
+    @property
+    def requests(self) -> int:
+        """Requests made with all tokens so far."""
+        return sum(t.requests for t in self._tokens.values())
+
+    @property
+    def capacity(self) -> float:
+        """Requests per second all tokens are allowed to make."""
+        return self.rate * len(self._tokens)
+
+    def has_available(self) -> bool:
+        """Whether there is a token that is not quarantined."""
+        return bool(self._available())
+
+    async def acquire(self) -> PooledToken:
+        """
+        Gives the token with the most remaining budget,
+        waiting for rate limit (and quarantine, if all tokens are in it).
+        """
+
+        while True:
+            available = self._available()
+            if available:
+                break
+            release_at = min(t.quarantined_until for t in self._tokens.values())
+            await self.sleep(release_at - self.clock())
+
+        token = max(available, key=lambda t: t.limiter.tokens)
+        token.requests += 1
+        await token.limiter.acquire()
+        return token
+
+    def report_error(self, value: str, error_code: int, attempt: int = 0) -> None:
+        """Counts VK error for the token and quarantines it if needed."""
+
+        token = self._tokens.get(value)
+        if token is None:
+            return
+
+        token.errors[error_code] = token.errors.get(error_code, 0) + 1
+        if error_code == 6:
+            duration = token.limiter.backoff_delay(attempt)
+            token.limiter.drain()
+        elif error_code in settings.VKAPI_TOKEN_QUARANTINE:
+            duration = settings.VKAPI_TOKEN_QUARANTINE[error_code]
+            logger.warning(
+                "Token %s is quarantined for %s s (error %s)",
+                token.name,
+                duration,
+                error_code,
+            )
+        else:
+            return
+
+        token.quarantines += 1
+        token.quarantined_until = max(token.quarantined_until, self.clock() + duration)
+
+    def usage(self) -> dict[str, dict]:
+        """Usage counters of every token."""
+
+        now = self.clock()
+        return {
+            token.name: {
+                "requests": token.requests,
+                "errors": dict(token.errors),
+                "quarantines": token.quarantines,
+                "quarantined": token.quarantined_until > now,
+            }
+            for token in self._tokens.values()
+        }
+
+
+_pool: TokenPool | None = None
+
+
+def get_token_pool() -> TokenPool:
+    """Token pool shared by all requests to VK API."""
+
+    global _pool
+    if _pool is None:
+        _pool = TokenPool(settings.VKAPI_TOKENS)
+    return _pool
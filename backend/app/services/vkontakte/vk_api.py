@@ -1,38 +1,174 @@
 import asyncio
 import logging
+import time
+from contextlib import asynccontextmanager
 from dataclasses import dataclass, field
+from typing import AsyncIterator, Awaitable, Callable, Hashable
 
 import aiohttp
 import fastapi as _fastapi
 
 from core.config import settings
+from core.metrics import registry
+from services.vkontakte import json_codec
+from services.vkontakte.concurrency import scheduler
+from services.vkontakte.token_pool import get_token_pool
 
-logging.basicConfig(**settings.LOGGING_STANDARD_PARAMS)
 logger = logging.getLogger(__name__)
 
-sem = asyncio.Semaphore(100)
+REQUEST_SECONDS = registry.histogram(
+    "vkapi_request_duration_seconds",
+    "Duration of requests to VK API by methods.",
+    ("method",),
+)
+RESPONSE_BYTES = registry.histogram(
+    "vkapi_response_bytes",
+    "Size of VK API responses by methods.",
+    ("method",),
+    buckets=tuple(1024 * 4**power for power in range(10)),
+)
+SLOT_WAIT_SECONDS = registry.histogram(
+    "vkapi_slot_wait_seconds",
+    "Time requests to VK API wait for a free slot of the concurrency limit.",
+)
+ERRORS = registry.counter(
+    "vkapi_errors_total",
+    "Errors given by VK API by methods and error codes.",
+    ("method", "code"),
+)
+RETRIES = registry.counter(
+    "vkapi_retries_total",
+    "Requests to VK API repeated after errors by methods.",
+    ("method",),
+)
+
+# Application-scoped session, opened at startup and closed at shutdown.
+_session: aiohttp.ClientSession | None = None
+_session_loop: asyncio.AbstractEventLoop | None = None
+
+
+def _create_connector() -> aiohttp.TCPConnector:
+    """Creates connector that keeps connections to VK API alive between requests."""
+
+    return aiohttp.TCPConnector(
+        limit=settings.VKAPI_CONNECTIONS_LIMIT,
+        limit_per_host=settings.VKAPI_CONNECTIONS_PER_HOST,
+        keepalive_timeout=settings.VKAPI_KEEPALIVE_TIMEOUT,
+        ttl_dns_cache=settings.VKAPI_DNS_CACHE_TTL,
+    )
+
+
+async def open_session() -> aiohttp.ClientSession:
+    """Opens the shared session for VK API requests (if it's not opened yet)."""
+
+    global _session, _session_loop
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(connector=_create_connector())
+        _session_loop = asyncio.get_running_loop()
+    return _session
+
+
+async def close_session() -> None:
+    """Closes the shared session for VK API requests."""
+
+    global _session
+    if _session is not None:
+        await _session.close()
+    _session = None
+
+
+@asynccontextmanager
+async def _session_scope() -> AsyncIterator[aiohttp.ClientSession]:
+    """
+    Gives the shared session if application opened it in the running loop,
+    otherwise a temporary one (e.g. for scripts and tests).
+    """
+
+    if (
+        _session is not None
+        and not _session.closed
+        and _session_loop is asyncio.get_running_loop()
+    ):
+        yield _session
+        return
+
+    async with aiohttp.ClientSession(connector=_create_connector()) as session:
+        yield session
 
 
-async def vk_asynchronous_request(url: str, params: dict, **kwargs):
-    """Perform a custom asynchronous request to VK API."""
-
-    async with sem:
-        async with aiohttp.ClientSession() as session:
+@dataclass
+class VKResponse:
+    """Response of VK API and the size of its body in bytes."""
+
+    data: dict
+    size: int
+
+
+class VKExecuteError(Exception):
+    """VK failed to run the code of "/execute" method (e.g. response is too big)."""
+
+
+async def vk_asynchronous_request(
+    url: str, params: dict, lane: Hashable = None, **kwargs
+):
+    """
+    Perform a custom asynchronous request to VK API.
+    Requests of the same "lane" (e.g. one crawl) share their turn
+    for free slots with other lanes.
+    """
+
+    response = await vk_request(url, params, lane, **kwargs)
+    return response.data
+
+
+async def vk_request(
+    url: str,
+    params: dict,
+    lane: Hashable = None,
+    parse: Callable[[bytes], Awaitable[dict]] | None = None,
+    **kwargs,
+) -> VKResponse:
+    """
+    The same as "vk_asynchronous_request", but gives the response size too.
+    Response body can be decoded by custom "parse" function.
+    """
+
+    token_pool = get_token_pool()
+    method = url.rsplit("/", 1)[-1]
+
+    waiting_since = time.perf_counter()
+    async with scheduler.slot(lane):
+        SLOT_WAIT_SECONDS.observe(time.perf_counter() - waiting_since)
+        async with _session_scope() as session:
+            attempt = 0
             while True:
-                async with session.get(url=url, params=params) as response:
-                    resp_json = await response.json()
+                token = await token_pool.acquire()
+                token_params = params | {"access_token": token.value}
+                started = time.perf_counter()
+                async with session.get(url=url, params=token_params) as response:
+                    body = await response.read()
+                REQUEST_SECONDS.observe(time.perf_counter() - started, (method,))
+                RESPONSE_BYTES.observe(len(body), (method,))
+                if parse is None:
+                    resp_json = json_codec.loads(body)
+                else:
+                    resp_json = await parse(body)
 
                 if "error" in resp_json:
+                    ERRORS.inc((method, resp_json["error"].get("error_code")))
                     error = VKError(
                         resp_json["error"],
-                        params=params | kwargs,
+                        params=token_params | kwargs,
+                        attempt=attempt,
                     )
                     await error.handle_error()
+                    RETRIES.inc((method,))
+                    attempt += 1
                     continue
 
                 break
 
-    return resp_json
+    return VKResponse(resp_json, len(body))
 
 
 @dataclass
@@ -43,17 +179,40 @@ class VKError:
     error: dict
     # Custom request parameters that were in context at the request time.
     params: dict = field(default_factory=dict)
+    # How many times the request has been already retried.
+    attempt: int = 0
 
     async def handle_error(self) -> None:
         """Check if the error is critical and raises an exception if it is."""
 
-        # Too many requests per second.
-        if self.error["error_code"] == 6:
-            logger.debug(self.error["error_msg"])
-            await asyncio.sleep(0)
+        token_pool = get_token_pool()
+        token_pool.report_error(
+            self.params.get("access_token", ""),
+            self.error["error_code"],
+            self.attempt,
+        )
+
+        # Too many requests per second (token pool postpones next request)
+        # or token can't be used for a while, but there are other tokens.
+        if self.error["error_code"] == 6 or (
+            self.error["error_code"] in settings.VKAPI_TOKEN_QUARANTINE
+            and token_pool.has_available()
+        ):
+            logger.debug("%s", self.error["error_msg"])
+            if self.attempt >= settings.VKAPI_MAX_RETRIES:
+                logger.error("Retries are exhausted: %s", self.error["error_msg"])
+                raise _fastapi.HTTPException(
+                    status_code=503,
+                    detail="VK API перегружен запросами, попробуйте позже.",
+                )
 
             return
 
+        # Runtime error of VK Script code.
+        if self.error["error_code"] == 13:
+            logger.warning("%s", self.error["error_msg"])
+            raise VKExecuteError(self.error["error_msg"])
+
         self._handle_critical_error()
 
     def _handle_critical_error(self):
@@ -61,7 +220,7 @@ class VKError:
 
         # Specific critical errors.
         if self.error["error_code"] == 100:
-            logger.info(self.error["error_msg"] + ", " + str(self.params))
+            logger.info("%s, %s", self.error["error_msg"], self.params)
             detail = self.error["error_msg"]
             if (
                 "owner_id is undefined" in self.error["error_msg"]
@@ -73,5 +232,5 @@ class VKError:
             raise _fastapi.HTTPException(status_code=404, detail=detail)
 
         # Unexpected critical errors.
-        logger.error(self.error["error_msg"])
+        logger.error("%s", self.error["error_msg"])
         raise _fastapi.HTTPException(status_code=500, detail=self.error["error_msg"])
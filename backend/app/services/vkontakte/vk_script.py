@@ -4,10 +4,16 @@ These scripts can be used as "code" parameters
 for URL /execute in VK API.
 """
 
+from dataclasses import dataclass, field
 from string import Template
+from typing import Iterator
+
+from core.config import settings
 
 # Gets posts from VK domain using cycle with.
 # 25 is maximum iterations API allows.
+# If a call fails, the cycle stops and the posts fetched so far are returned
+# (VK adds "execute_errors" to such response).
 get_wall_post_template = Template(
     """
     var offset_global = $offset;
@@ -15,22 +21,203 @@ get_wall_post_template = Template(
     var items = [];
     var count = 0;
 
-    var i = 0; 
-    while (i != $execution_times) { 
+    var i = 0;
+    while (i != $execution_times) {
         var data = API.wall.get({
             "count": $posts_per_portion,
-            "offset": offset_global + offset_cycle, 
+            "offset": offset_global + offset_cycle,
             "domain": "$domain"
-        }); 
-        items = items + data["items"];
-        count = data["count"];
-        offset_cycle = offset_cycle + 100;
-        i = i + 1; 
-    }; 
+        });
+        if (data) {
+            items = items + data["items"];
+            count = data["count"];
+            offset_cycle = offset_cycle + $posts_per_portion;
+            i = i + 1;
+        } else {
+            i = $execution_times;
+        }
+    };
 
     return {
-    "count": count, 
+    "count": count,
     "items": items
     };
     """
 )
+
+# The same as "get_wall_post_template", but only fields the service uses
+# are returned, as columns (see "wall_items").
+# Attachments are kept whole: trimming them needs a loop over every post,
+# and VK limits operations of the code.
+get_wall_post_columns_template = Template(
+    """
+    var offset_global = $offset;
+    var offset_cycle = 0;
+    var count = 0;
+    var pinned = 0;
+    var ids = [];
+    var owner_ids = [];
+    var dates = [];
+    var likes = [];
+    var texts = [];
+    var attachments = [];
+
+    var i = 0;
+    while (i != $execution_times) {
+        var data = API.wall.get({
+            "count": $posts_per_portion,
+            "offset": offset_global + offset_cycle,
+            "domain": "$domain"
+        });
+        if (data) {
+            var items = data["items"];
+            if (offset_global + offset_cycle == 0 && items.length > 0) {
+                if (items[0].is_pinned) {
+                    pinned = items[0].id;
+                }
+            }
+            ids = ids + items@.id;
+            owner_ids = owner_ids + items@.owner_id;
+            dates = dates + items@.date;
+            likes = likes + items@.likes@.count;
+            texts = texts + items@.text;
+            attachments = attachments + items@.attachments;
+            count = data["count"];
+            offset_cycle = offset_cycle + $posts_per_portion;
+            i = i + 1;
+        } else {
+            i = $execution_times;
+        }
+    };
+
+    return {
+    "count": count,
+    "pinned": pinned,
+    "ids": ids,
+    "owner_ids": owner_ids,
+    "dates": dates,
+    "likes": likes,
+    "texts": texts,
+    "attachments": attachments
+    };
+    """
+)
+
+# Gets amounts of posts in VK domains ("$domains" is JSON list of them)
+# by one call for every domain, 25 domains at most.
+# Amount is null if the call failed (e.g. domain is not found).
+get_wall_counts_template = Template(
+    """
+    var domains = $domains;
+    var counts = [];
+
+    var i = 0;
+    while (i != domains.length) {
+        var data = API.wall.get({"count": 1, "domain": domains[i]});
+        if (data) {
+            counts.push(data["count"]);
+        } else {
+            counts.push(null);
+        }
+        i = i + 1;
+    };
+
+    return counts;
+    """
+)
+
+_COLUMNS = ("owner_ids", "dates", "likes", "texts", "attachments")
+
+
+def wall_items(response: dict) -> list[dict] | None:
+    """
+    Posts in the format of "wall.get" items from the response of either
+    template. Gives None if columns don't match each other
+    (e.g. VK skipped missing fields), so posts can't be restored.
+    """
+
+    if "items" in response:
+        return response["items"]
+
+    ids = response["ids"]
+    if any(len(response[column]) != len(ids) for column in _COLUMNS):
+        return None
+
+    items = [
+        {
+            "id": post_id,
+            "owner_id": owner_id,
+            "date": date,
+            "likes": {"count": likes},
+            "text": text,
+            "attachments": attachments or [],
+        }
+        for post_id, owner_id, date, likes, text, attachments in zip(
+            ids, *(response[column] for column in _COLUMNS)
+        )
+    ]
+    if response["pinned"] and items and items[0]["id"] == response["pinned"]:
+        items[0]["is_pinned"] = 1
+    return items
+
+
+@dataclass
+class ExecutePlanner:
+    """
+    Chooses how many "wall.get" calls to make in one "/execute" request.
+    Starts with as many calls as VK allows, keeps responses below the size limit
+    by the observed size of posts, halves calls when VK fails to run the code
+    or gives partial results and then grows them back one by one.
+    """
+
+    posts_per_call: int = 100  # Maximum "count" of "wall.get".
+    max_calls: int = field(default_factory=lambda: settings.VKAPI_EXECUTE_MAX_CALLS)
+    max_bytes: int = field(default_factory=lambda: settings.VKAPI_EXECUTE_MAX_BYTES)
+    calls: int = 0  # Calls limit for now (0 - "max_calls").
+    bytes_per_post: float = 0.0  # Moving average of observed response sizes.
+
+    # Share of "max_bytes" that planned responses should take.
+    _size_margin = 0.8
+    # Weight of a new observation in "bytes_per_post".
+    _smoothing = 0.5
+
+    def __post_init__(self):
+        self.calls = self.calls or self.max_calls
+
+    def calls_for(self, posts: int) -> int:
+        """Calls to make in one request to fetch "posts" (or a part of them)."""
+
+        calls = self.calls
+        if self.bytes_per_post:
+            posts_fitting = self.max_bytes * self._size_margin / self.bytes_per_post
+            calls = min(calls, int(posts_fitting // self.posts_per_call))
+        needed = -(-posts // self.posts_per_call)
+        return max(1, min(calls, needed))
+
+    def portions(self, start: int, stop: int) -> Iterator[tuple[int, int]]:
+        """
+        Gives (offset, count) of posts to fetch by one request each
+        from "start" up to "stop". Portions are planned lazily, so every
+        next one takes into account responses received so far.
+        """
+
+        offset = start
+        while offset < stop:
+            count = self.calls_for(stop - offset) * self.posts_per_call
+            yield offset, count
+            offset += count
+
+    def observe(self, posts: int, size: int) -> None:
+        """Takes into account a complete response with "posts" of "size" bytes."""
+
+        if posts and self.bytes_per_post:
+            self.bytes_per_post += self._smoothing * (
+                size / posts - self.bytes_per_post
+            )
+        elif posts:
+            self.bytes_per_post = size / posts
+        self.calls = min(self.max_calls, self.calls + 1)
+
+    def back_off(self) -> None:
+        """Halves calls after a failed or partial response."""
+        self.calls = max(1, self.calls // 2)
@@ -0,0 +1,30 @@
+import httpx
+import pytest
+
+from core.config import settings
+from main import app
+
+
+@pytest.mark.asyncio
+async def test_posts_batch(vk_stub) -> None:
+    async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+        resp = await client.post(
+            f"{settings.API_V1_STR}/posts/batch",
+            json={"domains": ["first", "second"], "amount": 3, "top": 4},
+        )
+    batch = resp.json()
+
+    assert resp.status_code == 200
+    assert [domain["domain"] for domain in batch["domains"]] == ["first", "second"]
+    assert len(batch["top"]) == 4
+
+
+@pytest.mark.asyncio
+async def test_posts_batch_is_limited() -> None:
+    async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+        resp = await client.post(
+            f"{settings.API_V1_STR}/posts/batch",
+            json={"domains": [f"group{number}" for number in range(201)]},
+        )
+
+    assert resp.status_code == 422
@@ -0,0 +1,45 @@
+import httpx
+import pytest
+
+from core.config import settings
+from main import app
+
+
+@pytest.mark.asyncio
+async def test_get_posts_revalidates_cached_posts(vk_stub) -> None:
+    url = f"{settings.API_V1_STR}/posts"
+    params = {"domain": "group", "amount": 0}
+    async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+        resp = await client.get(url, params=params)
+        calls = vk_stub.calls.copy()
+        not_modified = await client.get(
+            url, params=params, headers={"If-None-Match": resp.headers["ETag"]}
+        )
+        from_memory = await client.get(
+            url, params=params, headers={"Accept-Encoding": "identity"}
+        )
+        other = await client.get(url, params={"domain": "group", "amount": 10})
+
+    assert resp.status_code == 200
+    assert resp.headers["Content-Encoding"] == "gzip"
+    assert "stale-while-revalidate=" in resp.headers["Cache-Control"]
+    assert not_modified.status_code == 304
+    assert not_modified.headers["ETag"] == resp.headers["ETag"]
+    assert "Content-Encoding" not in from_memory.headers
+    assert from_memory.content == resp.content
+    assert other.headers["ETag"] != resp.headers["ETag"]
+    assert vk_stub.calls == calls
+
+
+@pytest.mark.asyncio
+async def test_get_posts_revalidates_posts_from_vk(vk_stub) -> None:
+    url = f"{settings.API_V1_STR}/posts"
+    params = {"domain": "group", "amount": 5, "sort_by_likes": False}
+    async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+        resp = await client.get(url, params=params)
+        not_modified = await client.get(
+            url, params=params, headers={"If-None-Match": resp.headers["ETag"]}
+        )
+
+    assert resp.status_code == 200
+    assert not_modified.status_code == 304
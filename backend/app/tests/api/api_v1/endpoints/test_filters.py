@@ -0,0 +1,61 @@
+import httpx
+import pytest
+
+from app.api.api_v1.endpoints import posts
+from core.config import settings
+from main import app
+
+
+@pytest.mark.asyncio
+async def test_get_posts_with_filters(vk_stub) -> None:
+    async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+        resp = await client.get(
+            f"{settings.API_V1_STR}/posts",
+            params={"domain": "group", "min_likes": 995, "per": "day", "amount": 1},
+        )
+
+    assert resp.status_code == 200
+    assert [post["likes"] for post in resp.json()] == [997, 999]
+
+
+@pytest.mark.asyncio
+async def test_stream_posts_with_filters() -> None:
+    async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+        resp = await client.get(
+            f"{settings.API_V1_STR}/posts/stream",
+            params={"domain": "group", "with_photos": True},
+        )
+
+    assert resp.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_get_posts_with_chosen_fields(vk_stub, mocker) -> None:
+    vk_stub.text_length = 100
+    validate = mocker.spy(posts, "parse_obj_as")
+    async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+        resp = await client.get(
+            f"{settings.API_V1_STR}/posts",
+            params={
+                "domain": "group",
+                "amount": 2,
+                "fields": "text,likes",
+                "text_length": 5,
+            },
+        )
+        unknown_resp = await client.get(
+            f"{settings.API_V1_STR}/posts",
+            params={"domain": "group", "fields": "likes,views"},
+        )
+        openapi = (await client.get(f"{settings.API_V1_STR}/openapi.json")).json()
+
+    assert resp.status_code == 200
+    assert [list(post) for post in resp.json()] == [["likes", "text"]] * 2
+    assert all(len(post["text"]) == 5 for post in resp.json())
+    assert unknown_resp.status_code == 400
+    # Only the chosen fields of posts are validated.
+    assert validate.call_args.args[1] == resp.json()
+    # The response is documented as slimmed posts.
+    schema = openapi["paths"][f"{settings.API_V1_STR}/posts"]["get"]["responses"]
+    items = schema["200"]["content"]["application/json"]["schema"]["items"]
+    assert items == {"$ref": "#/components/schemas/SlimPost"}
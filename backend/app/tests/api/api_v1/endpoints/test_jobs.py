@@ -0,0 +1,51 @@
+import asyncio
+
+import httpx
+import pytest
+import pytest_asyncio
+
+from core.config import settings
+from main import app
+from services.posts import jobs
+
+
+@pytest_asyncio.fixture(autouse=True)
+async def job_manager(monkeypatch):
+    job_manager = jobs.JobManager(jobs.MemoryJobStore(), concurrency=1, ttl=60)
+    monkeypatch.setattr(jobs, "_job_manager", job_manager)
+    yield job_manager
+    await job_manager.close()
+
+
+@pytest.mark.asyncio
+async def test_posts_job(vk_stub) -> None:
+    vk_stub.walls["group"] = 2400
+    vk_stub.latency = 0.01
+
+    async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+        resp = await client.post(
+            f"{settings.API_V1_STR}/posts/jobs",
+            params={"domain": "group", "amount": 10},
+        )
+        assert resp.status_code == 202
+        job_url = f"{settings.API_V1_STR}/posts/jobs/{resp.json()['id']}"
+
+        resp = await client.get(f"{job_url}/result")
+        assert resp.status_code == 409
+
+        while (job := (await client.get(job_url)).json())["status"] != "done":
+            assert job["status"] in ("pending", "running")
+            await asyncio.sleep(0.01)
+        resp = await client.get(f"{job_url}/result")
+
+    assert job["fetched"] == job["total"] == 2400
+    assert resp.status_code == 200
+    assert len(resp.json()) == 10
+
+
+@pytest.mark.asyncio
+async def test_unknown_posts_job() -> None:
+    async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+        resp = await client.get(f"{settings.API_V1_STR}/posts/jobs/unknown")
+
+    assert resp.status_code == 404
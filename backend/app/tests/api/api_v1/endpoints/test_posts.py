@@ -1,9 +1,13 @@
 import datetime
+import json
+
+import httpx
 import pytest
 from fastapi.testclient import TestClient
 from pydantic import ValidationError
 
 from core.config import settings
+from main import app
 
 FAKE_GOOD_POSTS_CASES = [
     [
@@ -117,3 +121,63 @@ def test_get_posts_bad_posts(client: TestClient, mocker, fake_bad_posts) -> None
         assert False
     else:
         assert False
+
+
+@pytest.mark.asyncio
+async def test_stream_posts_by_date(vk_stub, monkeypatch) -> None:
+    monkeypatch.setattr(settings, "POSTS_FETCH_CONCURRENCY", 2)
+    vk_stub.walls["group"] = 2400
+
+    async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+        resp = await client.get(
+            f"{settings.API_V1_STR}/posts/stream",
+            params={"domain": "group", "amount": 1700, "sort_by_likes": False},
+        )
+    posts = [json.loads(line) for line in resp.text.splitlines()]
+
+    assert resp.status_code == 200
+    assert resp.headers["content-type"] == "application/x-ndjson"
+    assert [post["path"] for post in posts] == [
+        f"wall-1_{post_id}" for post_id in range(2400, 700, -1)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_stream_posts_ends_with_error(vk_stub, monkeypatch) -> None:
+    monkeypatch.setattr(settings, "VKAPI_EXECUTE_MAX_CALLS", 1)
+    monkeypatch.setattr(settings, "POSTS_PORTION_RETRIES", 0)
+    vk_stub.walls["group"] = 400
+    vk_stub.broken_offsets = {250}
+
+    async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+        resp = await client.get(
+            f"{settings.API_V1_STR}/posts/stream",
+            params={"domain": "group", "amount": 0, "sort_by_likes": False},
+        )
+    lines = [json.loads(line) for line in resp.text.splitlines()]
+
+    assert resp.status_code == 200
+    assert [post["path"] for post in lines[:-1]] == [
+        f"wall-1_{post_id}" for post_id in range(400, 200, -1)
+    ]
+    assert lines[-1]["error_status"] == 500
+
+
+@pytest.mark.asyncio
+async def test_stream_posts_by_likes(vk_stub) -> None:
+    vk_stub.walls["group"] = 2400
+
+    async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+        resp = await client.get(
+            f"{settings.API_V1_STR}/posts/stream",
+            params={"domain": "group", "amount": 10},
+        )
+    snapshots = [json.loads(line) for line in resp.text.splitlines()]
+
+    items = vk_stub.wall_get("group", 0, 2400)["items"]
+    items.sort(key=lambda p: p["likes"]["count"], reverse=True)
+    assert resp.status_code == 200
+    assert snapshots[-1]["fetched"] == snapshots[-1]["total"] == 2400
+    assert [post["likes"] for post in snapshots[-1]["posts"]] == [
+        p["likes"]["count"] for p in items[:10]
+    ]
@@ -0,0 +1,31 @@
+from fastapi.testclient import TestClient
+import pytest
+
+from services.posts.post_fetcher import PostFetcher
+
+
+@pytest.mark.asyncio
+async def test_metrics_count_crawl(client: TestClient, vk_stub) -> None:
+    vk_stub.walls["group"] = 300
+    await PostFetcher("group", 0).fetch_posts()
+    await PostFetcher("group", 0).fetch_posts()
+
+    resp = client.get("/metrics")
+    lines = resp.text.splitlines()
+
+    assert resp.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert any(line.startswith("posts_fetched_total ") for line in lines)
+    assert 'posts_cache_requests_total{result="hit"}' in resp.text
+    assert any(
+        line.startswith('vkapi_request_duration_seconds_count{method="execute"}')
+        for line in lines
+    )
+    assert "# TYPE posts_normalize_seconds histogram" in lines
+    assert "# TYPE posts_cache_hit_ratio gauge" in lines
+
+
+def test_request_id_is_returned(client: TestClient) -> None:
+    resp = client.get("/metrics", headers={"X-Request-ID": "abc"})
+
+    assert resp.headers["X-Request-ID"] == "abc"
+    assert client.get("/metrics").headers["X-Request-ID"]
@@ -1,9 +1,22 @@
-from typing import Generator
+from typing import AsyncGenerator, Generator
 import pytest
+import pytest_asyncio
+from aiohttp.test_utils import TestServer
 from fastapi.testclient import TestClient
 from aioresponses import aioresponses
 
 from main import app
+from benchmarks.vk_stub import VKStub
+from core.config import settings
+from services.posts import post_cache, post_fetcher
+from services.posts.post_cache import PostCache
+from services.posts.post_fetcher import PostFetcher
+from services.posts.post_index import PostIndexes
+from services.vkontakte import token_pool
+from services.vkontakte.token_pool import TokenPool
+
+# Popular domains are pre-warmed in tests only explicitly.
+settings.PREWARM_DOMAINS = 0
 
 
 @pytest.fixture(scope="module")
@@ -16,3 +29,42 @@ def client() -> Generator:
 def mock_aioresponse():
     with aioresponses() as m:
         yield m
+
+
+@pytest.fixture(autouse=True)
+def posts_cache(tmp_path, monkeypatch) -> Generator:
+    """Every test gets its own empty posts cache."""
+    cache = PostCache(
+        str(tmp_path / "posts.sqlite3"),
+        max_bytes=settings.POSTS_CACHE_MAX_BYTES,
+        ttl=settings.POSTS_CACHE_TTL,
+    )
+    monkeypatch.setattr(post_cache, "_post_cache", cache)
+    yield cache
+    cache.close()
+
+
+@pytest.fixture(autouse=True)
+def post_indexes(monkeypatch) -> PostIndexes:
+    """Every test gets its own empty indexes of walls."""
+    indexes = PostIndexes(
+        settings.POSTS_INDEX_MAX_DOMAINS, settings.POSTS_CACHE_FRESH_FOR
+    )
+    monkeypatch.setattr(post_fetcher, "_post_indexes", indexes)
+    return indexes
+
+
+@pytest_asyncio.fixture
+async def vk_stub(monkeypatch) -> AsyncGenerator[VKStub, None]:
+    """Local VK API stub that PostFetcher talks to without rate limits."""
+    stub = VKStub()
+    server = TestServer(stub.application())
+    await server.start_server()
+
+    base_url = str(server.make_url("/method/"))
+    monkeypatch.setattr(PostFetcher, "_url_wall_get", base_url + "wall.get")
+    monkeypatch.setattr(PostFetcher, "_url_execute", base_url + "execute")
+    monkeypatch.setattr(token_pool, "_pool", TokenPool(["token"], rate=1_000_000))
+
+    yield stub
+    await server.close()
@@ -0,0 +1,77 @@
+import httpx
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+import main
+from core.compression import CompressionMiddleware, negotiate
+from core.config import settings
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, encoding",
+    [
+        ("gzip, deflate", "gzip"),
+        ("deflate", None),
+        ("gzip;q=0", None),
+        ("*", "gzip"),
+        ("*;q=0.5, gzip;q=0", None),
+        ("", None),
+    ],
+)
+def test_negotiate(accept_encoding, encoding):
+    assert negotiate(accept_encoding) == encoding
+
+
+async def _big(request):
+    return PlainTextResponse("x" * 2000)
+
+
+async def _small(request):
+    return PlainTextResponse("x" * 10)
+
+
+async def _stream(request):
+    async def chunks():
+        yield b"x" * 2000
+        yield b"x" * 2000
+
+    return StreamingResponse(chunks())
+
+
+@pytest.mark.asyncio
+async def test_compression_middleware():
+    app = Starlette(
+        routes=[Route("/big", _big), Route("/small", _small), Route("/stream", _stream)]
+    )
+    app.add_middleware(CompressionMiddleware, min_bytes=1024)
+
+    async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+        big = await client.get("/big", headers={"Accept-Encoding": "gzip"})
+        small = await client.get("/small", headers={"Accept-Encoding": "gzip"})
+        stream = await client.get("/stream", headers={"Accept-Encoding": "gzip"})
+        identity = await client.get("/big", headers={"Accept-Encoding": "identity"})
+
+    assert big.headers["Content-Encoding"] == "gzip"
+    assert big.headers["Vary"] == "Accept-Encoding"
+    assert int(big.headers["Content-Length"]) < 100
+    assert big.text == "x" * 2000
+    assert "Content-Encoding" not in small.headers
+    assert "Content-Encoding" not in stream.headers
+    assert len(stream.content) == 4000
+    assert "Content-Encoding" not in identity.headers
+
+
+@pytest.mark.asyncio
+async def test_application_compresses_responses():
+    async with httpx.AsyncClient(app=main.app, base_url="http://test") as client:
+        response = await client.get(
+            f"{settings.API_V1_STR}/openapi.json",
+            headers={"Accept-Encoding": "gzip", "X-Request-ID": "abc"},
+        )
+
+    # Middlewares of the application don't hide bodies from compression.
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["X-Request-ID"] == "abc"
+    assert response.json()["info"]["title"] == settings.PROJECT_NAME
@@ -0,0 +1,33 @@
+import json
+import logging
+
+from core.logs import JSONFormatter, RequestIdFilter, SamplingFilter, request_id
+
+
+def _record(message: str, level: int = logging.INFO, *args) -> logging.LogRecord:
+    return logging.LogRecord("test", level, __file__, 1, message, args, None)
+
+
+def test_json_formatter_marks_request():
+    record = _record("Total posts in %s: %i", logging.INFO, "группа", 10)
+    token = request_id.set("abc")
+    try:
+        RequestIdFilter().filter(record)
+    finally:
+        request_id.reset(token)
+
+    entry = json.loads(JSONFormatter().format(record))
+
+    assert entry["level"] == "INFO"
+    assert entry["request_id"] == "abc"
+    assert entry["message"] == "Total posts in группа: 10"
+
+
+def test_sampling_filter_passes_one_of_rate():
+    sampling = SamplingFilter(rate=10)
+
+    passed = [sampling.filter(_record("(offset %i) Start")) for _ in range(25)]
+    warnings = [sampling.filter(_record("Partial", logging.WARNING)) for _ in range(3)]
+
+    assert passed.count(True) == 3
+    assert all(warnings)
@@ -0,0 +1,54 @@
+import pytest
+
+from core.metrics import Registry
+
+
+def test_counter_exposition():
+    registry = Registry()
+    errors = registry.counter("errors_total", "Errors.", ("method", "code"))
+
+    errors.inc(("execute", 6))
+    errors.inc(("execute", 6), amount=2)
+    errors.inc(("wall.get", 'say "hi"'))
+
+    assert errors.value(("execute", 6)) == 3
+    assert registry.exposition() == (
+        "# HELP errors_total Errors.\n"
+        "# TYPE errors_total counter\n"
+        'errors_total{method="execute",code="6"} 3\n'
+        'errors_total{method="wall.get",code="say \\"hi\\""} 1\n'
+    )
+
+
+def test_histogram_exposition():
+    registry = Registry()
+    latency = registry.histogram("latency_seconds", "Latency.", buckets=(0.1, 1))
+
+    for value in (0.05, 0.1, 0.5, 3):
+        latency.observe(value)
+
+    assert latency.count() == 4
+    assert registry.exposition().splitlines()[2:] == [
+        'latency_seconds_bucket{le="0.1"} 2',
+        'latency_seconds_bucket{le="1.0"} 3',
+        'latency_seconds_bucket{le="+Inf"} 4',
+        "latency_seconds_sum 3.65",
+        "latency_seconds_count 4",
+    ]
+
+
+def test_gauge_is_read_on_scrape():
+    registry = Registry()
+    values = iter((0.25, 0.5))
+    registry.gauge("ratio", "Ratio.", lambda: next(values))
+
+    assert registry.exposition().endswith("ratio 0.25\n")
+    assert registry.exposition().endswith("ratio 0.5\n")
+
+
+def test_metric_names_are_unique():
+    registry = Registry()
+    registry.counter("requests_total", "Requests.")
+
+    with pytest.raises(ValueError):
+        registry.histogram("requests_total", "Requests.")
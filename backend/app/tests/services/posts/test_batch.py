@@ -0,0 +1,57 @@
+import pytest
+
+from core.config import settings
+from services.posts.batch import fetch_batch, wall_counts
+
+
+@pytest.mark.asyncio
+async def test_wall_counts_by_25_domains(vk_stub):
+    domains = [f"group{number}" for number in range(60)]
+    vk_stub.walls.update({domain: number for number, domain in enumerate(domains)})
+    vk_stub.unknown_domains = {"group7"}
+
+    counts = await wall_counts(domains)
+
+    assert vk_stub.calls["execute"] == 3
+    assert counts == {
+        domain: None if domain == "group7" else number
+        for number, domain in enumerate(domains)
+    }
+
+
+@pytest.mark.asyncio
+async def test_fetch_batch_merges_top(vk_stub):
+    vk_stub.walls.update({"first": 300, "second": 500})
+    vk_stub.unknown_domains = {"unknown"}
+
+    batch = await fetch_batch(
+        ["vk.com/first", "second", "unknown"], amount=5, sort_by_likes=True, top=7
+    )
+
+    first, second, unknown = batch["domains"]
+    assert vk_stub.calls["wall.get"] == 0
+    assert (first["domain"], first["total"], len(first["posts"])) == ("first", 300, 5)
+    assert (second["domain"], second["total"], len(second["posts"])) == (
+        "second",
+        500,
+        5,
+    )
+    assert unknown["error"] and unknown["posts"] == []
+    assert batch["top"] == sorted(
+        first["posts"] + second["posts"], key=lambda p: p["likes"], reverse=True
+    )[:7]
+
+
+@pytest.mark.asyncio
+async def test_fetch_batch_gives_no_posts_of_failed_domain(vk_stub, monkeypatch):
+    monkeypatch.setattr(settings, "VKAPI_EXECUTE_MAX_CALLS", 1)
+    monkeypatch.setattr(settings, "POSTS_PORTION_RETRIES", 0)
+    vk_stub.walls.update({"first": 300, "second": 1000})
+    vk_stub.broken_offsets = {650}
+
+    batch = await fetch_batch(["first", "second"], amount=5, sort_by_likes=True, top=7)
+
+    first, second = batch["domains"]
+    assert second["error"] and second["posts"] == []
+    assert len(first["posts"]) == 5
+    assert batch["top"] == first["posts"]
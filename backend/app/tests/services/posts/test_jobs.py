@@ -0,0 +1,151 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from services.posts.jobs import (
+    DONE,
+    FAILED,
+    PENDING,
+    RUNNING,
+    Job,
+    JobManager,
+    MemoryJobStore,
+    SQLiteJobStore,
+)
+from services.posts.post_fetcher import PostFetcher
+from services.posts.post_index import PostFilters
+
+
+async def wait_for(job_manager: JobManager, job_id: str) -> Job:
+    while (job := await job_manager.get(job_id)).status in (PENDING, RUNNING):
+        await asyncio.sleep(0.01)
+    return job
+
+
+async def progress_while_running(
+    job_manager: JobManager, job_id: str
+) -> tuple[int, int]:
+    """Progress of the job polled as soon as it has fetched some posts."""
+
+    while True:
+        job = await job_manager.get(job_id)
+        assert job.status in (PENDING, RUNNING)
+        if job.fetched:
+            return job.fetched, job.total
+        await asyncio.sleep(0.005)
+
+
+@pytest.fixture
+def slow_crawls(vk_stub, monkeypatch):
+    """Walls of 1000 posts fetched by 10 portions one by one."""
+    monkeypatch.setattr("core.config.settings.POSTS_FETCH_CONCURRENCY", 1)
+    monkeypatch.setattr("core.config.settings.VKAPI_EXECUTE_MAX_CALLS", 1)
+    vk_stub.latency = 0.02
+    vk_stub.walls["group"] = 1000
+    return vk_stub
+
+
+@pytest.mark.asyncio
+async def test_job_fetches_posts(vk_stub):
+    vk_stub.walls["group"] = 3000
+    job_manager = JobManager(MemoryJobStore(), concurrency=1, ttl=60)
+
+    job = await job_manager.start(PostFetcher("group", 10, sort_by_likes=True))
+    job = await wait_for(job_manager, job.id)
+
+    items = vk_stub.wall_get("group", 0, 3000)["items"]
+    items.sort(key=lambda p: p["likes"]["count"], reverse=True)
+    posts = json.loads(await job_manager.get_result(job.id))
+    assert (job.status, job.fetched, job.total) == (DONE, 3000, 3000)
+    assert [post["likes"] for post in posts] == [
+        p["likes"]["count"] for p in items[:10]
+    ]
+    await job_manager.close()
+
+
+@pytest.mark.asyncio
+async def test_job_tells_progress_of_joined_crawl(slow_crawls):
+    job_manager = JobManager(MemoryJobStore(), concurrency=1, ttl=60)
+    request = asyncio.create_task(
+        PostFetcher("group", 10, sort_by_likes=True).fetch_posts()
+    )
+    await asyncio.sleep(0)
+
+    job = await job_manager.start(PostFetcher("group", 10, sort_by_likes=True))
+    fetched, total = await progress_while_running(job_manager, job.id)
+    job = await wait_for(job_manager, job.id)
+    await request
+
+    assert 0 < fetched < 1000 and total == 1000
+    assert (job.status, job.fetched, job.total) == (DONE, 1000, 1000)
+    assert slow_crawls.calls["execute"] == 10
+    await job_manager.close()
+
+
+@pytest.mark.asyncio
+async def test_job_with_filters_tells_progress(slow_crawls):
+    job_manager = JobManager(MemoryJobStore(), concurrency=1, ttl=60)
+    post_fetcher = PostFetcher(
+        "group", 10, sort_by_likes=True, filters=PostFilters(min_likes=500)
+    )
+
+    job = await job_manager.start(post_fetcher)
+    fetched, total = await progress_while_running(job_manager, job.id)
+    job = await wait_for(job_manager, job.id)
+
+    assert 0 < fetched < 1000 and total == 1000
+    assert (job.status, job.fetched, job.total) == (DONE, 1000, 1000)
+    await job_manager.close()
+
+
+@pytest.mark.asyncio
+async def test_jobs_are_limited(vk_stub):
+    vk_stub.latency = 0.05
+    job_manager = JobManager(MemoryJobStore(), concurrency=1, ttl=60)
+
+    first = await job_manager.start(PostFetcher("first", 10, sort_by_likes=True))
+    second = await job_manager.start(PostFetcher("second", 10, sort_by_likes=True))
+    await asyncio.sleep(0.02)
+
+    assert (await job_manager.get(first.id)).status == RUNNING
+    assert (await job_manager.get(second.id)).status == PENDING
+    assert (await wait_for(job_manager, second.id)).status == DONE
+    await job_manager.close()
+
+
+@pytest.mark.asyncio
+async def test_job_fails_with_error_of_crawl(vk_stub, monkeypatch):
+    vk_stub.broken_offsets = {0}
+    monkeypatch.setattr("core.config.settings.POSTS_PORTION_RETRIES", 0)
+    job_manager = JobManager(MemoryJobStore(), concurrency=1, ttl=60)
+
+    job = await job_manager.start(PostFetcher("group", 10, sort_by_likes=True))
+    job = await wait_for(job_manager, job.id)
+
+    assert (job.status, job.error_status) == (FAILED, 503)
+    assert await job_manager.get_result(job.id) is None
+    await job_manager.close()
+
+
+def test_sqlite_store_keeps_jobs(tmp_path, monkeypatch):
+    path = str(tmp_path / "jobs.sqlite3")
+    store = SQLiteJobStore(path)
+    done = Job("done", "group", 10, True, status=DONE, finished_at=time.time())
+    store.save(done, b"[]")
+    store.save(Job("running", "group", 10, True, status=RUNNING))
+    store.close()
+
+    # Jobs that were running when the application stopped fail.
+    store = SQLiteJobStore(path)
+    assert store.get("done") == done
+    assert store.get_result("done") == b"[]"
+    assert (store.get("running").status, store.get("running").error_status) == (
+        FAILED,
+        503,
+    )
+
+    store.delete_finished_before(time.time() + 1)
+    assert store.get("done") is None
+    store.close()
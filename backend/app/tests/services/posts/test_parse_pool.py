@@ -0,0 +1,52 @@
+import json
+
+import pytest
+
+from benchmarks.vk_stub import VKStub, as_columns
+from core.config import settings
+from services.posts import parse_pool
+from services.posts.normalization import compact_items, normalize_posts
+from services.posts.post_fetcher import PostFetcher
+
+
+@pytest.fixture
+def parse_workers(monkeypatch):
+    monkeypatch.setattr(settings, "POSTS_PARSE_WORKERS", 2)
+    monkeypatch.setattr(settings, "POSTS_PARSE_MIN_BYTES", 0)
+    yield
+    parse_pool.close_parse_pool()
+
+
+def test_compact_items_keep_normalized_posts():
+    items = VKStub(total_posts=20, attachments=3).wall_get("group", 0, 20)["items"]
+    items[0]["is_pinned"] = 1
+    items[1]["attachments"].append({"type": "photo", "photo": {}})
+    del items[2]["text"]
+
+    compact = compact_items(items)
+
+    assert normalize_posts(compact) == normalize_posts(items)
+    assert compact[0]["is_pinned"] == 1
+    assert len(json.dumps(compact)) < len(json.dumps(items)) / 2
+
+
+def test_decode_portion_restores_columns():
+    items = VKStub(total_posts=5).wall_get("group", 0, 5)["items"]
+    body = json.dumps({"response": as_columns(5, items)}).encode()
+
+    data = parse_pool.decode_portion(body)
+
+    assert data["response"]["count"] == 5
+    assert normalize_posts(data["response"]["items"]) == normalize_posts(items)
+
+
+@pytest.mark.asyncio
+async def test_fetch_posts_parses_in_pool(vk_stub, parse_workers):
+    vk_stub.walls["group"] = 3000
+
+    post_fetcher = PostFetcher("group", 0, sort_by_likes=False)
+    await post_fetcher.fetch_posts()
+
+    items = vk_stub.wall_get("group", 0, 3000)["items"]
+    assert parse_pool.get_parse_pool() is not None
+    assert post_fetcher.posts == normalize_posts(items)
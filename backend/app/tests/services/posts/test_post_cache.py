@@ -0,0 +1,219 @@
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from benchmarks.vk_stub import VKStub
+from core.config import settings
+from services.posts.normalization import PostData, post_date
+from services.posts.post_cache import PHOTOS, VIDEOS, PostCache
+from services.posts.post_fetcher import PostFetcher
+
+
+def fake_post(post_id: int, likes: int, text: str = "text") -> PostData:
+    return {
+        "date": post_date(1_600_000_000 + post_id),
+        "likes": likes,
+        "text": text,
+        "path": f"wall-1_{post_id}",
+        "photos": [],
+        "videos": [],
+    }
+
+
+def expected_top(stub: VKStub, domain: str, amount: int) -> list[str]:
+    posts = stub.wall_get(domain, 0, stub.wall_size(domain))["items"]
+    posts.sort(key=lambda p: p["likes"]["count"], reverse=True)
+    return [f"wall{p['owner_id']}_{p['id']}" for p in posts[:amount]]
+
+
+def test_post_cache_orders_posts(posts_cache: PostCache):
+    posts_cache.store_posts(
+        "group", [fake_post(1, 10), fake_post(2, 30), fake_post(3, 20)]
+    )
+    posts_cache.finish_refresh("group", total=3, newest_id=3)
+
+    by_likes = posts_cache.get_posts("group", 2, sort_by_likes=True)
+    by_date = posts_cache.get_posts("group", 0, sort_by_likes=False)
+
+    assert [p["likes"] for p in by_likes] == [30, 20]
+    assert [p["path"] for p in by_date] == ["wall-1_3", "wall-1_2", "wall-1_1"]
+    assert by_date[0] == fake_post(3, 20)
+
+
+def test_post_cache_reads_only_most_liked_posts(posts_cache: PostCache):
+    plan = posts_cache._connection.execute(
+        "EXPLAIN QUERY PLAN SELECT date, data FROM posts WHERE domain = ? "
+        "ORDER BY likes DESC, id DESC LIMIT 10",
+        ("group",),
+    ).fetchall()
+
+    details = " ".join(row[-1] for row in plan)
+    assert "posts_by_likes" in details
+    assert "TEMP B-TREE" not in details
+
+
+def test_post_cache_deletes_missing_posts(posts_cache: PostCache):
+    posts_cache.store_posts("group", [fake_post(i, i) for i in range(1, 6)])
+
+    posts_cache.delete_missing_posts("group", since_id=3, ids={3, 5})
+
+    posts = posts_cache.get_posts("group", 0, sort_by_likes=False)
+    assert [p["path"] for p in posts] == [f"wall-1_{i}" for i in (5, 3, 2, 1)]
+
+
+def test_post_cache_evicts_least_recently_used(tmp_path):
+    posts = [fake_post(i, i, text="x" * 1000) for i in range(10)]
+    posts_cache = PostCache(str(tmp_path / "cache.sqlite3"), max_bytes=25_000, ttl=60)
+
+    for domain in ("first", "second"):
+        posts_cache.store_posts(domain, posts)
+        posts_cache.finish_refresh(domain, total=10, newest_id=9)
+    posts_cache.get_posts("first", 1, sort_by_likes=True)
+    posts_cache.store_posts("third", posts)
+    posts_cache.finish_refresh("third", total=10, newest_id=9)
+
+    assert posts_cache.get_domain("first") is not None
+    assert posts_cache.get_domain("second") is None
+    assert posts_cache.get_domain("third") is not None
+    assert posts_cache.stats() == {"hits": 2, "misses": 1, "hit_ratio": 2 / 3}
+
+
+def test_post_cache_expires_domains(tmp_path, monkeypatch):
+    posts_cache = PostCache(str(tmp_path / "cache.sqlite3"), max_bytes=10**9, ttl=60)
+    posts_cache.store_posts("group", [fake_post(1, 1)])
+    posts_cache.finish_refresh("group", total=1, newest_id=1)
+
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+
+    assert posts_cache.get_domain("group") is None
+    posts_cache.evict()
+    assert posts_cache.get_posts("group", 0, sort_by_likes=False) == []
+
+
+def test_post_cache_tracks_velocity_of_likes(posts_cache: PostCache, monkeypatch):
+    # Posts were published 10 hours ago.
+    now = 1_600_000_000 + 10 * 3600
+    monkeypatch.setattr(time, "time", lambda: now)
+    posts_cache.store_posts(
+        "group", [fake_post(1, 100), fake_post(2, 50), fake_post(3, 200)]
+    )
+    posts_cache.finish_refresh("group", total=3, newest_id=3)
+
+    now += 3600
+    posts_cache.store_posts(
+        "group", [fake_post(1, 250), fake_post(2, 60), fake_post(3, 200)]
+    )
+
+    by_velocity = posts_cache.get_posts("group", 0, False, trending="velocity")
+    by_age = posts_cache.get_posts("group", 0, False, trending="age")
+    assert [p["likes"] for p in by_velocity] == [250, 200, 60]
+    assert [p["likes"] for p in by_age] == [250, 200, 60]
+    # Only changes of likes are kept.
+    assert posts_cache.snapshots("group", 1) == [(now - 3600, 100), (now, 250)]
+    assert posts_cache.snapshots("group", 3) == [(now - 3600, 200)]
+
+    posts_cache.stop_tracking("group", before_id=2)
+    by_velocity = posts_cache.get_posts("group", 0, False, trending="velocity")
+    assert [p["likes"] for p in by_velocity] == [200, 60, 250]
+
+
+def test_post_cache_compacts_snapshots(posts_cache: PostCache, monkeypatch):
+    start = 1_600_002_000  # An hour starts here.
+    now = start
+    monkeypatch.setattr(time, "time", lambda: now)
+    for minutes, likes in ((0, 1), (10, 2), (20, 3), (70, 4)):
+        now = start + minutes * 60
+        posts_cache.store_posts("group", [fake_post(1, likes)])
+
+    now = start + 2 * 24 * 3600
+    posts_cache.finish_refresh("group", total=1, newest_id=1)
+    assert posts_cache.snapshots("group", 1) == [
+        (start + 20 * 60, 3),
+        (start + 70 * 60, 4),
+    ]
+
+    now = start + settings.POSTS_SNAPSHOTS_TTL + 30 * 60
+    posts_cache.finish_refresh("group", total=1, newest_id=1)
+    assert posts_cache.snapshots("group", 1) == [(start + 70 * 60, 4)]
+
+
+@pytest.mark.asyncio
+async def test_fetch_posts_refreshes_cache_incrementally(vk_stub, monkeypatch):
+    monkeypatch.setattr(settings, "POSTS_CACHE_FRESH_FOR", 0)
+    monkeypatch.setattr(settings, "POSTS_CACHE_REFRESH_WINDOW", 500)
+    vk_stub.walls["group"] = 3000
+
+    post_fetcher = PostFetcher("group", 10, sort_by_likes=True)
+    await post_fetcher.fetch_posts()
+
+    assert vk_stub.calls["execute"] == 2
+    assert [p["path"] for p in post_fetcher.posts] == expected_top(vk_stub, "group", 10)
+
+    # 200 new posts and the window of 500 recent posts are fetched again.
+    vk_stub.walls["group"] = 3200
+    vk_stub.calls.clear()
+    post_fetcher = PostFetcher("group", 10, sort_by_likes=True)
+    await post_fetcher.fetch_posts()
+
+    assert vk_stub.calls["execute"] == 1
+    assert [p["path"] for p in post_fetcher.posts] == expected_top(vk_stub, "group", 10)
+
+
+@pytest.mark.asyncio
+async def test_fetch_posts_uses_fresh_cache_without_vk(vk_stub, posts_cache):
+    post_fetcher = PostFetcher("group", 10, sort_by_likes=True)
+    await post_fetcher.fetch_posts()
+    vk_stub.calls.clear()
+
+    post_fetcher = PostFetcher("group", 10, sort_by_likes=True)
+    await post_fetcher.fetch_posts()
+
+    assert sum(vk_stub.calls.values()) == 0
+    assert posts_cache.stats()["hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_interrupted_crawl_is_resumed(vk_stub, monkeypatch):
+    monkeypatch.setattr(settings, "VKAPI_EXECUTE_MAX_CALLS", 1)
+    monkeypatch.setattr(settings, "VKAPI_BACKOFF_BASE", 0)
+    monkeypatch.setattr(settings, "POSTS_PORTION_RETRIES", 1)
+    vk_stub.walls["group"] = 1000
+    vk_stub.broken_offsets = {450}
+
+    with pytest.raises(HTTPException) as exc_info:
+        await PostFetcher("group", 0, sort_by_likes=False).fetch_posts()
+    assert exc_info.value.status_code == 503
+
+    post_fetcher = PostFetcher("group", 0, sort_by_likes=False, allow_partial=True)
+    await post_fetcher.fetch_posts()
+    assert post_fetcher.missing == [(400, 100)]
+    assert len(post_fetcher.posts) == 900
+
+    # Only 50 new posts and the failed portion (shifted by them) are fetched.
+    vk_stub.broken_offsets.clear()
+    vk_stub.walls["group"] = 1050
+    vk_stub.calls.clear()
+    post_fetcher = PostFetcher("group", 0, sort_by_likes=False)
+    await post_fetcher.fetch_posts()
+
+    assert vk_stub.calls["execute"] == 2
+    assert post_fetcher.missing == []
+    assert [p["path"] for p in post_fetcher.posts] == [
+        f"wall-1_{post_id}" for post_id in range(1050, 0, -1)
+    ]
+
+
+def test_post_cache_keeps_columns_for_index(posts_cache: PostCache):
+    posts = [fake_post(i, i * 10) for i in range(1, 4)]
+    posts[0]["photos"] = [{"url": "photo-url"}]
+    posts[2]["videos"] = [{"first_frame_url": "video-url"}]
+    posts_cache.store_posts("group", posts)
+
+    assert posts_cache.get_columns("group") == [
+        (1_600_000_001, 1, 10, PHOTOS),
+        (1_600_000_002, 2, 20, 0),
+        (1_600_000_003, 3, 30, VIDEOS),
+    ]
+    assert posts_cache.get_posts_by_ids("group", [3, 4, 1]) == [posts[2], posts[0]]
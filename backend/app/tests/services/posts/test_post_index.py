@@ -0,0 +1,101 @@
+import datetime
+import time
+
+import pytest
+
+from core.config import settings
+from services.posts import post_cache
+from services.posts.post_cache import post_id
+from services.posts.post_fetcher import PostFetcher
+from services.posts.post_index import PostFilters
+
+# Posts of the stub are a minute apart, the wall of 1000 posts
+# spans two days (UTC), the first one ends with post 693.
+MOMENT = datetime.datetime(2020, 9, 13, 23, 59, tzinfo=datetime.timezone.utc)
+
+
+async def _fetch(**kwargs) -> list[int]:
+    post_fetcher = PostFetcher("group", **kwargs)
+    await post_fetcher.fetch_posts()
+    return [post_id(post) for post in post_fetcher.posts]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("cached", [True, False])
+async def test_filters_are_answered_by_index(
+    vk_stub, post_indexes, monkeypatch, cached
+):
+    if not cached:
+        monkeypatch.setattr(settings, "POSTS_CACHE_PATH", "")
+        monkeypatch.setattr(post_cache, "_post_cache", None)
+    filters = PostFilters(until=MOMENT, min_likes=990)
+
+    by_likes = await _fetch(amount_to_fetch=3, sort_by_likes=True, filters=filters)
+    calls = vk_stub.calls.copy()
+    by_date = await _fetch(filters=filters)
+
+    assert vk_stub.calls == calls
+    assert len(post_indexes._indexes) == 1
+    # With cache only columns are indexed, the posts are read from it by ids.
+    index = post_indexes.get("group")
+    assert (index.posts is None) is cached
+    assert by_date == sorted(
+        (id_ for id_ in range(1, 693) if id_ * 7919 % 1000 >= 990), reverse=True
+    )
+    assert by_likes == sorted(by_date, key=lambda id_: id_ * 7919 % 1000)[:-4:-1]
+
+
+@pytest.mark.asyncio
+async def test_top_posts_per_day(vk_stub):
+    by_likes = await _fetch(
+        amount_to_fetch=2, sort_by_likes=True, filters=PostFilters(per="day")
+    )
+    by_date = await _fetch(amount_to_fetch=2, filters=PostFilters(per="day"))
+
+    assert by_likes == [
+        *sorted(range(694, 1001), key=lambda id_: id_ * 7919 % 1000)[:-3:-1],
+        *sorted(range(1, 694), key=lambda id_: id_ * 7919 % 1000)[:-3:-1],
+    ]
+    assert by_date == [1000, 999, 693, 692]
+
+
+@pytest.mark.asyncio
+async def test_posts_with_attachments(vk_stub):
+    vk_stub.total_posts, vk_stub.attachments = 10, 1
+
+    with_photos = await _fetch(filters=PostFilters(with_photos=True))
+    with_videos = await _fetch(filters=PostFilters(with_videos=True))
+
+    assert with_photos == list(range(10, 0, -1))
+    assert with_videos == []
+
+
+@pytest.mark.asyncio
+async def test_index_is_rebuilt_when_cache_changes(vk_stub, posts_cache):
+    filters = PostFilters(min_likes=995)
+    assert await _fetch(filters=filters) == [963, 642, 605, 321, 284]
+    vk_stub.calls.clear()
+
+    # Likes of a post change in cache (e.g. by a request without filters).
+    post = posts_cache.get_posts_by_ids("group", [1])[0]
+    posts_cache.store_posts("group", [{**post, "likes": 1000}])
+
+    assert await _fetch(filters=filters) == [963, 642, 605, 321, 284, 1]
+    assert sum(vk_stub.calls.values()) == 0
+
+
+@pytest.fixture
+def local_time_not_utc(monkeypatch):
+    monkeypatch.setenv("TZ", "UTC-10")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+@pytest.mark.asyncio
+async def test_naive_dates_of_filters_are_utc(vk_stub, local_time_not_utc):
+    naive = await _fetch(filters=PostFilters(until=MOMENT.replace(tzinfo=None)))
+    aware = await _fetch(filters=PostFilters(until=MOMENT))
+
+    assert naive == aware == list(range(692, 0, -1))
@@ -1,10 +1,18 @@
+import asyncio
 import datetime
+import json
 
 import pytest
 from fastapi import HTTPException
+from hypothesis import given
+from hypothesis.strategies import integers, lists
 
+from benchmarks.vk_stub import VKStub
+from core.config import settings
 from schemas import Post, PostPhoto, PostVideo
+from services.posts import post_cache
 from services.posts.post_fetcher import PostFetcher
+from services.posts.top_posts import TopPosts
 
 
 class MockAsyncResponse:
@@ -28,6 +36,9 @@ class MockAsyncResponse:
         self.count += 1
         return json_to_return
 
+    async def read(self):
+        return json.dumps(await self.json()).encode()
+
     async def __aexit__(self, exc_type, exc, tb):
         pass
 
@@ -69,67 +80,68 @@ async def test_set_total_posts_in_domain_bad_response(mocker):
         assert False
 
 
+FAKE_RESPONSE_POSTS = {
+    "response": {
+        "items": [
+            {
+                "id": "55123",
+                "owner_id": "44412",
+                "date": 1687996862,  # 2023-06-29 00:01:02 UTC.
+                "likes": {"count": 42},
+                "text": "text",
+                "path": "path",
+                "attachments": [
+                    {
+                        "type": "photo",
+                        "photo": {
+                            "sizes": [
+                                {"url": "photo-url"},
+                            ]
+                        },
+                    }
+                ],
+            },
+            {
+                "id": "1233",
+                "owner_id": "44412",
+                "date": 1687996862,  # 2023-06-29 00:01:02 UTC.
+                "likes": {"count": 444},
+                "text": "text",
+                "path": "path",
+                "attachments": [
+                    {
+                        "type": "video",
+                        "video": {
+                            "first_frame": [
+                                {"url": "video-url-1"},
+                            ]
+                        },
+                    },
+                    {
+                        "type": "video",
+                        "video": {
+                            "image": [
+                                {"url": "video-url-2"},
+                            ]
+                        },
+                    },
+                ],
+            },
+        ]
+    }
+}
+
+
 @pytest.mark.asyncio
 async def test_fetch_posts(mocker):
     # Fake responses.
     fake_total_posts_in_domain = 42
     fake_response_count = {"response": {"count": fake_total_posts_in_domain}}
 
-    fake_response_posts = {
-        "response": {
-            "items": [
-                {
-                    "id": "55123",
-                    "owner_id": "44412",
-                    "date": datetime.datetime(2023, 6, 29, 0, 1, 2),
-                    "likes": {"count": 42},
-                    "text": "text",
-                    "path": "path",
-                    "attachments": [
-                        {
-                            "type": "photo",
-                            "photo": {
-                                "sizes": [
-                                    {"url": "photo-url"},
-                                ]
-                            },
-                        }
-                    ],
-                },
-                {
-                    "id": "1233",
-                    "owner_id": "44412",
-                    "date": datetime.datetime(2023, 6, 29, 0, 1, 2),
-                    "likes": {"count": 444},
-                    "text": "text",
-                    "path": "path",
-                    "attachments": [
-                        {
-                            "type": "video",
-                            "video": {
-                                "first_frame": [
-                                    {"url": "video-url-1"},
-                                ]
-                            },
-                        },
-                        {
-                            "type": "video",
-                            "video": {
-                                "image": [
-                                    {"url": "video-url-2"},
-                                ]
-                            },
-                        },
-                    ],
-                },
-            ]
-        }
-    }
-
     # Expected result.
     expected_posts = [
         Post(
-            date=datetime.datetime(2023, 6, 29, 0, 1, 2),
+            date=datetime.datetime(2023, 6, 29, 0, 1, 2, tzinfo=datetime.timezone.utc),
             likes=42,
             text="text",
             path="wall44412_55123",
@@ -139,7 +151,7 @@ async def test_fetch_posts(mocker):
             videos=[],
         ),
         Post(
-            date=datetime.datetime(2023, 6, 29, 0, 1, 2),
+            date=datetime.datetime(2023, 6, 29, 0, 1, 2, tzinfo=datetime.timezone.utc),
             likes=444,
             text="text",
             path="wall44412_1233",
@@ -155,7 +167,7 @@ async def test_fetch_posts(mocker):
     post_fetcher = PostFetcher("vk_com/a_a_burlakov", amount_to_fetch)
 
     # Mocked asynchronous call.
-    resp = MockAsyncResponse((fake_response_count, fake_response_posts), status=200)
+    resp = MockAsyncResponse((fake_response_count, FAKE_RESPONSE_POSTS), status=200)
     mocker.patch("aiohttp.ClientSession.get", return_value=resp)
 
     # Starting fetching.
@@ -167,3 +179,87 @@ async def test_fetch_posts(mocker):
     assert post_fetcher._total_posts_in_domain == fake_total_posts_in_domain
     assert post_fetcher.posts == expected_posts
     assert post_fetcher.posts == post_fetcher._posts
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("cached", [True, False])
+async def test_fetch_posts_top_by_likes(mocker, monkeypatch, cached):
+    if not cached:
+        monkeypatch.setattr(settings, "POSTS_CACHE_PATH", "")
+        monkeypatch.setattr(post_cache, "_post_cache", None)
+    fake_response_count = {"response": {"count": 2}}
+    post_fetcher = PostFetcher("a_a_burlakov", amount_to_fetch=1, sort_by_likes=True)
+
+    resp = MockAsyncResponse((fake_response_count, FAKE_RESPONSE_POSTS), status=200)
+    mocker.patch("aiohttp.ClientSession.get", return_value=resp)
+    extend = mocker.spy(TopPosts, "extend")
+
+    await post_fetcher.fetch_posts()
+
+    assert [post["path"] for post in post_fetcher.posts] == ["wall44412_1233"]
+    # Cache selects the most liked posts by its index instead.
+    assert extend.called is not cached
+
+
+@given(lists(integers(min_value=0, max_value=20)), integers(min_value=1, max_value=30))
+def test_top_posts_as_sorting(likes, size):
+    posts_from_vk = [
+        {"id": position, "likes": {"count": count}}
+        for position, count in enumerate(likes)
+    ]
+    top_posts = TopPosts(size)
+    top_posts.extend(0, posts_from_vk[:5])
+    top_posts.extend(5, posts_from_vk[5:])
+
+    expected = sorted(posts_from_vk, key=lambda p: p["likes"]["count"], reverse=True)
+    assert top_posts.best() == expected[:size]
+
+
+@pytest.mark.asyncio
+async def test_fetch_posts_by_date_fetches_only_needed_posts(mocker):
+    fake_response_count = {"response": {"count": 100_000}}
+    post_fetcher = PostFetcher("a_a_burlakov", amount_to_fetch=500)
+
+    resp = MockAsyncResponse((fake_response_count, FAKE_RESPONSE_POSTS), status=200)
+    get = mocker.patch("aiohttp.ClientSession.get", return_value=resp)
+
+    await post_fetcher.fetch_posts()
+
+    assert get.call_count == 2
+    assert len(post_fetcher.posts) == 2
+
+
+@pytest.mark.asyncio
+async def test_stream_posts_slides_window_past_slow_portion(monkeypatch):
+    monkeypatch.setattr(settings, "POSTS_FETCH_CONCURRENCY", 2)
+    monkeypatch.setattr(settings, "VKAPI_EXECUTE_MAX_CALLS", 1)
+    stub = VKStub(total_posts=400)
+    slow_portion = asyncio.Event()
+    started = []
+
+    async def fetch_portion(self, portion):
+        offset, count = portion
+        started.append(offset)
+        if offset == 100:
+            await slow_portion.wait()
+        return offset, stub.wall_get("group", offset, count)["items"]
+
+    monkeypatch.setattr(PostFetcher, "_fetch_portion", fetch_portion)
+    portions = PostFetcher("group", known_total=400).stream_posts()
+
+    first = await anext(portions)
+    second = asyncio.ensure_future(anext(portions))
+    await asyncio.sleep(0.01)
+
+    # The portion after the slow one is fetched meanwhile,
+    # but portions are still given in order of the wall.
+    assert first[0]["path"] == "wall-1_400"
+    assert started == [0, 100, 200]
+    assert not second.done()
+
+    slow_portion.set()
+    assert (await second)[0]["path"] == "wall-1_300"
+    assert [posts[0]["path"] async for posts in portions] == [
+        "wall-1_200",
+        "wall-1_100",
+    ]
@@ -0,0 +1,86 @@
+import pytest
+
+from core.config import settings
+from services.posts.post_fetcher import PostFetcher
+from services.posts.prewarm import CountMinSketch, PopularDomains, Prewarmer
+
+
+def test_count_min_sketch_never_underestimates():
+    sketch = CountMinSketch(width=8, depth=2)
+    counts = {f"group{number}": number for number in range(20)}
+    for key, count in counts.items():
+        for _ in range(count):
+            sketch.add(key)
+
+    assert all(sketch.count(key) >= count for key, count in counts.items())
+
+
+def test_popular_domains_keep_the_most_requested():
+    popular = PopularDomains(size=2, decay_every=1000)
+    for domain, requests in (("first", 5), ("second", 3), ("third", 1)):
+        for _ in range(requests):
+            popular.record(domain)
+    assert popular.hottest() == ["first", "second"]
+
+    for _ in range(10):
+        popular.record("third")
+    assert popular.hottest() == ["third", "first"]
+
+
+def test_popular_domains_forget_old_requests():
+    popular = PopularDomains(size=1, decay_every=10)
+    for _ in range(9):
+        popular.record("old")
+    # Counts are halved on the 10th request.
+    for _ in range(6):
+        popular.record("new")
+
+    assert popular.hottest() == ["new"]
+
+
+@pytest.mark.asyncio
+async def test_prewarmer_refreshes_popular_domains(vk_stub, posts_cache, monkeypatch):
+    popular = PopularDomains(size=2)
+    for domain in ("first", "second", "second"):
+        popular.record(domain)
+    for domain in ("first", "second"):
+        await PostFetcher(domain, 10, sort_by_likes=True).fetch_posts()
+    refreshed_at = posts_cache.get_domain("second").refreshed_at
+    monkeypatch.setattr(settings, "POSTS_CACHE_FRESH_FOR", 0)
+    prewarmer = Prewarmer(popular, interval=30, quota_share=0.2)
+
+    calls = sum(vk_stub.calls.values())
+    # A request for the total and an execution for the whole wall.
+    await prewarmer.warm_up(budget=2)
+
+    # The budget is spent by the most popular domain.
+    assert sum(vk_stub.calls.values()) > calls
+    assert posts_cache.get_domain("second").refreshed_at > refreshed_at
+    assert posts_cache.get_domain("first").refreshed_at < refreshed_at
+
+
+@pytest.mark.asyncio
+async def test_prewarmer_stops_cold_crawl_at_budget(vk_stub, posts_cache, monkeypatch):
+    monkeypatch.setattr(settings, "VKAPI_EXECUTE_MAX_CALLS", 1)
+    monkeypatch.setattr(settings, "POSTS_FETCH_CONCURRENCY", 1)
+    vk_stub.walls["cold"] = 1000
+    popular = PopularDomains(size=1)
+    popular.record("cold")
+    prewarmer = Prewarmer(popular, interval=30, quota_share=0.2)
+
+    # A request for the total and 3 portions of 100 posts.
+    await prewarmer.warm_up(budget=4)
+
+    assert vk_stub.calls["execute"] == 3
+    assert prewarmer._requests == 4
+    assert posts_cache.get_domain("cold") is None
+    assert len(posts_cache.get_columns("cold")) == 300
+    # Requests of the pre-warmer aren't counted as requests of the domain.
+    assert popular._sketch.count("cold") == 1
+
+    # The crawl is resumed from the checkpoint by the next pre-warming.
+    vk_stub.calls.clear()
+    await prewarmer.warm_up(budget=100)
+
+    assert vk_stub.calls["execute"] == 7
+    assert posts_cache.get_domain("cold").total == 1000
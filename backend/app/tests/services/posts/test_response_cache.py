@@ -0,0 +1,25 @@
+import gzip
+
+from services.posts.response_cache import ResponseCache
+
+
+def test_response_cache_drops_least_recently_used():
+    responses = ResponseCache(max_bytes=250)
+    responses.put('"first"', b"1" * 100)
+    responses.put('"second"', b"2" * 100)
+    responses.get('"first"')
+    responses.put('"third"', b"3" * 100)
+
+    assert responses.get('"second"') is None
+    assert responses.get('"first"').body == b"1" * 100
+    assert responses.get('"third"') is not None
+
+
+def test_response_cache_compresses_once():
+    responses = ResponseCache(max_bytes=10_000)
+    cached = responses.put('"posts"', b"[]" * 1000)
+
+    gzipped = responses.encoded('"posts"', cached, "gzip")
+
+    assert gzip.decompress(gzipped) == cached.body
+    assert responses.encoded('"posts"', cached, "gzip") is gzipped
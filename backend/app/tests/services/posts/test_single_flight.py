@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+from services.posts.post_fetcher import PostFetcher
+from services.posts.single_flight import CrawlPlan, CrawlResult, SingleFlight
+
+
+@pytest.mark.parametrize(
+    "plan, other, covers",
+    [
+        (CrawlPlan(500, True), CrawlPlan(500, True), True),
+        (CrawlPlan(500, True), CrawlPlan(100, True), True),
+        (CrawlPlan(500, True), CrawlPlan(600, True), False),
+        (CrawlPlan(500, True), CrawlPlan(0, True), False),
+        (CrawlPlan(500, True), CrawlPlan(100, False), False),
+        (CrawlPlan(0, False), CrawlPlan(100, True), True),
+        (CrawlPlan(0, False), CrawlPlan(0, False), True),
+        (CrawlPlan(0, True), CrawlPlan(100, True), True),
+        (CrawlPlan(0, True), CrawlPlan(100, False), False),
+        (CrawlPlan(0, False, "velocity"), CrawlPlan(100, True, "velocity"), True),
+        (CrawlPlan(0, False), CrawlPlan(100, False, "age"), False),
+        (CrawlPlan(100, False, "age"), CrawlPlan(100, False, "velocity"), False),
+    ],
+)
+def test_crawl_plan_covers(plan, other, covers):
+    assert plan.covers(other) == covers
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_share_one_crawl(vk_stub, monkeypatch):
+    monkeypatch.setattr(vk_stub, "latency", 0.01)
+    vk_stub.walls["group"] = 2000
+
+    post_fetchers = [PostFetcher("vk.com/Group", 500, True) for _ in range(20)]
+    await asyncio.gather(*(p.fetch_posts() for p in post_fetchers))
+
+    assert vk_stub.calls == {"wall.get": 1, "execute": 1}
+    assert all(p.posts == post_fetchers[0].posts for p in post_fetchers)
+    assert len(post_fetchers[0].posts) == 500
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_get_their_own_views(vk_stub, monkeypatch):
+    monkeypatch.setattr(vk_stub, "latency", 0.01)
+    vk_stub.walls["group"] = 1200
+
+    leader = PostFetcher("group", 0, sort_by_likes=False)
+    followers = [
+        PostFetcher("group", 10, sort_by_likes=True),
+        PostFetcher("group", 0, sort_by_likes=True),
+    ]
+    await asyncio.gather(leader.fetch_posts(), *(p.fetch_posts() for p in followers))
+
+    by_likes = sorted(leader.posts, key=lambda p: p["likes"], reverse=True)
+    assert vk_stub.calls == {"wall.get": 1, "execute": 1}
+    assert len(leader.posts) == 1200
+    assert followers[0].posts == by_likes[:10]
+    assert followers[1].posts == by_likes
+
+
+@pytest.mark.asyncio
+async def test_crawl_is_cancelled_without_waiters():
+    single_flight = SingleFlight()
+    started = asyncio.Event()
+
+    async def crawl() -> CrawlResult:
+        started.set()
+        await asyncio.sleep(10)
+        return CrawlResult([])
+
+    request = asyncio.create_task(single_flight.run("group", CrawlPlan(1, True), crawl))
+    await started.wait()
+    request.cancel()
+    await asyncio.gather(request, return_exceptions=True)
+    await asyncio.sleep(0)
+
+    assert single_flight.in_flight("group") == 0
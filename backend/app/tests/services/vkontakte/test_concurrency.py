@@ -0,0 +1,116 @@
+import asyncio
+
+import pytest
+
+from services.vkontakte.concurrency import FairScheduler, bounded_map
+
+
+@pytest.mark.asyncio
+async def test_fair_scheduler_alternates_lanes():
+    scheduler = FairScheduler(limit=1)
+    order = []
+
+    async def request(lane: str, number: int) -> None:
+        async with scheduler.slot(lane):
+            order.append(f"{lane}{number}")
+            await asyncio.sleep(0)
+
+    await scheduler.acquire()
+    tasks = [asyncio.create_task(request("huge", i)) for i in range(3)]
+    tasks.append(asyncio.create_task(request("small", 0)))
+    await asyncio.sleep(0)
+    scheduler.release()
+    await asyncio.gather(*tasks)
+
+    assert order == ["huge0", "small0", "huge1", "huge2"]
+    assert scheduler.active == 0
+
+
+@pytest.mark.asyncio
+async def test_fair_scheduler_cancelled_waiter_frees_nothing():
+    scheduler = FairScheduler(limit=1)
+
+    await scheduler.acquire()
+    waiter = asyncio.create_task(scheduler.acquire("lane"))
+    await asyncio.sleep(0)
+    waiter.cancel()
+    await asyncio.gather(waiter, return_exceptions=True)
+    scheduler.release()
+
+    assert scheduler.active == 0
+    assert scheduler.waiting == 0
+
+
+@pytest.mark.asyncio
+async def test_bounded_map_limits_concurrency_and_takes_items_lazily():
+    limit = 3
+    running = 0
+    max_running = 0
+    taken = []
+
+    def items():
+        for i in range(20):
+            taken.append(i)
+            yield i
+
+    async def func(item: int) -> int:
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(0.001)
+        running -= 1
+        return item * 2
+
+    results = [result async for result in bounded_map(func, items(), limit)]
+
+    assert sorted(results) == [i * 2 for i in range(20)]
+    assert max_running == limit
+    assert len(taken) == 20
+
+
+@pytest.mark.asyncio
+async def test_bounded_map_adds_workers_as_items_come():
+    tasks_before = len(asyncio.all_tasks())
+    max_tasks = 0
+
+    async def func(item: int) -> int:
+        nonlocal max_tasks
+        max_tasks = max(max_tasks, len(asyncio.all_tasks()) - tasks_before)
+        await asyncio.sleep(0.001)
+        return item
+
+    results = [result async for result in bounded_map(func, iter(range(5)), 1000)]
+
+    assert sorted(results) == list(range(5))
+    # A worker for every item and the one that found no items left.
+    assert max_tasks <= 6
+
+
+@pytest.mark.asyncio
+async def test_bounded_map_stops_early():
+    started = []
+
+    async def func(item: int) -> int:
+        started.append(item)
+        await asyncio.sleep(0.001)
+        return item
+
+    results = bounded_map(func, range(1000), 2)
+    async for _ in results:
+        break
+    await results.aclose()
+
+    # Each of 2 workers could take one more item before being cancelled.
+    assert len(started) <= 4
+
+
+@pytest.mark.asyncio
+async def test_bounded_map_raises_errors():
+    async def func(item: int) -> int:
+        if item == 5:
+            raise ValueError(item)
+        return item
+
+    with pytest.raises(ValueError):
+        async for _ in bounded_map(func, range(10), 2):
+            pass
@@ -0,0 +1,35 @@
+import datetime
+import importlib
+import sys
+
+import pytest
+
+from services.vkontakte import json_codec
+
+VALUE = {
+    "date": datetime.datetime(2023, 6, 29, 0, 1, 2, tzinfo=datetime.timezone.utc),
+    "text": "Пост",
+    "likes": 42,
+}
+
+
+@pytest.fixture
+def stdlib_codec(monkeypatch):
+    monkeypatch.setitem(sys.modules, "orjson", None)
+    monkeypatch.setitem(sys.modules, "msgspec", None)
+    yield importlib.reload(json_codec)
+    monkeypatch.undo()
+    importlib.reload(json_codec)
+
+
+def test_json_codec_roundtrip():
+    decoded = json_codec.loads(json_codec.dumps(VALUE))
+
+    assert decoded == VALUE | {"date": "2023-06-29T00:01:02+00:00"}
+
+
+def test_json_codec_falls_back_to_stdlib(stdlib_codec):
+    decoded = stdlib_codec.loads(stdlib_codec.dumps(VALUE))
+
+    assert stdlib_codec.BACKEND == "json"
+    assert decoded == VALUE | {"date": "2023-06-29T00:01:02+00:00"}
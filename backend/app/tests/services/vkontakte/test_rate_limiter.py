@@ -0,0 +1,115 @@
+import random
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from fastapi import HTTPException
+
+from core.config import settings
+from services.vkontakte import token_pool
+from services.vkontakte.rate_limiter import RateLimiter
+from services.vkontakte.token_pool import TokenPool
+from services.vkontakte.vk_api import vk_asynchronous_request
+from tests.utils.clock import FakeClock
+
+
+def fake_rate_limiter(clock: FakeClock, rate: float = 3) -> RateLimiter:
+    return RateLimiter(
+        rate=rate,
+        capacity=rate,
+        clock=clock.time,
+        sleep=clock.sleep,
+        rng=random.Random(42),
+    )
+
+
+@pytest.fixture
+def clock(monkeypatch) -> FakeClock:
+    clock = FakeClock()
+    pool = TokenPool(
+        ["test-token"], clock=clock.time, sleep=clock.sleep, rng=random.Random(42)
+    )
+    monkeypatch.setattr(token_pool, "_pool", pool)
+    return clock
+
+
+async def start_stub_server(errors_before_success: int) -> tuple[TestServer, dict]:
+    """VK stub answering with error 6 for the first N calls."""
+
+    stats = {"calls": 0}
+
+    async def handler(request: web.Request) -> web.Response:
+        stats["calls"] += 1
+        if stats["calls"] <= errors_before_success:
+            return web.json_response(
+                {"error": {"error_code": 6, "error_msg": "Too many requests"}}
+            )
+        return web.json_response({"response": {"count": 42}})
+
+    app = web.Application()
+    app.router.add_get("/method/wall.get", handler)
+    server = TestServer(app)
+    await server.start_server()
+    return server, stats
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_keeps_rate():
+    clock = FakeClock()
+    limiter = fake_rate_limiter(clock, rate=3)
+
+    for _ in range(9):
+        await limiter.acquire()
+
+    # First 3 requests are a burst, next 6 requests need 2 seconds.
+    assert clock.now == pytest.approx(2)
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_refills_over_time():
+    clock = FakeClock()
+    limiter = fake_rate_limiter(clock, rate=3)
+
+    for _ in range(3):
+        await limiter.acquire()
+    clock.now += 10
+
+    assert limiter.tokens == 3
+
+
+def test_backoff_delay_is_exponential_and_capped():
+    limiter = fake_rate_limiter(FakeClock())
+
+    for attempt in range(20):
+        ceiling = min(
+            settings.VKAPI_BACKOFF_MAX, settings.VKAPI_BACKOFF_BASE * 2**attempt
+        )
+        assert 0 <= limiter.backoff_delay(attempt) <= ceiling
+
+
+@pytest.mark.asyncio
+async def test_request_retries_after_error_6(clock):
+    errors = 4
+    server, stats = await start_stub_server(errors_before_success=errors)
+
+    resp_json = await vk_asynchronous_request(
+        str(server.make_url("/method/wall.get")), {}
+    )
+    await server.close()
+
+    assert resp_json == {"response": {"count": 42}}
+    assert stats["calls"] == errors + 1
+    # Every retry waited for backoff, none was a busy retry.
+    assert len([delay for delay in clock.sleeps if delay > 0]) >= errors
+
+
+@pytest.mark.asyncio
+async def test_request_retries_are_capped(clock):
+    server, stats = await start_stub_server(errors_before_success=1000)
+
+    with pytest.raises(HTTPException) as exc_info:
+        await vk_asynchronous_request(str(server.make_url("/method/wall.get")), {})
+    await server.close()
+
+    assert exc_info.value.status_code == 503
+    assert stats["calls"] == settings.VKAPI_MAX_RETRIES + 1
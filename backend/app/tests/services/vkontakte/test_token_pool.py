@@ -0,0 +1,109 @@
+import random
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from services.vkontakte import token_pool
+from services.vkontakte.token_pool import TokenPool
+from services.vkontakte.vk_api import vk_asynchronous_request
+from tests.utils.clock import FakeClock
+
+
+def fake_token_pool(clock: FakeClock, tokens: list[str]) -> TokenPool:
+    return TokenPool(
+        tokens, rate=3, clock=clock.time, sleep=clock.sleep, rng=random.Random(42)
+    )
+
+
+@pytest.mark.asyncio
+async def test_token_pool_spreads_requests():
+    pool = fake_token_pool(FakeClock(), ["token-1", "token-2", "token-3"])
+
+    used = [(await pool.acquire()).value for _ in range(6)]
+
+    assert sorted(used) == [
+        "token-1",
+        "token-1",
+        "token-2",
+        "token-2",
+        "token-3",
+        "token-3",
+    ]
+
+
+@pytest.mark.parametrize("tokens_amount", [2, 3, 5])
+@pytest.mark.asyncio
+async def test_token_pool_throughput_scales_with_tokens(tokens_amount):
+    requests = 300
+
+    single_clock = FakeClock()
+    single_pool = fake_token_pool(single_clock, ["token"])
+    for _ in range(requests):
+        await single_pool.acquire()
+
+    clock = FakeClock()
+    pool = fake_token_pool(clock, [f"token-{i}" for i in range(tokens_amount)])
+    for _ in range(requests):
+        await pool.acquire()
+
+    assert clock.now == pytest.approx(single_clock.now / tokens_amount, rel=0.05)
+
+
+@pytest.mark.asyncio
+async def test_token_pool_quarantines_tokens():
+    clock = FakeClock()
+    pool = fake_token_pool(clock, ["token-1", "token-2"])
+
+    pool.report_error("token-1", 29)
+    used = {(await pool.acquire()).value for _ in range(4)}
+    usage = pool.usage()
+
+    assert used == {"token-2"}
+    assert usage["toke...en-1"]["errors"] == {29: 1}
+    assert usage["toke...en-1"]["quarantined"]
+    assert usage["toke...en-2"]["requests"] == 4
+
+
+@pytest.mark.asyncio
+async def test_token_pool_waits_for_quarantine_end():
+    clock = FakeClock()
+    pool = fake_token_pool(clock, ["token"])
+
+    pool.report_error("token", 5)
+    token = await pool.acquire()
+
+    assert token.value == "token"
+    assert clock.now >= 600
+
+
+@pytest.mark.asyncio
+async def test_request_switches_token_after_error(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(
+        token_pool, "_pool", fake_token_pool(clock, ["bad-token", "good-token"])
+    )
+    used_tokens = []
+
+    async def handler(request: web.Request) -> web.Response:
+        used_tokens.append(request.query["access_token"])
+        if request.query["access_token"] == "bad-token":
+            return web.json_response(
+                {"error": {"error_code": 5, "error_msg": "User authorization failed"}}
+            )
+        return web.json_response({"response": {"count": 42}})
+
+    app = web.Application()
+    app.router.add_get("/method/wall.get", handler)
+    server = TestServer(app)
+    await server.start_server()
+
+    for _ in range(3):
+        resp_json = await vk_asynchronous_request(
+            str(server.make_url("/method/wall.get")), {}
+        )
+        assert resp_json == {"response": {"count": 42}}
+    await server.close()
+
+    assert used_tokens.count("bad-token") == 1
+    assert used_tokens.count("good-token") == 3
@@ -0,0 +1,88 @@
+import pytest
+
+from benchmarks.vk_stub import VKStub, as_columns
+from services.posts.normalization import normalize_posts
+from services.posts.post_fetcher import PostFetcher
+from services.vkontakte.vk_script import ExecutePlanner, wall_items
+
+
+def test_execute_planner_plans_max_calls():
+    planner = ExecutePlanner(max_calls=25, max_bytes=10**9)
+
+    portions = list(planner.portions(0, 6000))
+
+    assert portions == [(0, 2500), (2500, 2500), (5000, 1000)]
+
+
+def test_execute_planner_fits_response_size():
+    planner = ExecutePlanner(max_calls=25, max_bytes=1_000_000)
+
+    planner.observe(posts=100, size=100_000)
+
+    # 80% of 1 MB fits 800 posts of 1 KB.
+    assert planner.calls_for(10_000) == 8
+
+
+def test_execute_planner_backs_off_and_grows_back():
+    planner = ExecutePlanner(max_calls=25, max_bytes=10**9)
+
+    planner.back_off()
+    planner.back_off()
+    assert planner.calls_for(10_000) == 6
+
+    planner.observe(posts=600, size=1000)
+    assert planner.calls_for(10_000) == 7
+
+
+@pytest.mark.asyncio
+async def test_fetch_posts_backs_off_on_too_big_responses(vk_stub, posts_cache):
+    vk_stub.walls["group"] = 5000
+    vk_stub.execute_max_posts = 1000
+
+    post_fetcher = PostFetcher("group", 0, sort_by_likes=False)
+    await post_fetcher.fetch_posts()
+
+    assert [p["path"] for p in post_fetcher.posts] == [
+        f"wall-1_{post_id}" for post_id in range(5000, 0, -1)
+    ]
+    assert post_fetcher._planner.calls < 25
+
+
+def test_wall_items_restores_posts_from_columns():
+    items = VKStub(total_posts=3, attachments=2).wall_get("group", 0, 3)["items"]
+    items[0]["is_pinned"] = 1
+
+    restored = wall_items(as_columns(3, items))
+
+    assert normalize_posts(restored) == normalize_posts(items)
+    assert [p.get("is_pinned") for p in restored] == [1, None, None]
+    assert wall_items({"count": 3, "items": items}) == items
+
+
+def test_wall_items_rejects_misaligned_columns():
+    items = VKStub(total_posts=3).wall_get("group", 0, 3)["items"]
+    columns = as_columns(3, items)
+    columns["texts"].pop()
+
+    assert wall_items(columns) is None
+
+
+@pytest.mark.asyncio
+async def test_fetch_posts_falls_back_to_whole_posts(vk_stub, monkeypatch):
+    execute = vk_stub.execute
+
+    def misaligned_execute(*args) -> dict:
+        response = execute(*args)
+        if "texts" in response:
+            response["texts"].pop()
+        return response
+
+    monkeypatch.setattr(vk_stub, "execute", misaligned_execute)
+    vk_stub.walls["group"] = 300
+
+    post_fetcher = PostFetcher("group", 200, sort_by_likes=False)
+    await post_fetcher.fetch_posts()
+
+    assert len(post_fetcher.posts) == 200
+    assert not post_fetcher._trim_fields
+    assert vk_stub.calls["execute"] == 2
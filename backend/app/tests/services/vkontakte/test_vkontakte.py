@@ -1,6 +1,9 @@
 import pytest
 from fastapi import HTTPException
 
+from core.config import settings
+from services.posts.post_fetcher import PostFetcher
+from services.vkontakte import vk_api
 from services.vkontakte.vk_api import VKError
 
 
@@ -73,3 +76,31 @@ async def test_vk_error_critical_100():
         assert exc.detail == f"Человек/сообщество с адресом {domain} не найдены."
     except Exception:
         assert False
+
+
+@pytest.mark.asyncio
+async def test_shared_session_is_reused():
+    session = await vk_api.open_session()
+
+    assert await vk_api.open_session() is session
+    async with vk_api._session_scope() as scoped_session:
+        assert scoped_session is session
+
+    await vk_api.close_session()
+
+    assert session.closed
+    assert vk_api._session is None
+
+
+@pytest.mark.asyncio
+async def test_fetch_posts_retries_too_many_requests(vk_stub, monkeypatch):
+    monkeypatch.setattr(settings, "VKAPI_BACKOFF_BASE", 0.001)
+    monkeypatch.setattr(settings, "VKAPI_EXECUTE_MAX_CALLS", 2)
+    vk_stub.walls["group"] = 3000
+    vk_stub.error_rate = 0.3
+
+    post_fetcher = PostFetcher("group", 0, sort_by_likes=False)
+    await post_fetcher.fetch_posts()
+
+    assert vk_stub.calls["error 6"] > 0
+    assert len(post_fetcher.posts) == 3000
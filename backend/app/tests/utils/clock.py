@@ -0,0 +1,13 @@
+class FakeClock:
+    """Clock that moves forward only when somebody sleeps."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def time(self) -> float:
+        return self.now
+
+    async def sleep(self, delay: float) -> None:
+        self.sleeps.append(delay)
+        self.now += max(delay, 0)